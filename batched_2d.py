@@ -0,0 +1,116 @@
+import numpy as np
+from projector_backend import create_backend
+
+
+class BatchedScanning2D:
+    """
+    This class reconstructs stacks of 2D phantoms scanned in the same 'fanflat_vec' geometry. With the 'cuda' backend
+    the N phantoms of a batch are stacked along a third axis and simulated and reconstructed by a single 3D projection
+    and SIRT3D_CUDA call, in which every slice sees a copy of the 2D geometry through a one-row detector placed at its
+    own height, so the slices stay independent. The 'cpu' and 'sparse' backends project the whole stack natively,
+    sharing the ray weights (or the system matrix) of the geometry between the slices.
+    Attributes
+    ----------
+    batch_size  : int
+        Number of phantoms processed by each 3D call;
+    Methods
+    -------
+    run(phantoms, rec_algorithm_param='SIRT_CUDA', n_iterations_param=100)
+        It executes the reconstruction of every phantom of the stack.
+    """
+
+    def __init__(self, backend, proj_geom, vol_geom, batch_size=64):
+        """
+        It creates a new instance of the class BatchedScanning2D.
+        :param backend: projector backend, 'cuda' (ASTRA Toolbox), 'cpu' or 'sparse' (see projector_backend.py);
+        :param proj_geom: 2D 'fanflat_vec' projection geometry;
+        :param vol_geom: 2D volume geometry;
+        :param batch_size: number of phantoms processed by each 3D call; larger batches trade latency for throughput.
+        """
+        self.backend_name = backend
+        self.proj_geom = proj_geom
+        self.vol_geom = vol_geom
+        self.batch_size = batch_size
+        self.backends = {}
+
+    def _backend(self, n_slices):
+        if self.backend_name != 'cuda':
+            n_slices = 0
+        if n_slices not in self.backends:
+            if n_slices:
+                self.backends[n_slices] = create_backend(self.backend_name, stacked_proj_geom(self.proj_geom, n_slices),
+                                                         stacked_vol_geom(self.vol_geom, n_slices))
+            else:
+                self.backends[n_slices] = create_backend(self.backend_name, self.proj_geom, self.vol_geom)
+        return self.backends[n_slices]
+
+    def run(self, phantoms, rec_algorithm_param='SIRT_CUDA', n_iterations_param=100):
+        """
+        It executes the reconstruction of every phantom of the stack, batch_size phantoms at a time.
+        :param phantoms: array of shape (N, rows, cols) with the 2D phantoms;
+        :param rec_algorithm_param: reconstruction algorithm to be used; only SIRT is available for stacks;
+        :param n_iterations_param: number of SIRT iterations;
+        :return: a dictionary containing the N reconstructed images into 'rec' index, the total reconstruction time into
+        'time' index, and the N sinograms into the 'sino' index;
+        """
+        if 'SIRT' not in rec_algorithm_param.upper():
+            raise ValueError("Batched reconstruction requires a SIRT algorithm, got '{}'".format(rec_algorithm_param))
+        algorithm = 'SIRT3D_CUDA' if self.backend_name == 'cuda' else rec_algorithm_param
+
+        phantoms = np.asarray(phantoms, dtype=np.float32)
+        n, n_proj = phantoms.shape[0], np.asarray(self.proj_geom['Vectors']).shape[0]
+        rec = np.empty(phantoms.shape, dtype=np.float32)
+        sino = np.empty((n, n_proj, self.proj_geom['DetectorCount']), dtype=np.float32)
+        elapsed_time = 0
+
+        sessions = {}
+        try:
+            for start in range(0, n, self.batch_size):
+                stop = min(start + self.batch_size, n)
+                if stop - start not in sessions:
+                    sessions[stop - start] = self._backend(stop - start).session(algorithm, n_iterations_param)
+                out = sessions[stop - start].run(phantoms[start:stop])
+                rec[start:stop] = out['rec']
+                sino[start:stop] = np.reshape(out['sino'], (stop - start, n_proj, -1))
+                elapsed_time += out['time']
+        finally:
+            for session in sessions.values():
+                session.close()
+
+        return {'rec': rec, 'time': elapsed_time, 'sino': sino}
+
+
+def stacked_proj_geom(proj_geom, n_slices):
+    """
+    It repeats a 2D 'fanflat_vec' geometry for each of n_slices stacked slices as a 'cone_vec' geometry with a single
+    detector row. The projections of slice k occupy rows k * P ... k * P + P - 1 of the 3D sinogram. The y axis is
+    mirrored because ASTRA stores the highest y in the first row of 2D volumes and the lowest y in 3D volumes.
+    :param proj_geom: 2D 'fanflat_vec' projection geometry with P projections;
+    :param n_slices: number of stacked slices;
+    :return: the 'cone_vec' projection geometry.
+    """
+    vectors = np.asarray(proj_geom['Vectors'], dtype=np.float64)
+    n_proj = vectors.shape[0]
+    z = np.repeat(np.arange(n_slices) - n_slices / 2 + 0.5, n_proj)
+    tiled = np.tile(vectors, (n_slices, 1))
+    zeros, ones = np.zeros_like(z), np.ones_like(z)
+
+    stacked = np.column_stack((tiled[:, 0], -tiled[:, 1], z, tiled[:, 2], -tiled[:, 3], z,
+                               tiled[:, 4], -tiled[:, 5], zeros, zeros, zeros, ones))
+    return {'type': 'cone_vec', 'DetectorRowCount': 1, 'DetectorColCount': proj_geom['DetectorCount'],
+            'Vectors': stacked}
+
+
+def stacked_vol_geom(vol_geom, n_slices):
+    """
+    It builds the 3D volume geometry holding n_slices stacked copies of a 2D volume geometry (see stacked_proj_geom).
+    :param vol_geom: 2D volume geometry;
+    :param n_slices: number of stacked slices;
+    :return: the 3D volume geometry.
+    """
+    rows, cols = vol_geom['GridRowCount'], vol_geom['GridColCount']
+    option = vol_geom.get('option', {})
+    return {'GridRowCount': rows, 'GridColCount': cols, 'GridSliceCount': n_slices,
+            'option': {'WindowMinX': option.get('WindowMinX', -cols / 2), 'WindowMaxX': option.get('WindowMaxX', cols / 2),
+                       'WindowMinY': -option.get('WindowMaxY', rows / 2), 'WindowMaxY': -option.get('WindowMinY', -rows / 2),
+                       'WindowMinZ': -n_slices / 2, 'WindowMaxZ': n_slices / 2}}
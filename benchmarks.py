@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+HISTORY = os.path.join('benchmarks', 'history.jsonl')
+
+# parameters of every case, from the smallest to the largest problem size
+CASES = {
+    'inline_2d': [dict(cells=519, projs=7, size=128), dict(cells=519, projs=30, size=128),
+                  dict(cells=1024, projs=30, size=256)],
+    'semi_circ_2d': [dict(projs=7, size=128), dict(projs=30, size=128), dict(projs=30, size=256)],
+    'inline_3d': [dict(cells=128, projs=4), dict(cells=256, projs=4), dict(cells=256, projs=10)],
+    'continuous_3d': [dict(cells=128, projs=10, size=(64, 64, 16)), dict(cells=256, projs=20, size=(128, 128, 32))],
+    'multiple_continuous_3d': [dict(cells=128, projs=5, views=2, size=(64, 64, 16)),
+                               dict(cells=256, projs=10, views=4, size=(128, 128, 32))],
+}
+
+
+def build(case, params):
+    """
+    It creates the scanning object of a benchmark case on the CPU backend.
+    :param case: name of the case (a key of CASES);
+    :param params: problem size of the case;
+    :return: the tuple (scanning object, backend used for the reconstruction).
+    """
+    if case == 'inline_2d':
+        from object_scan_inline_setup_2D import InlineScanningObject
+        scan = InlineScanningObject(alpha_param=60, n_cells_param=params['cells'], n_proj_param=params['projs'],
+                                    rec_size_param=params['size'], backend='cpu')
+    elif case == 'semi_circ_2d':
+        from object_scan_semi_circ_2D import CircularScanningObject
+        scan = CircularScanningObject(n_projs_param=params['projs'], src_dist_param=200, det_dist_param=100,
+                                      fan_beam_param=60, radius_param=250, rec_size_param=params['size'],
+                                      backend='cpu')
+    elif case == 'inline_3d':
+        from object_scan import ScanningObject
+        scan = ScanningObject(alpha_param=30, n_cells_param=params['cells'], n_proj_param=params['projs'],
+                              rec_size_param=128, backend='cpu')
+    elif case == 'continuous_3d':
+        from object_continuous_inline_scan_setup_3D import InlineContinuousScanningObject3D
+        scan = InlineContinuousScanningObject3D(alpha_param=50, n_cells_param=params['cells'],
+                                                n_proj_param=params['projs'], rec_size_param=params['size'],
+                                                backend='cpu')
+    elif case == 'multiple_continuous_3d':
+        from object_continuous_multiple_inline_scan_setup_3D import MultipleInlineContinuousScanningObject3D
+        scan = MultipleInlineContinuousScanningObject3D(views_param=params['views'], rec_size_param=params['size'],
+                                                        n_proj_param=params['projs'], cells=params['cells'],
+                                                        backend='cpu')
+    else:
+        raise ValueError("Unknown benchmark case '{}', expected one of {}".format(case, tuple(CASES)))
+    return scan, getattr(scan, 'rec_backend', scan.backend)
+
+
+def run_case(case, params, n_iterations=20, repeat=3):
+    """
+    It measures a benchmark case: the construction of the scanning object (geometry), the simulation of a phantom
+    (forward), its reconstruction (reconstruct) and the writing of the results (io). Every stage is repeated after a
+    warm-up run and the fastest time is kept.
+    :param case: name of the case (a key of CASES);
+    :param params: problem size of the case;
+    :param n_iterations: number of SIRT iterations of the reconstruction;
+    :param repeat: number of measurements of every stage;
+    :return: a dictionary with the stage times (s), the peak resident memory (MB) and the throughput.
+    """
+    from result_writer import ResultWriter
+
+    times = {'geometry': [], 'forward': [], 'reconstruct': [], 'io': []}
+    # warm-up: module imports and compilation of the Numba kernels are not part of the measurements
+    scan, backend = build(case, params)
+    with scan.session(n_iterations_param=1) as session:
+        session.run(np.zeros(backend.operator.vol_shape, dtype=np.float32))
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scan, backend = build(case, params)
+        times['geometry'].append(time.perf_counter() - start)
+
+    phantom = np.random.default_rng(0).random(backend.operator.vol_shape, dtype=np.float32)
+    folder = tempfile.mkdtemp()
+    try:
+        with scan.session(n_iterations_param=n_iterations) as session, ResultWriter() as writer:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                sinogram = session.forward(phantom)
+                times['forward'].append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                output = session.reconstruct(sinogram)
+                times['reconstruct'].append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                writer.write_volume(os.path.join(folder, 'rec.vol'), output['rec'], copy=False)
+                writer.write_volume(os.path.join(folder, 'sino.vol'), sinogram, copy=False)
+                writer.flush()
+                times['io'].append(time.perf_counter() - start)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    best = {stage: min(values) for stage, values in times.items()}
+    image_time = best['forward'] + best['reconstruct']
+    return {'times': best,
+            'peak_rss_mb': _peak_rss_mb(),
+            'images_per_s': 1 / image_time,
+            'voxels_per_s': phantom.size / image_time,
+            'iterations': output['iterations']}
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes on macOS and in kilobytes elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def _isolated(args):
+    return run_case(*args)
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(path=HISTORY):
+    """
+    It reads the benchmark history.
+    :param path: JSON Lines file written by main();
+    :return: the list of records, oldest first.
+    """
+    if not os.path.isfile(path):
+        return []
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the scanning setups on the CPU backend.')
+    parser.add_argument('--cases', nargs='*', default=list(CASES), choices=list(CASES))
+    parser.add_argument('--sizes', type=int, default=None, help='number of problem sizes per case (default: all)')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--history', default=HISTORY)
+    args = parser.parse_args(argv)
+
+    previous = {}
+    for record in read_history(args.history):
+        previous[(record['case'], json.dumps(record['params'], sort_keys=True), record['iterations_param'])] = record
+
+    context = multiprocessing.get_context('spawn')
+    commit, stamp = _commit(), time.strftime('%Y-%m-%dT%H:%M:%S')
+    records = []
+    for case in args.cases:
+        for params in CASES[case][:args.sizes]:
+            # every case runs in a fresh process so that its peak memory is not shared with the other cases
+            with context.Pool(1) as pool:
+                result = pool.apply(_isolated, ((case, params, args.iterations, args.repeat),))
+            record = dict(case=case, params=params, commit=commit, timestamp=stamp, iterations_param=args.iterations,
+                          machine=platform.node(), python=platform.python_version(), **result)
+            records.append(record)
+
+            last = previous.get((case, json.dumps(params, sort_keys=True), args.iterations))
+            change = ''
+            if last is not None:
+                change = ' ({:+.1f}% time vs {})'.format(100 * (last['images_per_s'] / result['images_per_s'] - 1),
+                                                    last['commit'])
+            print('{:24s} {:48s} {}  {:8.2f} images/s{}'.format(
+                case, json.dumps(params), '  '.join('{} {:.4f}s'.format(k, v) for k, v in result['times'].items()),
+                result['images_per_s'], change))
+
+    os.makedirs(os.path.dirname(args.history) or '.', exist_ok=True)
+    with open(args.history, 'a') as file:
+        for record in records:
+            file.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -74,7 +74,7 @@ if __name__ == '__main__':
 
 
     for folder in os.listdir(src):
-        plane = np.zeros((16, 32, 64))
+        plane = np.zeros((16, 32, 64), dtype=np.float32)
         for k in range(16):
             i = imread(src + folder + '\\' + 'slice_{:02d}.png'.format(k), pilmode='F')
             plane[k, :, :] = i
@@ -0,0 +1,433 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+class RayDrivenProjector:
+    """
+    This class implements a CPU forward and back projector for the 'fanflat_vec' and 'cone_vec' geometries produced by
+    InlineScanningSetup2D, InlineScanningSetup3D and SemiCircularConveyorBelt. The forward projection is ray-driven
+    (linear interpolation at equidistant samples along each ray, as in ASTRA) and the back projection is its exact
+    transpose, which scatters the rays into the volume with the same weights. Rays are processed in chunks to bound the
+    memory used by the intermediate arrays, on a pool of threads kept by the projector.
+    Attributes
+    ----------
+    vol_shape   : tuple
+        Shape of the volume arrays, (rows, cols) in 2D and (slices, rows, cols) in 3D, as in ASTRA;
+    sino_shape  : tuple
+        Shape of the sinogram arrays, (projections, cols) in 2D and (rows, projections, cols) in 3D, as in ASTRA;
+    Methods
+    -------
+    forward(volume)
+        Computes the sinogram of a volume (or of a stack of volumes along the leading axes).
+    backward(sinogram)
+        Computes the back projection of a sinogram (or of a stack of sinograms along the leading axes).
+    close()
+        Stops the threads of the projector.
+    """
+
+    def __init__(self, proj_geom, vol_geom, step=0.5, chunk_elements=2 ** 21, n_workers=None, use_numba=None,
+                 partial_bytes=2 ** 30):
+        """
+        It creates a new instance of the class RayDrivenProjector.
+        :param proj_geom: ASTRA projection geometry of type 'fanflat_vec' or 'cone_vec';
+        :param vol_geom: ASTRA volume geometry;
+        :param step: distance (in voxels) between consecutive samples along each ray;
+        :param chunk_elements: upper bound on the number of interpolation samples held in memory per chunk;
+        :param n_workers: number of threads used to process the chunks (default: all cores);
+        :param use_numba: uses the Numba kernels instead of NumPy (default: whenever Numba is installed);
+        :param partial_bytes: upper bound on the memory of the partial volumes of the NumPy back projection (see
+        backward()).
+        """
+        geom_type = proj_geom['type']
+        vectors = np.asarray(proj_geom['Vectors'], dtype=np.float64)
+        n_proj = vectors.shape[0]
+        option = vol_geom.get('option', {})
+
+        if geom_type == 'fanflat_vec':
+            self.ndim = 2
+            self.det_rows, self.det_cols = 1, int(proj_geom['DetectorCount'])
+            zeros = np.zeros(n_proj)
+            self.src = np.column_stack((vectors[:, 0], vectors[:, 1], zeros))
+            self.det = np.column_stack((vectors[:, 2], vectors[:, 3], zeros))
+            self.u = np.column_stack((vectors[:, 4], vectors[:, 5], zeros))
+            self.v = np.column_stack((zeros, zeros, np.ones(n_proj)))
+
+            rows, cols = vol_geom['GridRowCount'], vol_geom['GridColCount']
+            self.vol_shape = (rows, cols)
+            self.sino_shape = (n_proj, self.det_cols)
+            min_x, max_x = option.get('WindowMinX', -cols / 2), option.get('WindowMaxX', cols / 2)
+            min_y, max_y = option.get('WindowMinY', -rows / 2), option.get('WindowMaxY', rows / 2)
+            pixel_x, pixel_y = (max_x - min_x) / cols, (max_y - min_y) / rows
+            # ASTRA 2D volumes store the highest y in the first row
+            self.scale = np.array([1.0, -1.0 / pixel_y, 1.0 / pixel_x])
+            self.offset = np.array([0.0, max_y / pixel_y - 0.5, -min_x / pixel_x - 0.5])
+            self.voxel_size = pixel_x * pixel_y
+            self.grid = (1, rows, cols)
+        elif geom_type == 'cone_vec':
+            self.ndim = 3
+            self.det_rows, self.det_cols = int(proj_geom['DetectorRowCount']), int(proj_geom['DetectorColCount'])
+            self.src, self.det = vectors[:, 0:3], vectors[:, 3:6]
+            self.u, self.v = vectors[:, 6:9], vectors[:, 9:12]
+
+            rows, cols, slices = vol_geom['GridRowCount'], vol_geom['GridColCount'], vol_geom['GridSliceCount']
+            self.vol_shape = (slices, rows, cols)
+            self.sino_shape = (self.det_rows, n_proj, self.det_cols)
+            lower = np.array([option.get('WindowMinZ', -slices / 2), option.get('WindowMinY', -rows / 2),
+                              option.get('WindowMinX', -cols / 2)])
+            upper = np.array([option.get('WindowMaxZ', slices / 2), option.get('WindowMaxY', rows / 2),
+                              option.get('WindowMaxX', cols / 2)])
+            pixel = (upper - lower) / np.array(self.vol_shape)
+            self.scale = 1.0 / pixel
+            self.offset = -lower / pixel - 0.5
+            self.voxel_size = float(np.prod(pixel))
+            self.grid = self.vol_shape
+        else:
+            raise ValueError("Unsupported projection geometry '{}'".format(geom_type))
+
+        self.n_proj = n_proj
+        self.step = step
+        self.chunk_elements = chunk_elements
+        self.partial_bytes = partial_bytes
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.use_numba = NUMBA_AVAILABLE if use_numba is None else (use_numba and NUMBA_AVAILABLE)
+
+        # world (x, y, z) -> index (z, y, x) conversion used by both projectors
+        self._axes = np.array([2, 1, 0])
+        self._interp_axes = (1, 2) if self.ndim == 2 else (0, 1, 2)
+        self._n_samples = max(1, int(np.ceil(np.linalg.norm(self.grid) / step)) + 1)
+
+        normal = np.cross(self.u, self.v)
+        gram = np.stack((np.stack((np.sum(self.u * self.u, 1), np.sum(self.u * self.v, 1)), 1),
+                         np.stack((np.sum(self.u * self.v, 1), np.sum(self.v * self.v, 1)), 1)), 1)
+        self._normal = normal
+        self._inv_gram = np.linalg.inv(gram)
+        self._det_dist = np.sum((self.det - self.src) * normal, 1)
+
+    def _to_index(self, points):
+        return points[..., self._axes] * self.scale + self.offset
+
+    def _to_world(self, index):
+        world = (index - self.offset) / self.scale
+        return world[..., self._axes]
+
+    def _map_chunks(self, function, total, chunk):
+        bounds = [(start, min(start + chunk, total)) for start in range(0, total, chunk)]
+        if self.n_workers == 1 or len(bounds) == 1:
+            for b in bounds:
+                function(*b)
+        else:
+            # one pool per projector, created on first use and shared by the threads calling the projector
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.n_workers)
+                pool = self._pool
+            list(pool.map(lambda b: function(*b), bounds))
+
+    def close(self):
+        """
+        It stops the threads of the projector once their tasks are done; the projector remains usable and starts new
+        threads when it is called again.
+        """
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def _check_input(self, data, shape):
+        data = np.asarray(data)
+        if data.shape[data.ndim - len(shape):] != tuple(shape):
+            raise ValueError("Expected trailing shape {}, got {}".format(tuple(shape), data.shape))
+        batch = data.shape[:data.ndim - len(shape)]
+        return np.ascontiguousarray(data.reshape((-1,) + tuple(shape)), dtype=np.float32), batch
+
+    def forward(self, volume):
+        """
+        It simulates the acquisition of projections of a volume.
+        :param volume: array whose trailing axes match vol_shape; leading axes are treated as a stack of volumes that
+        share the geometry;
+        :return: float32 sinogram with the leading axes of volume followed by sino_shape.
+        """
+        volume, batch = self._check_input(volume, self.vol_shape)
+        n_rays = self.det_rows * self.n_proj * self.det_cols
+        out = np.zeros((volume.shape[0], n_rays), dtype=np.float32)
+
+        if self.use_numba:
+            # ranges of rays run by the threads of _map_chunks, as in backward(): the kernel releases the GIL, and no
+            # parallel Numba region is launched, which the workqueue threading layer does not support from several
+            # threads (e.g. the workers of dataset_runner.py and sweep.py)
+            def work(start, stop):
+                for b in range(volume.shape[0]):
+                    _forward_kernel(volume[b].reshape(self.grid), self.src, self.det, self.u, self.v, self.scale,
+                                    self.offset, self.det_rows, self.det_cols, self.step, self.ndim == 3, start, stop,
+                                    out[b])
+
+            self._map_chunks(work, n_rays, max(1, -(-n_rays // (4 * self.n_workers))))
+        else:
+            flat = volume.reshape(volume.shape[0], -1)
+            corners = 2 ** len(self._interp_axes)
+            chunk = max(1, self.chunk_elements // (self._n_samples * corners))
+
+            def work(start, stop):
+                index, weight = self._ray_weights(start, stop)
+                out[:, start:stop] = np.einsum('brk,rk->br', flat[:, index], weight)
+
+            self._map_chunks(work, n_rays, chunk)
+
+        return out.reshape(batch + self.sino_shape)
+
+    def _ray_weights(self, start, stop):
+        """
+        It computes, for rays start..stop in sinogram order, the flat voxel indices and weights of their interpolation
+        samples.
+        :return: two arrays of shape (rays, samples) with the voxel indices and the corresponding weights.
+        """
+        ray = np.arange(start, stop)
+        row, rest = np.divmod(ray, self.n_proj * self.det_cols)
+        proj, col = np.divmod(rest, self.det_cols)
+
+        src = self.src[proj]
+        pixel = (self.det[proj] + (col - self.det_cols / 2 + 0.5)[:, None] * self.u[proj] +
+                 (row - self.det_rows / 2 + 0.5)[:, None] * self.v[proj])
+        a, b = self._to_index(src), self._to_index(pixel)
+        direction = b - a
+        world_length = np.linalg.norm(pixel - src, axis=1)
+
+        t_min, t_max = _clip_to_grid(a, direction, np.array(self.grid, dtype=np.float64), self._interp_axes)
+        span = np.maximum(t_max - t_min, 0.0)
+        n = max(1, int(np.ceil(np.max(span * np.linalg.norm(direction, axis=1), initial=0.0) / self.step)))
+
+        t = t_min[:, None] + (np.arange(n) + 0.5)[None, :] / n * span[:, None]
+        samples = a[:, None, :] + t[..., None] * direction[:, None, :]
+        segment = (span * world_length / n)[:, None]
+
+        grid = np.array(self.grid)
+        base = np.floor(samples).astype(np.int64)
+        frac = samples - base
+        strides = np.array([self.grid[1] * self.grid[2], self.grid[2], 1])
+        if self.ndim == 2:
+            base[..., 0] = 0
+
+        indices, weights = [], []
+        for corner in range(2 ** len(self._interp_axes)):
+            index = base.copy()
+            weight = np.broadcast_to(segment, base.shape[:2]).copy()
+            for bit, axis in enumerate(self._interp_axes):
+                if (corner >> bit) & 1:
+                    index[..., axis] += 1
+                    weight *= frac[..., axis]
+                else:
+                    weight *= 1 - frac[..., axis]
+            valid = np.all((index >= 0) & (index < grid), axis=-1)
+            indices.append(np.where(valid, index @ strides, 0))
+            weights.append(np.where(valid, weight, 0.0).astype(np.float32))
+
+        return np.concatenate(indices, axis=1), np.concatenate(weights, axis=1)
+
+    def backward(self, sinogram):
+        """
+        It back projects a sinogram into the volume with the transpose of forward(): every ray scatters its value into
+        the voxels it samples, with the same weights, so that <forward(x), y> = <x, backward(y)> as SIRT and CGLS
+        assume. The Numba kernel splits the volume into slabs along its outer interpolated axis (slices in 3D, rows in
+        2D), one task per slab: every task traces all the rays but only scatters the samples falling into its own slab,
+        so the threads write disjoint voxels of a single output volume. The NumPy path splits the rays into parts, each
+        accumulating its own partial volume, with as many parts as threads as long as the partial volumes fit into
+        partial_bytes.
+        :param sinogram: array whose trailing axes match sino_shape; leading axes are treated as a stack of sinograms
+        that share the geometry;
+        :return: float32 volume with the leading axes of sinogram followed by vol_shape.
+        """
+        sinogram, batch = self._check_input(sinogram, self.sino_shape)
+        n_rays = self.det_rows * self.n_proj * self.det_cols
+        n_voxels = int(np.prod(self.grid))
+        n_batch = sinogram.shape[0]
+
+        if self.use_numba:
+            out = np.zeros((n_batch,) + self.grid, dtype=np.float32)
+            axis = 0 if self.ndim == 3 else 1
+
+            def work(low, high):
+                for b in range(n_batch):
+                    _backward_kernel(sinogram[b].reshape(-1), self.src, self.det, self.u, self.v, self.scale,
+                                     self.offset, self.det_rows, self.det_cols, self.step, self.ndim == 3, axis, low,
+                                     high, out[b])
+
+            # more slabs than threads, as the rays do not cross the slabs evenly
+            extent = self.grid[axis]
+            self._map_chunks(work, extent, max(1, -(-extent // (2 * self.n_workers))))
+            return out.reshape(batch + self.vol_shape)
+
+        n_parts = max(1, min(self.n_workers, self.partial_bytes // (4 * n_voxels * n_batch)))
+        partial = np.zeros((n_parts, n_batch, n_voxels), dtype=np.float32)
+        flat = sinogram.reshape(n_batch, -1)
+        corners = 2 ** len(self._interp_axes)
+        chunk = max(1, self.chunk_elements // (self._n_samples * corners))
+        # the parts are made of the chunks of forward(), whose rays share their number of samples
+        part_rays = -(-n_rays // (n_parts * chunk)) * chunk
+
+        def work(start, stop):
+            buffer = partial[start // part_rays]
+            for first in range(start, stop, chunk):
+                index, weight = self._ray_weights(first, min(first + chunk, stop))
+                for b in range(n_batch):
+                    np.add.at(buffer[b], index.ravel(), (flat[b, first:first + len(index), None] * weight).ravel())
+
+        self._map_chunks(work, n_rays, part_rays)
+        return partial.sum(axis=0).reshape(batch + self.vol_shape)
+
+
+def _clip_to_grid(origin, direction, grid, axes):
+    """
+    It intersects the lines origin + t * direction with the box [-0.5, grid - 0.5] along the given axes.
+    :return: the entry and exit parameters t_min and t_max of every line (t_max <= t_min when it misses the box).
+    """
+    t_min = np.full(origin.shape[0], -np.inf)
+    t_max = np.full(origin.shape[0], np.inf)
+    for axis in axes:
+        d = direction[:, axis]
+        lo, hi = -0.5 - origin[:, axis], grid[axis] - 0.5 - origin[:, axis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t1, t2 = lo / d, hi / d
+        parallel = d == 0
+        inside = (lo <= 0) & (hi >= 0)
+        enter = np.where(parallel, np.where(inside, -np.inf, np.inf), np.minimum(t1, t2))
+        leave = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2))
+        t_min = np.maximum(t_min, enter)
+        t_max = np.minimum(t_max, leave)
+    t_max = np.where(np.isfinite(t_min) & np.isfinite(t_max), t_max, t_min)
+    return np.where(np.isfinite(t_min), t_min, 0.0), np.where(np.isfinite(t_max), t_max, 0.0)
+
+
+if NUMBA_AVAILABLE:
+
+    @njit(fastmath=True, cache=True)
+    def _trace_ray(ray, src, det, u, v, scale, offset, det_rows, det_cols, step, interp_z, dims, a, d):
+        # index-space origin and direction of a ray, written into a and d, then its span inside the grid, number of
+        # samples and sample weight; shared by both kernels, so that the back projection is the transpose of the
+        # forward projection
+        n_proj = src.shape[0]
+        row = ray // (n_proj * det_cols)
+        proj = (ray // det_cols) % n_proj
+        col = ray % det_cols
+        cu = col - det_cols / 2 + 0.5
+        cv = row - det_rows / 2 + 0.5
+        length = 0.0
+        for i in range(3):
+            p = det[proj, i] + cu * u[proj, i] + cv * v[proj, i]
+            length += (p - src[proj, i]) ** 2
+            axis = 2 - i
+            a[axis] = src[proj, i] * scale[axis] + offset[axis]
+            d[axis] = p * scale[axis] + offset[axis] - a[axis]
+        length = length ** 0.5
+
+        t_min, t_max = -1e30, 1e30
+        for axis in range(3):
+            if axis == 0 and not interp_z:
+                continue
+            lo = -0.5 - a[axis]
+            hi = dims[axis] - 0.5 - a[axis]
+            if d[axis] == 0.0:
+                if lo > 0.0 or hi < 0.0:
+                    t_max = t_min
+                continue
+            t1, t2 = lo / d[axis], hi / d[axis]
+            t_min = max(t_min, min(t1, t2))
+            t_max = min(t_max, max(t1, t2))
+        if t_max <= t_min:
+            return 0.0, 0.0, 0, 0.0
+
+        span = t_max - t_min
+        n = max(1, int(np.ceil(span * (d[0] ** 2 + d[1] ** 2 + d[2] ** 2) ** 0.5 / step)))
+        return t_min, span, n, span * length / n
+
+    @njit(nogil=True, fastmath=True, cache=True)
+    def _forward_kernel(volume, src, det, u, v, scale, offset, det_rows, det_cols, step, interp_z, start, stop, out):
+        # rays start..stop, each one written by a single thread
+        nz, ny, nx = volume.shape
+        a, d = np.empty(3), np.empty(3)
+        for ray in range(start, stop):
+            t_min, span, n, weight = _trace_ray(ray, src, det, u, v, scale, offset, det_rows, det_cols, step, interp_z,
+                                                (nz, ny, nx), a, d)
+            total = 0.0
+            for k in range(n):
+                t = t_min + (k + 0.5) / n * span
+                z = a[0] + t * d[0] if interp_z else 0.0
+                y = a[1] + t * d[1]
+                x = a[2] + t * d[2]
+                z0, y0, x0 = int(np.floor(z)), int(np.floor(y)), int(np.floor(x))
+                fz, fy, fx = z - z0, y - y0, x - x0
+                for dz in range(2 if interp_z else 1):
+                    zi = z0 + dz
+                    if zi < 0 or zi >= nz:
+                        continue
+                    wz = (fz if dz else 1 - fz) if interp_z else 1.0
+                    for dy in range(2):
+                        yi = y0 + dy
+                        if yi < 0 or yi >= ny:
+                            continue
+                        wy = wz * (fy if dy else 1 - fy)
+                        for dx in range(2):
+                            xi = x0 + dx
+                            if xi < 0 or xi >= nx:
+                                continue
+                            total += wy * (fx if dx else 1 - fx) * volume[zi, yi, xi]
+            out[ray] = total * weight
+
+    @njit(nogil=True, fastmath=True, cache=True)
+    def _backward_kernel(sino, src, det, u, v, scale, offset, det_rows, det_cols, step, interp_z, axis, low, high, out):
+        # every ray scattered into the voxels low..high of the given axis of out, which no other thread writes; the
+        # samples are those of the whole ray, so the slabs add up to the transpose of _forward_kernel
+        nz, ny, nx = out.shape
+        lower = np.zeros(3, dtype=np.int64)
+        upper = np.array([nz, ny, nx], dtype=np.int64)
+        lower[axis], upper[axis] = low, high
+        a, d = np.empty(3), np.empty(3)
+        for ray in range(sino.shape[0]):
+            value = sino[ray]
+            if value == 0.0:
+                continue
+            t_min, span, n, weight = _trace_ray(ray, src, det, u, v, scale, offset, det_rows, det_cols, step, interp_z,
+                                                (nz, ny, nx), a, d)
+            if n == 0:
+                continue
+            value *= weight
+            # samples k whose coordinate along axis lies in [low - 1, high), with one sample of margin for rounding
+            first, last = 0, n
+            if d[axis] != 0.0:
+                k1 = ((low - 1 - a[axis]) / d[axis] - t_min) * n / span - 0.5
+                k2 = ((high - a[axis]) / d[axis] - t_min) * n / span - 0.5
+                first = max(0, int(np.floor(min(k1, k2))) - 1)
+                last = min(n, int(np.ceil(max(k1, k2))) + 2)
+            elif a[axis] < low - 1 or a[axis] >= high:
+                continue
+            for k in range(first, last):
+                t = t_min + (k + 0.5) / n * span
+                z = a[0] + t * d[0] if interp_z else 0.0
+                y = a[1] + t * d[1]
+                x = a[2] + t * d[2]
+                z0, y0, x0 = int(np.floor(z)), int(np.floor(y)), int(np.floor(x))
+                fz, fy, fx = z - z0, y - y0, x - x0
+                for dz in range(2 if interp_z else 1):
+                    zi = z0 + dz
+                    if zi < lower[0] or zi >= upper[0]:
+                        continue
+                    wz = (fz if dz else 1 - fz) if interp_z else 1.0
+                    for dy in range(2):
+                        yi = y0 + dy
+                        if yi < lower[1] or yi >= upper[1]:
+                            continue
+                        wy = wz * (fy if dy else 1 - fy)
+                        for dx in range(2):
+                            xi = x0 + dx
+                            if xi < lower[2] or xi >= upper[2]:
+                                continue
+                            out[zi, yi, xi] += value * wy * (fx if dx else 1 - fx)
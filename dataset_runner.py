@@ -0,0 +1,225 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from imageio import imread, imwrite
+from scipy.io import savemat
+from sample_store import open_store, write_index
+
+_local = threading.local()
+
+
+def _init_worker(setup_factory, rec_algorithm_param, n_iterations_param, sessions=None):
+    """
+    It builds the scanning object of a worker and opens the session reused for all the images the worker receives.
+    """
+    _local.session = setup_factory().session(rec_algorithm_param, n_iterations_param)
+    if sessions is not None:
+        sessions.append(_local.session)
+
+
+def _decode(path):
+    # the images are converted to float32 once, on the I/O threads, as the projectors require (see check_float32)
+    return np.ascontiguousarray(imread(path), dtype=np.float32)
+
+
+def _reconstruct(plane, key):
+    out = _local.session.run(plane)
+    # the sessions may return their own buffers, which the next image overwrites while this one is being written
+    return np.array(out[key]), out['time']
+
+
+def _reconstruct_rows(path, start, stop):
+    # the worker maps the packed store itself, so a batch is never copied to be sent to it
+    stores = _local.__dict__.setdefault('stores', {})
+    if path not in stores:
+        stores[path] = np.load(path, mmap_mode='r')
+    sinos, recs, times = [], [], []
+    for plane in stores[path][start:stop]:
+        out = _local.session.run(plane)
+        sinos.append(np.array(out['sino'], dtype=np.float32))
+        recs.append(np.array(out['rec'], dtype=np.float32))
+        times.append(out['time'])
+    return np.stack(sinos), np.stack(recs), times
+
+
+class DatasetRunner:
+    """
+    This class simulates and reconstructs every image of a dataset folder with a bounded producer/consumer pipeline:
+    images are decoded and results encoded by a thread pool while a pool of workers, each holding its own
+    reconstruction session, runs the projections and reconstructions. At most max_in_flight images are held in memory
+    at any time, and the results are handed to the writers in the order of the input file names.
+    Attributes
+    ----------
+    times       : list
+        Reconstruction time of each image of the last run, in input order;
+    Methods
+    -------
+    run(src, dest, save='image')
+        It processes every image of src and writes the reconstructions ('image') or sinograms ('sino') into dest.
+    run_packed(src, dest, batch=32)
+        It processes every sample of a packed store and writes the packed sinograms and reconstructions into dest.
+    save_setup(path, rec_size)
+        It writes the scanning geometry into a .mat file ('setup' save mode).
+    """
+
+    def __init__(self, setup_factory, rec_algorithm_param='SIRT_CUDA', n_iterations_param=100, workers=1,
+                 io_threads=4, max_in_flight=None, use_processes=False):
+        """
+        It creates a new instance of the class DatasetRunner.
+        :param setup_factory: picklable callable returning a scanning object (e.g. functools.partial(InlineScanningObject,
+        ...)); every worker calls it once;
+        :param rec_algorithm_param: reconstruction algorithm to be used;
+        :param n_iterations_param: number of iterations to be used in case of iterative reconstructions;
+        :param workers: number of projection/reconstruction workers;
+        :param io_threads: number of threads decoding and encoding images;
+        :param max_in_flight: maximum number of images between decoding and encoding, or of batches of run_packed()
+        (default: 4 per worker);
+        :param use_processes: runs the workers in processes instead of threads, which suits the CPU backend; the CUDA
+        backend should keep threads so that a single process owns the GPU.
+        """
+        self.setup_factory = setup_factory
+        self.rec_algorithm_param = rec_algorithm_param
+        self.n_iterations_param = n_iterations_param
+        self.workers = workers
+        self.io_threads = io_threads
+        self.max_in_flight = max_in_flight or 4 * workers
+        self.use_processes = use_processes
+        self.times = []
+
+    def save_setup(self, path, rec_size):
+        """
+        It writes the scanning geometry into a .mat file, as the 'setup' save mode of scan_dataset.py.
+        :param path: name of the .mat file;
+        :param rec_size: number W of pixels of the W x W reconstruction grid.
+        """
+        setup = self.setup_factory()
+        savemat(path, {"matrix": setup.setup.geometry_matrix, "det_size": setup.setup.det_size, "rec_size": rec_size})
+
+    def _compute_pool(self, sessions):
+        if self.use_processes:
+            return ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                       initargs=(self.setup_factory, self.rec_algorithm_param, self.n_iterations_param))
+        return ThreadPoolExecutor(self.workers, initializer=_init_worker,
+                                  initargs=(self.setup_factory, self.rec_algorithm_param, self.n_iterations_param,
+                                            sessions))
+
+    def run(self, src, dest, save='image'):
+        """
+        It processes every image of src through the pipeline.
+        :param src: folder with the input images;
+        :param dest: folder receiving one output image per input image, with the same name;
+        :param save: 'image' writes the reconstructions and 'sino' writes the sinograms;
+        :return: the list of written files, in input order.
+        """
+        if save not in ('image', 'sino'):
+            raise ValueError("Unknown save mode '{}', expected 'image' or 'sino'".format(save))
+        key = 'rec' if save == 'image' else 'sino'
+        if not os.path.exists(dest):
+            os.mkdir(dest)
+
+        names = sorted(os.listdir(src))
+        self.times = []
+        sessions = []
+        try:
+            with ThreadPoolExecutor(self.io_threads) as io, self._compute_pool(sessions) as compute:
+                self._pipeline(names, src, dest, key, io, compute)
+        finally:
+            for session in sessions:
+                session.close()
+
+        return [os.path.join(dest, name) for name in names]
+
+    def run_packed(self, src, dest, batch=32):
+        """
+        It processes every sample of a packed store (see sample_store.py and process_data_leuven.py). The workers map
+        the store and receive batches of rows, which they read in place; the sinograms and reconstructions are written,
+        in input order, into two packed stores of dest (sino.npy and rec.npy) whose indexes repeat the index of src with
+        the reconstruction time of every sample. Both stores appear once every sample is processed.
+        :param src: name of the .npy file of the input store;
+        :param dest: folder receiving the output stores;
+        :param batch: number of samples per task;
+        :return: the tuple of the names of the sinogram and reconstruction stores.
+        """
+        store, index = open_store(src)
+        if len(store) == 0:
+            raise ValueError("The store '{}' is empty".format(src))
+        src = os.path.abspath(src)
+        if not os.path.exists(dest):
+            os.mkdir(dest)
+        paths = (os.path.join(dest, 'sino.npy'), os.path.join(dest, 'rec.npy'))
+
+        starts = iter(range(0, len(store), batch))
+        computing = deque()
+        outputs = None
+        self.times = []
+        sessions = []
+        try:
+            with self._compute_pool(sessions) as compute:
+                while True:
+                    # backpressure: at most max_in_flight batches are submitted and not written yet
+                    while len(computing) < self.max_in_flight:
+                        start = next(starts, None)
+                        if start is None:
+                            break
+                        stop = min(start + batch, len(store))
+                        computing.append((start, stop, compute.submit(_reconstruct_rows, src, start, stop)))
+                    if not computing:
+                        break
+                    start, stop, future = computing.popleft()
+                    sinos, recs, times = future.result()
+                    if outputs is None:
+                        # the shapes of the outputs are only known once the first batch is done
+                        outputs = [np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=np.float32,
+                                                             shape=(len(store),) + data.shape[1:])
+                                   for path, data in zip(paths, (sinos, recs))]
+                    outputs[0][start:stop] = sinos
+                    outputs[1][start:stop] = recs
+                    self.times += times
+        finally:
+            for session in sessions:
+                session.close()
+
+        for output in outputs:
+            output.flush()
+        # the files are unmapped before they are renamed
+        outputs = None
+        rows = [{name: value for name, value in row.items() if name != 'row'} for row in index]
+        for path in paths:
+            write_index(path, [dict(row, time=elapsed_time) for row, elapsed_time in zip(rows, self.times)])
+            os.replace(path + '.tmp', path)
+        return paths
+
+    def _pipeline(self, names, src, dest, key, io, compute):
+        pending = iter(names)
+        decoding, computing, writing = deque(), deque(), deque()
+
+        while True:
+            # backpressure: new images are only decoded while fewer than max_in_flight are held
+            while writing and writing[0].done():
+                writing.popleft().result()
+            while len(decoding) + len(computing) + len(writing) < self.max_in_flight:
+                name = next(pending, None)
+                if name is None:
+                    break
+                decoding.append((name, io.submit(_decode, os.path.join(src, name))))
+
+            # results move between stages in input order, which keeps the output order deterministic
+            while decoding and decoding[0][1].done():
+                name, future = decoding.popleft()
+                computing.append((name, compute.submit(_reconstruct, future.result(), key)))
+            while computing and computing[0][1].done():
+                name, future = computing.popleft()
+                data, elapsed_time = future.result()
+                self.times.append(elapsed_time)
+                writing.append(io.submit(imwrite, os.path.join(dest, name), data))
+
+            if not decoding and not computing and len(self.times) == len(names):
+                break
+            heads = [queue[0][1] for queue in (decoding, computing) if queue] + list(writing)[:1]
+            if heads:
+                wait(heads, return_when=FIRST_COMPLETED)
+
+        for future in writing:
+            future.result()
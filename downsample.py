@@ -0,0 +1,208 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from imageio import imread, imwrite
+from scipy.ndimage import gaussian_filter
+
+TRUNCATE = 4.0
+
+
+def block_mean(array, factors):
+    """
+    It reduces an array by integer factors, every output element being the exact mean of its block of
+    factor[0] x factor[1] x ... input elements; the blocks at the end of an axis that is not a multiple of its factor
+    hold fewer elements and are averaged over them.
+    :param array: input array;
+    :param factors: integer reduction factor of every axis;
+    :return: the float64 reduced array, of shape ceil(shape / factors).
+    """
+    out = np.asarray(array, dtype=np.float64)
+    for axis, factor in enumerate(factors):
+        if factor == 1:
+            continue
+        n = out.shape[axis]
+        starts = np.arange(0, n, factor)
+        counts = np.diff(np.append(starts, n)).reshape([-1 if a == axis else 1 for a in range(out.ndim)])
+        # the mean of a box is separable: block sums along one axis at a time
+        out = np.add.reduceat(out, starts, axis=axis) / counts
+    return out
+
+
+def anti_alias_sigma(factors):
+    """
+    It returns the standard deviations of the Gaussian pre-filter of anti-aliased reductions, (factor - 1) / 2 per axis
+    as in skimage.transform.rescale.
+    """
+    return tuple(max(0.0, (factor - 1) / 2) for factor in factors)
+
+
+def reduce_array(array, factors, anti_aliasing=False):
+    """
+    It reduces an array held in memory by integer factors with block_mean(), after a Gaussian pre-filter when
+    anti_aliasing is set.
+    :param array: input array;
+    :param factors: integer reduction factor of every axis;
+    :param anti_aliasing: smooths the array with a Gaussian of standard deviations anti_alias_sigma(factors) first;
+    :return: the float64 reduced array.
+    """
+    array = np.asarray(array, dtype=np.float64)
+    if anti_aliasing:
+        array = gaussian_filter(array, anti_alias_sigma(factors), mode='nearest', truncate=TRUNCATE)
+    return block_mean(array, factors)
+
+
+def reduce_slabs(read, depth, factors, anti_aliasing=False, slab_bytes=2 ** 28):
+    """
+    It reduces a volume slab by slab along z, so that it never has to be held in memory: read(start, stop) returns the
+    slices start..stop of the volume, and the output slices are produced in order. With anti_aliasing, every slab is
+    read with the halo of slices reached by the Gaussian pre-filter, which makes the result identical to the reduction
+    of the whole volume at once.
+    :param read: function read(start, stop) returning the array of the input slices start..stop;
+    :param depth: number of input slices;
+    :param factors: integer reduction factors (z, y, x);
+    :param anti_aliasing: applies the Gaussian pre-filter of reduce_array();
+    :param slab_bytes: approximate upper bound on the memory of the input slab held at once;
+    :return: a generator yielding the tuple (first output slice, float64 array of reduced slices).
+    """
+    factors = tuple(int(f) for f in factors)
+    if any(f < 1 for f in factors):
+        raise ValueError("Expected integer reduction factors of at least 1, got {}".format(factors))
+    sigma = anti_alias_sigma(factors) if anti_aliasing else (0.0,) * len(factors)
+    # radius of the Gaussian kernel along z, as computed by scipy.ndimage
+    halo = int(TRUNCATE * sigma[0] + 0.5) if anti_aliasing else 0
+
+    first = read(0, 1)
+    slice_bytes = 8 * first[0].size
+    n_out = -(-depth // factors[0])
+    step = max(1, (slab_bytes // slice_bytes - 2 * halo) // factors[0])
+    for k0 in range(0, n_out, step):
+        k1 = min(k0 + step, n_out)
+        z0, z1 = k0 * factors[0], min(k1 * factors[0], depth)
+        h0, h1 = max(0, z0 - halo), min(depth, z1 + halo)
+        slab = np.asarray(read(h0, h1), dtype=np.float64)
+        if anti_aliasing:
+            slab = gaussian_filter(slab, sigma, mode='nearest', truncate=TRUNCATE)
+        yield k0, block_mean(slab[z0 - h0:z1 - h0], factors)
+
+
+def _cast(array, dtype):
+    # integer outputs (e.g. the 8-bit slices) are rounded to the nearest value that the type can hold
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        array = np.clip(np.rint(array), info.min, info.max)
+    return array.astype(dtype)
+
+
+def downsample_volume(src, dest, factors, anti_aliasing=False, dtype=np.float32, slab_bytes=2 ** 28):
+    """
+    It reduces a .npy volume (see volume_store.py) into another one with reduce_slabs(), streaming slabs along z from
+    a memory map of src into a memory map of dest, so volumes larger than the memory are supported.
+    :param src: name of the input .npy volume, of shape (z, y, x);
+    :param dest: name of the .npy file to be written;
+    :param factors: integer reduction factors (z, y, x), or one factor for all the axes;
+    :param anti_aliasing: applies the Gaussian pre-filter of reduce_array();
+    :param dtype: data type stored in dest;
+    :param slab_bytes: approximate upper bound on the memory of the input slab held at once;
+    :return: dest.
+    """
+    volume = np.load(src, mmap_mode='r')
+    factors = (factors,) * volume.ndim if np.ndim(factors) == 0 else tuple(factors)
+    shape = tuple(-(-n // f) for n, f in zip(volume.shape, factors))
+    out = np.lib.format.open_memmap(dest + '.tmp', mode='w+', dtype=dtype, shape=shape)
+    try:
+        for k, block in reduce_slabs(lambda start, stop: volume[start:stop], len(volume), factors, anti_aliasing,
+                                     slab_bytes):
+            out[k:k + len(block)] = _cast(block, dtype)
+        out.flush()
+    finally:
+        del out
+    os.replace(dest + '.tmp', dest)
+    return dest
+
+
+def downsample_folder(src, dest, factors, anti_aliasing=False, suffix='png', dtype=None, slab_bytes=2 ** 28):
+    """
+    It reduces the volume stored in a folder of slice images (in the sorted order of their names) into a folder of
+    slice images slice0000.png, slice0001.png, ... with reduce_slabs(): only one slab of slices is read at a time.
+    :param src: folder of the input slices;
+    :param dest: folder of the output slices;
+    :param factors: integer reduction factors (z, y, x), or one factor for all the axes;
+    :param anti_aliasing: applies the Gaussian pre-filter of reduce_array();
+    :param suffix: ending of the names of the input slices;
+    :param dtype: data type of the output slices (default: that of the input slices);
+    :param slab_bytes: approximate upper bound on the memory of the input slab held at once;
+    :return: the number of output slices.
+    """
+    names = sorted(name for name in os.listdir(src) if name.endswith(suffix))
+    if not names:
+        raise ValueError("No slices found in '{}'".format(src))
+    factors = (factors,) * 3 if np.ndim(factors) == 0 else tuple(factors)
+    dtype = imread(os.path.join(src, names[0])).dtype if dtype is None else dtype
+    if not os.path.isdir(dest):
+        os.makedirs(dest)
+
+    def read(start, stop):
+        return np.stack([imread(os.path.join(src, name)) for name in names[start:stop]])
+
+    count = 0
+    for k, block in reduce_slabs(read, len(names), factors, anti_aliasing, slab_bytes):
+        for z, image in enumerate(_cast(block, dtype), k):
+            imwrite(os.path.join(dest, "slice{:04d}.png".format(z)), image)
+            count += 1
+    return count
+
+
+def downsample_folders(src, dest, factors, anti_aliasing=False, workers=None, **options):
+    """
+    It reduces every volume folder of src (see downsample_folder) into the folder of the same name in dest, one folder
+    per task of a pool of worker processes.
+    :param src: folder holding one folder of slices per volume;
+    :param dest: folder receiving the reduced volumes;
+    :param factors: integer reduction factors (z, y, x), or one factor for all the axes;
+    :param anti_aliasing: applies the Gaussian pre-filter of reduce_array();
+    :param workers: number of worker processes (default: all cores);
+    :param options: keyword arguments forwarded to downsample_folder (suffix, dtype, slab_bytes);
+    :return: the list of the output folders, in the sorted order of the input ones.
+    """
+    folders = sorted(name for name in os.listdir(src) if os.path.isdir(os.path.join(src, name)))
+    outputs = [os.path.join(dest, name) for name in folders]
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(downsample_folder, os.path.join(src, name), output, factors, anti_aliasing, **options)
+                   for name, output in zip(folders, outputs)]
+        for future in futures:
+            future.result()
+    return outputs
+
+
+def downsample_images(src, dest, factor, anti_aliasing=False, workers=None, chunk=16, dtype=None):
+    """
+    It reduces every 2D image of src by an integer factor with reduce_array() and writes it into dest under the same name,
+    chunks of images being processed by a pool of worker processes.
+    :param src: folder of the input images;
+    :param dest: folder of the output images;
+    :param factor: integer reduction factor of both axes, or the tuple (rows, cols) of factors;
+    :param anti_aliasing: applies the Gaussian pre-filter of reduce_array();
+    :param workers: number of worker processes (default: all cores);
+    :param chunk: number of images per task;
+    :param dtype: data type of the output images (default: that of every input image);
+    :return: the list of the written files, in the sorted order of the input names.
+    """
+    names = sorted(name for name in os.listdir(src) if os.path.isfile(os.path.join(src, name)))
+    factors = (factor, factor) if np.ndim(factor) == 0 else tuple(factor)
+    if not os.path.isdir(dest):
+        os.makedirs(dest)
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(_downsample_files, src, dest, names[start:start + chunk], factors, anti_aliasing, dtype)
+                   for start in range(0, len(names), chunk)]
+        for future in futures:
+            future.result()
+    return [os.path.join(dest, name) for name in names]
+
+
+def _downsample_files(src, dest, names, factors, anti_aliasing, dtype):
+    for name in names:
+        image = imread(os.path.join(src, name))
+        reduced = reduce_array(image, factors + (1,) * (image.ndim - len(factors)), anti_aliasing)
+        imwrite(os.path.join(dest, name), _cast(reduced, image.dtype if dtype is None else dtype))
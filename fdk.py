@@ -0,0 +1,204 @@
+import numpy as np
+from cpu_projector import RayDrivenProjector
+
+FILTERS = ('ram-lak', 'shepp-logan', 'cosine', 'hamming', 'hann')
+
+
+def ramp_filter(n_cols, filter_name='ram-lak'):
+    """
+    It builds the frequency response of the ramp filter of a detector row, from the band-limited spatial kernel of the
+    ramp (h(0) = 1 / 4, h(k) = -1 / (pi k)^2 for odd k, in pixel units) so that the filter has no DC offset, apodized by
+    the window of filter_name.
+    :param n_cols: number of detector columns;
+    :param filter_name: one of FILTERS;
+    :return: the tuple (response of length n // 2 + 1, padded length n of the rows).
+    """
+    if filter_name not in FILTERS:
+        raise ValueError("Unknown filter '{}' ({})".format(filter_name, ', '.join(FILTERS)))
+    # twice the row length, so that the circular convolution of the FFT does not wrap around
+    n = max(64, 2 ** int(np.ceil(np.log2(2 * n_cols))))
+    k = np.abs(np.fft.fftfreq(n, 1.0 / n))
+    kernel = np.zeros(n)
+    kernel[0] = 0.25
+    odd = k % 2 == 1
+    kernel[odd] = -1.0 / (np.pi * k[odd]) ** 2
+    response = np.real(np.fft.rfft(kernel))
+
+    frequency = np.fft.rfftfreq(n)
+    if filter_name == 'shepp-logan':
+        response *= np.sinc(frequency)
+    elif filter_name == 'cosine':
+        response *= np.cos(np.pi * frequency)
+    elif filter_name == 'hamming':
+        response *= 0.54 + 0.46 * np.cos(2 * np.pi * frequency)
+    elif filter_name == 'hann':
+        response *= 0.5 + 0.5 * np.cos(2 * np.pi * frequency)
+    return response.astype(np.float32), n
+
+
+def projection_weights(projector):
+    """
+    It computes the weight of every projection in the backprojection sum. The projections are treated as samples of a
+    source trajectory: projection p stands for the displacement of the source orthogonal to its central ray between
+    the neighbouring projections, divided by its source-detector distance (the step dbeta of a circular scan, scaled
+    by R / SDD), so that circular, semi-circular and translating (inline) trajectories share one formula. Lines
+    measured twice (central rays turning by more than 180 degrees, as in a full circular scan) are down-weighted
+    globally, without Parker weights.
+    :param projector: RayDrivenProjector of the geometry;
+    :return: the float64 array of the weights, one per projection.
+    """
+    normal = projector._normal / np.linalg.norm(projector._normal, axis=1)[:, None]
+    central = projector.det - projector.src
+    distance = np.sum(central * normal, axis=1)
+    central /= np.linalg.norm(central, axis=1)[:, None]
+    if projector.n_proj == 1:
+        return np.abs(1.0 / distance)
+
+    step = np.diff(projector.src, axis=0)
+    ends = np.concatenate((step[:1], step, step[-1:]))
+    halves = [ends[:-1], ends[1:]]
+    # displacement of the source orthogonal to the central ray, averaged over both sides (trapezoidal rule)
+    orthogonal = sum(np.linalg.norm(h - np.sum(h * central, axis=1)[:, None] * central, axis=1) for h in halves) / 2
+    orthogonal[0] /= 2
+    orthogonal[-1] /= 2
+
+    turned = np.sum(np.arccos(np.clip(np.sum(central[1:] * central[:-1], axis=1), -1.0, 1.0)))
+    return orthogonal / np.abs(distance) * np.pi / max(turned, np.pi)
+
+
+def filter_projections(projector, sinogram, filter_name='ram-lak', block_rows=None):
+    """
+    It applies the FDK pre-weighting and ramp filtering to the projections of a vector geometry: every pixel is
+    multiplied by the cosine of the angle between its ray and the detector normal, and every detector row is filtered
+    along u with an FFT, a block of rows of all the projections at once. The result is scaled by the projection weights
+    and the pixel width, ready for backproject().
+    :param projector: RayDrivenProjector of the geometry;
+    :param sinogram: projections in the ASTRA layout of the geometry;
+    :param filter_name: window of the ramp filter (see FILTERS);
+    :param block_rows: number of detector rows filtered at once (default: bounded by the chunk size of the projector);
+    :return: the float32 filtered projections, of shape (detector rows, projections, detector cols).
+    """
+    rows, n_proj, cols = projector.det_rows, projector.n_proj, projector.det_cols
+    sinogram = np.asarray(sinogram, dtype=np.float32).reshape(rows, n_proj, cols)
+    response, n = ramp_filter(cols, filter_name)
+    if block_rows is None:
+        block_rows = max(1, projector.chunk_elements // (n_proj * n))
+
+    normal = projector._normal / np.linalg.norm(projector._normal, axis=1)[:, None]
+    offset = projector.det - projector.src
+    distance = np.sum(offset * normal, axis=1)
+    scale = projection_weights(projector) / np.linalg.norm(projector.u, axis=1)
+    cu = np.arange(cols) - cols / 2 + 0.5
+
+    filtered = np.empty((rows, n_proj, cols), dtype=np.float32)
+    for start in range(0, rows, block_rows):
+        stop = min(start + block_rows, rows)
+        cv = np.arange(start, stop) - rows / 2 + 0.5
+        # rays from the source to the pixel centres, of shape (rows, projections, cols, 3)
+        pixel = (offset[None, :, None] + cu[None, None, :, None] * projector.u[None, :, None] +
+                 cv[:, None, None, None] * projector.v[None, :, None])
+        cosine = np.abs(distance)[None, :, None] / np.linalg.norm(pixel, axis=-1)
+        spectrum = np.fft.rfft(sinogram[start:stop] * cosine.astype(np.float32), n=n, axis=-1)
+        spectrum *= response
+        filtered[start:stop] = np.fft.irfft(spectrum, n=n, axis=-1)[..., :cols] * scale[None, :, None]
+    return filtered
+
+
+def backproject(projector, filtered):
+    """
+    It backprojects filtered projections with the FDK distance weighting: every voxel gathers, from every projection,
+    the bilinear interpolation of the detector at the projection of its centre, weighted by the squared magnification
+    (source-detector distance / source-voxel depth)^2. The voxels are processed in chunks by several threads; the
+    detector coordinates of a chunk come from one product of a (voxels, 3) and a (3, 3 * projections) matrix.
+    :param projector: RayDrivenProjector of the geometry;
+    :param filtered: output of filter_projections();
+    :return: the float32 volume in the ASTRA layout of the geometry.
+    """
+    rows, n_proj, cols = projector.det_rows, projector.n_proj, projector.det_cols
+    flat = np.ascontiguousarray(filtered, dtype=np.float32).reshape(-1)
+    src, inv = projector.src, projector._inv_gram
+    axis_u = inv[:, 0, 0, None] * projector.u + inv[:, 0, 1, None] * projector.v
+    axis_v = inv[:, 1, 0, None] * projector.u + inv[:, 1, 1, None] * projector.v
+    vectors = np.concatenate((projector._normal, axis_u, axis_v))
+    shift = np.concatenate([np.sum(src * w, axis=1) for w in (projector._normal, axis_u, axis_v)])
+    offset = projector.det - src
+    centre_u = np.sum(offset * axis_u, axis=1)
+    centre_v = np.sum(offset * axis_v, axis=1)
+    proj = np.arange(n_proj)
+
+    n_voxels = int(np.prod(projector.grid))
+    out = np.zeros(n_voxels, dtype=np.float32)
+
+    def work(start, stop):
+        index = np.stack(np.unravel_index(np.arange(start, stop), projector.grid), axis=1).astype(np.float64)
+        dots = projector._to_world(index) @ vectors.T - shift
+        denominator, along_u, along_v = dots[:, :n_proj], dots[:, n_proj:2 * n_proj], dots[:, 2 * n_proj:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = projector._det_dist / denominator
+            col = t * along_u - centre_u + cols / 2 - 0.5
+            row = t * along_v - centre_v + rows / 2 - 0.5
+        in_front = np.isfinite(t) & (t > 0)
+        col, row = np.where(in_front, col, -2.0), np.where(in_front, row, -2.0)
+        col0, row0 = np.floor(col), np.floor(row)
+        fc, fr = (col - col0).astype(np.float32), (row - row0).astype(np.float32)
+        col0, row0 = col0.astype(np.int64), row0.astype(np.int64)
+
+        total = np.zeros(col.shape, dtype=np.float32)
+        for dr, dc in ((0, 0), (0, 1), (1, 0), (1, 1)):
+            r, c = row0 + dr, col0 + dc
+            valid = (r >= 0) & (r < rows) & (c >= 0) & (c < cols)
+            w = (fr if dr else 1 - fr) * (fc if dc else 1 - fc)
+            total += np.where(valid, w * flat[np.where(valid, (r * n_proj + proj) * cols + c, 0)], 0.0)
+        out[start:stop] = np.sum(total * np.where(in_front, t * t, 0.0).astype(np.float32), axis=1)
+
+    projector._map_chunks(work, n_voxels, max(1, projector.chunk_elements // (4 * n_proj)))
+    return out.reshape(projector.vol_shape)
+
+
+def fdk(proj_geom, vol_geom, sinogram, filter_name='ram-lak', **projector_options):
+    """
+    It reconstructs a volume in one pass with a filtered backprojection of the FDK type, for arbitrary per-projection
+    'fanflat_vec' and 'cone_vec' geometries (inline, semi-circular, multi-view or circular). It is exact for full
+    circular fan-beam scans and approximate otherwise (cone angle, limited or translational trajectories), which makes
+    it a preview and a warm start (x0) for the iterative solvers rather than a replacement for them.
+    :param proj_geom: ASTRA projection geometry ('fanflat_vec' or 'cone_vec');
+    :param vol_geom: ASTRA volume geometry;
+    :param sinogram: projections in the ASTRA layout of proj_geom;
+    :param filter_name: window of the ramp filter (see FILTERS);
+    :param projector_options: keyword arguments forwarded to RayDrivenProjector (chunk_elements, n_workers);
+    :return: the float32 volume in the ASTRA layout of vol_geom.
+    """
+    projector = RayDrivenProjector(proj_geom, vol_geom, **projector_options)
+    return backproject(projector, filter_projections(projector, sinogram, filter_name))
+
+
+def fit_scale(operator, volume, sinogram):
+    """
+    It scales a volume to the least-squares fit of its projections to a sinogram, min_s ||s A x - b||, which corrects
+    the global scale of an approximate reconstruction (e.g. fdk() on a limited-angle geometry) with one projection.
+    :param operator: projection operator or backend of the geometry, providing forward() (see iterative_solvers.py and
+    projector_backend.py);
+    :param volume: float32 volume x;
+    :param sinogram: projections b;
+    :return: the scaled volume (scaled in place).
+    """
+    projection = operator.forward(volume)
+    energy = float(np.vdot(projection, projection))
+    if energy > 0:
+        volume *= np.float32(np.vdot(projection, sinogram) / energy)
+    return volume
+
+
+def warm_start(backend, sinogram, filter_name='hann'):
+    """
+    It computes the one-pass preview of a sinogram used to warm-start the iterative reconstructions of the scanning
+    objects: fdk() in the geometry of the backend, scaled by fit_scale() and clipped to non-negative attenuations,
+    which removes most of the limited-angle undershoots that the iterations would otherwise have to undo.
+    :param backend: projector backend of the reconstruction geometry (see projector_backend.py);
+    :param sinogram: projections in the ASTRA layout of the backend geometry;
+    :param filter_name: window of the ramp filter (see FILTERS);
+    :return: the C-contiguous float32 volume in the ASTRA layout of the backend volume geometry.
+    """
+    sinogram = np.asarray(sinogram, dtype=np.float32)
+    volume = fit_scale(backend, fdk(backend.proj_geom, backend.vol_geom, sinogram, filter_name), sinogram)
+    return np.maximum(volume, 0, out=volume)
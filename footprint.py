@@ -0,0 +1,306 @@
+import itertools
+import numpy as np
+from cpu_projector import RayDrivenProjector
+
+
+def footprint_box(proj_geom, vol_geom, margin=2):
+    """
+    It computes the bounding box of the voxels crossed by the rays of a geometry. The rays of every projection fill the
+    pyramid (the wedge, in 2D) spanned by the source and the corners of the detector; the box of its intersection with
+    the volume is found exactly from the vertices of that convex region (corners of the volume inside the pyramid, edges
+    of the volume crossing the faces of the pyramid, edges of the pyramid crossing the faces of the volume, and the
+    source), for every projection at once.
+    :param proj_geom: ASTRA projection geometry ('fanflat_vec' or 'cone_vec');
+    :param vol_geom: ASTRA volume geometry;
+    :param margin: number of voxels added on each side of the box, so that the interpolation at its border is kept;
+    :return: a tuple of slices, one per axis of the ASTRA volume array, or None when no ray crosses the volume.
+    """
+    projector = RayDrivenProjector(proj_geom, vol_geom)
+    axes = projector._interp_axes
+    grid = np.array(projector.grid, dtype=np.float64)[list(axes)]
+
+    if projector.ndim == 3:
+        half_u, half_v = projector.det_cols / 2 * projector.u, projector.det_rows / 2 * projector.v
+        corners = [projector.det - half_u - half_v, projector.det + half_u - half_v,
+                   projector.det + half_u + half_v, projector.det - half_u + half_v]
+    else:
+        half_u = projector.det_cols / 2 * projector.u
+        corners = [projector.det - half_u, projector.det + half_u]
+
+    # everything is computed in index coordinates, where voxel k spans [k - 0.5, k + 0.5] along every axis
+    source = projector._to_index(projector.src)[:, axes]
+    rays = np.stack([projector._to_index(corner)[:, axes] for corner in corners], axis=1) - source[:, None]
+    center = projector._to_index(projector.det)[:, axes] - source
+    normals = _face_normals(rays)
+    normals *= np.where(np.einsum('pkd,pd->pk', normals, center) < 0, -1.0, 1.0)[..., None]
+
+    lower, upper = np.full(len(axes), -0.5), grid - 0.5
+    candidates = [_box_corners(lower, upper)[None].repeat(len(source), axis=0),
+                  _edges_through_faces(lower, upper, source, normals),
+                  _rays_through_box(lower, upper, source, rays),
+                  source[:, None]]
+    points = np.concatenate(candidates, axis=1)
+
+    eps = 1e-6 * max(1.0, float(np.max(grid)))
+    inside = np.all(np.einsum('pkd,pnd->pnk', normals, points - source[:, None]) >= -eps * np.linalg.norm(
+        normals, axis=-1)[:, None, :], axis=-1)
+    inside &= np.all((points >= lower - eps) & (points <= upper + eps), axis=-1)
+    if not np.any(inside):
+        return None
+
+    points = points[inside]
+    first = np.maximum(np.floor(points.min(axis=0) + 0.5).astype(int) - margin, 0)
+    last = np.minimum(np.floor(points.max(axis=0) + 0.5).astype(int) + margin + 1, grid.astype(int))
+    return tuple(slice(int(a), int(b)) for a, b in zip(first, last))
+
+
+def roi_geometry(proj_geom, vol_geom, margin=2):
+    """
+    It crops a volume geometry to the footprint of a projection geometry (see footprint_box).
+    :param proj_geom: ASTRA projection geometry ('fanflat_vec' or 'cone_vec');
+    :param vol_geom: ASTRA volume geometry;
+    :param margin: number of voxels added on each side of the footprint;
+    :return: the tuple (box, cropped volume geometry), or (None, vol_geom) when the rays cross the whole volume or none
+    of it.
+    """
+    box = footprint_box(proj_geom, vol_geom, margin)
+    if box is None or all(b.stop - b.start == n for b, n in zip(box, vol_shape(vol_geom))):
+        return None, vol_geom
+    return box, crop_vol_geom(vol_geom, box)
+
+
+def crop_vol_geom(vol_geom, box):
+    """
+    It builds the volume geometry of a box of a volume: the grid holds the voxels of the box and the window covers
+    their world coordinates, so that projections in both geometries agree.
+    :param vol_geom: ASTRA volume geometry;
+    :param box: tuple of slices returned by footprint_box();
+    :return: the cropped ASTRA volume geometry.
+    """
+    option = dict(vol_geom.get('option', {}))
+    rows, cols = vol_geom['GridRowCount'], vol_geom['GridColCount']
+    cropped = dict(vol_geom, option=option)
+    min_x, max_x = option.get('WindowMinX', -cols / 2), option.get('WindowMaxX', cols / 2)
+    min_y, max_y = option.get('WindowMinY', -rows / 2), option.get('WindowMaxY', rows / 2)
+    pixel_x, pixel_y = (max_x - min_x) / cols, (max_y - min_y) / rows
+
+    if 'GridSliceCount' in vol_geom:
+        slices = vol_geom['GridSliceCount']
+        min_z, max_z = option.get('WindowMinZ', -slices / 2), option.get('WindowMaxZ', slices / 2)
+        pixel_z = (max_z - min_z) / slices
+        z, y, x = box
+        cropped['GridSliceCount'] = z.stop - z.start
+        option['WindowMinZ'], option['WindowMaxZ'] = min_z + z.start * pixel_z, min_z + z.stop * pixel_z
+        option['WindowMinY'], option['WindowMaxY'] = min_y + y.start * pixel_y, min_y + y.stop * pixel_y
+    else:
+        # ASTRA 2D volumes store the highest y in the first row
+        y, x = box
+        option['WindowMinY'], option['WindowMaxY'] = max_y - y.stop * pixel_y, max_y - y.start * pixel_y
+    cropped['GridRowCount'], cropped['GridColCount'] = y.stop - y.start, x.stop - x.start
+    option['WindowMinX'], option['WindowMaxX'] = min_x + x.start * pixel_x, min_x + x.stop * pixel_x
+    return cropped
+
+
+def detector_window(proj_geom, vol_geom, margin=1):
+    """
+    It computes the rows and columns of a 'cone_vec' detector that receive rays crossing the volume in any projection:
+    the corners of the volume are projected from the source onto the detector plane, and the pixels whose centres fall
+    within the box of their projections are kept.
+    :param proj_geom: ASTRA 'cone_vec' projection geometry;
+    :param vol_geom: ASTRA volume geometry;
+    :param margin: number of pixels added on each side of the window;
+    :return: the tuple (rows, cols) of slices of the detector to keep.
+    """
+    vectors = np.asarray(proj_geom['Vectors'], dtype=np.float64)
+    src, det, u, v = vectors[:, 0:3], vectors[:, 3:6], vectors[:, 6:9], vectors[:, 9:12]
+    n_rows, n_cols = int(proj_geom['DetectorRowCount']), int(proj_geom['DetectorColCount'])
+
+    option = vol_geom.get('option', {})
+    rows, cols, slices = vol_geom['GridRowCount'], vol_geom['GridColCount'], vol_geom['GridSliceCount']
+    corners = _box_corners(np.array([option.get('WindowMinX', -cols / 2), option.get('WindowMinY', -rows / 2),
+                                     option.get('WindowMinZ', -slices / 2)]),
+                           np.array([option.get('WindowMaxX', cols / 2), option.get('WindowMaxY', rows / 2),
+                                     option.get('WindowMaxZ', slices / 2)]))
+
+    # intersection of the line source -> corner with the detector plane, in pixel units from the detector centre
+    normal = np.cross(u, v)
+    ray = corners[None] - src[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.einsum('pd,pd->p', det - src, normal)[:, None] / np.einsum('pcd,pd->pc', ray, normal)
+    hit = src[:, None] + t[..., None] * ray - det[:, None]
+    gram = np.linalg.inv(np.stack((np.stack((np.sum(u * u, 1), np.sum(u * v, 1)), 1),
+                                   np.stack((np.sum(u * v, 1), np.sum(v * v, 1)), 1)), 1))
+    uv = np.einsum('pij,pcj->pci', gram, np.stack((np.einsum('pcd,pd->pc', hit, u),
+                                                   np.einsum('pcd,pd->pc', hit, v)), axis=-1))
+
+    window = []
+    for axis, count in ((1, n_rows), (0, n_cols)):
+        # pixel k is centred at k - count / 2 + 0.5; a corner behind the source leaves the detector whole
+        if not np.all(np.isfinite(t) & (t > 0)):
+            window.append(slice(0, count))
+            continue
+        first = int(np.ceil(np.min(uv[..., axis]) + count / 2 - 0.5)) - margin
+        last = int(np.floor(np.max(uv[..., axis]) + count / 2 - 0.5)) + margin + 1
+        window.append(slice(min(max(first, 0), count), max(min(last, count), 0)))
+    return tuple(window)
+
+
+def crop_detector(proj_geom, window):
+    """
+    It shrinks a 'cone_vec' detector to a window of its rows and columns, moving the detector centres so that the kept
+    pixels stay in place.
+    :param proj_geom: ASTRA 'cone_vec' projection geometry;
+    :param window: tuple (rows, cols) of slices returned by detector_window();
+    :return: the projection geometry of the window.
+    """
+    vectors = np.array(proj_geom['Vectors'], dtype=np.float64)
+    rows, cols = window
+    n_rows, n_cols = int(proj_geom['DetectorRowCount']), int(proj_geom['DetectorColCount'])
+    shift_cols = (cols.start + cols.stop - n_cols) / 2
+    shift_rows = (rows.start + rows.stop - n_rows) / 2
+    vectors[:, 3:6] += shift_cols * vectors[:, 6:9] + shift_rows * vectors[:, 9:12]
+    cropped = dict(proj_geom, DetectorRowCount=rows.stop - rows.start, DetectorColCount=cols.stop - cols.start)
+    cropped['Vectors'] = vectors.astype(np.asarray(proj_geom['Vectors']).dtype)
+    return cropped
+
+
+def window_report(proj_geom, window):
+    """
+    It summarizes how much of a detector is trimmed by a window.
+    :param proj_geom: ASTRA 'cone_vec' projection geometry of the whole detector;
+    :param window: tuple (rows, cols) of slices returned by detector_window();
+    :return: a dictionary with the kept ranges and the detector sizes into 'rows' and 'cols' indexes, and the fraction
+    of the sinogram that is kept into 'kept' index.
+    """
+    rows, cols = window
+    n_rows, n_cols = int(proj_geom['DetectorRowCount']), int(proj_geom['DetectorColCount'])
+    return {'rows': (rows.start, rows.stop, n_rows), 'cols': (cols.start, cols.stop, n_cols),
+            'kept': (rows.stop - rows.start) * (cols.stop - cols.start) / (n_rows * n_cols)}
+
+
+def trimmed_detector(proj_geom, vol_geom, margin=1):
+    """
+    It shrinks a 'cone_vec' detector to the window receiving rays through the volume (see detector_window).
+    :param proj_geom: ASTRA 'cone_vec' projection geometry;
+    :param vol_geom: ASTRA volume geometry;
+    :param margin: number of pixels added on each side of the window;
+    :return: the tuple (projection geometry, window, report of window_report()), or (proj_geom, None, None) when every
+    pixel receives rays.
+    """
+    window = detector_window(proj_geom, vol_geom, margin)
+    report = window_report(proj_geom, window)
+    if report['kept'] == 1:
+        return proj_geom, None, None
+    return crop_detector(proj_geom, window), window, report
+
+
+def vol_shape(vol_geom):
+    """
+    It returns the shape of the arrays of a volume geometry, as in ASTRA.
+    """
+    shape = (vol_geom['GridRowCount'], vol_geom['GridColCount'])
+    return (vol_geom['GridSliceCount'],) + shape if 'GridSliceCount' in vol_geom else shape
+
+
+def pad_volume(volume, box, shape):
+    """
+    It places a volume reconstructed in a cropped geometry back into the full grid, filling the rest with zeros.
+    :param volume: array in the layout of the cropped geometry;
+    :param box: tuple of slices returned by footprint_box();
+    :param shape: shape of the full volume;
+    :return: the float32 array of the given shape.
+    """
+    full = np.zeros(shape, dtype=np.float32)
+    full[box] = volume
+    return full
+
+
+class CroppedSession:
+    """
+    This class wraps a reconstruction session working in a cropped volume geometry (see crop_vol_geom) so that its
+    reconstructions are returned in the full grid; the phantoms are cropped by the simulate function of the session and
+    the other methods are those of the wrapped session.
+    """
+
+    def __init__(self, session, box, shape):
+        self.session = session
+        self.box = box
+        self.shape = shape
+
+    def reconstruct(self, sinogram=None, x0=None):
+        output = self.session.reconstruct(sinogram, None if x0 is None else np.ascontiguousarray(x0[self.box]))
+        return dict(output, rec=pad_volume(output['rec'], self.box, self.shape))
+
+    def run(self, phantom):
+        output = self.session.run(phantom)
+        return dict(output, rec=pad_volume(output['rec'], self.box, self.shape))
+
+    def iterate(self, sinogram=None, every=10, x0=None):
+        for output in self.session.iterate(sinogram, every, None if x0 is None else np.ascontiguousarray(x0[self.box])):
+            yield dict(output, rec=pad_volume(output['rec'], self.box, self.shape))
+
+    def run_progressive(self, phantom, every=10):
+        for output in self.session.run_progressive(phantom, every):
+            yield dict(output, rec=pad_volume(output['rec'], self.box, self.shape))
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.session.close()
+
+
+def _face_normals(rays):
+    """
+    It computes the normals of the faces of the pyramids (or the sides of the wedges) spanned by the edge rays.
+    """
+    if rays.shape[-1] == 3:
+        return np.cross(rays, np.roll(rays, -1, axis=1))
+    return np.stack((-rays[..., 1], rays[..., 0]), axis=-1)
+
+
+def _box_corners(lower, upper):
+    return np.array(list(itertools.product(*zip(lower, upper))), dtype=np.float64)
+
+
+def _edges_through_faces(lower, upper, source, normals):
+    """
+    It intersects the edges of the box with the planes of the faces of every pyramid.
+    """
+    corners = _box_corners(lower, upper)
+    ndim = len(lower)
+    edges = [(a, b) for a, b in itertools.combinations(range(len(corners)), 2)
+             if np.count_nonzero(corners[a] != corners[b]) == 1]
+    start = corners[[a for a, _ in edges]]
+    direction = corners[[b for _, b in edges]] - start
+
+    # normal . (start + t * direction - source) = 0
+    numerator = np.einsum('pkd,ped->pke', normals, source[:, None, :] - start[None])
+    denominator = np.einsum('pkd,ed->pke', normals, direction)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = numerator / denominator
+    t = np.where(np.isfinite(t) & (t >= 0) & (t <= 1), t, np.nan)
+    points = start[None, None] + t[..., None] * direction[None, None]
+    return points.reshape(len(source), -1, ndim)
+
+
+def _rays_through_box(lower, upper, source, rays):
+    """
+    It clips the edge rays of every pyramid to the box and returns the end points of the clipped segments.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_lower = (lower - source[:, None]) / rays
+        t_upper = (upper - source[:, None]) / rays
+    t_near = np.where(rays == 0, np.where((source[:, None] >= lower) & (source[:, None] <= upper), -np.inf, np.inf),
+                      np.minimum(t_lower, t_upper))
+    t_far = np.where(rays == 0, np.where((source[:, None] >= lower) & (source[:, None] <= upper), np.inf, -np.inf),
+                     np.maximum(t_lower, t_upper))
+    t_min = np.maximum(np.max(t_near, axis=-1), 0.0)
+    t_max = np.min(t_far, axis=-1)
+    valid = t_max >= t_min
+    t = np.where(valid[..., None], np.stack((t_min, t_max), axis=-1), np.nan)
+    points = source[:, None, None] + t[..., None] * rays[:, :, None]
+    return points.reshape(len(source), -1, rays.shape[-1])
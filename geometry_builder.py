@@ -0,0 +1,147 @@
+import numpy as np
+
+
+def inline_geometry_2d(alpha, detector_cells, number_of_projections, object_size, omega_total=0, dtype=np.float32):
+    """
+    It builds the 'fanflat_vec' geometry matrix of the inline setup described in InlineScanningSetup2D.
+    Every parameter may be a scalar or an array; arrays are broadcast against each other and describe one
+    configuration per element.
+    :param alpha: fan-beam opening angle in the X-ray source;
+    :param detector_cells: number of detector elements;
+    :param number_of_projections: number of X-ray projections acquired during the object movement;
+    :param object_size: number W of pixels of the W x W reconstruction grid;
+    :param omega_total: total object rotation (in degrees) around its own axis between the first and the last projection
+    acquisition;
+    :param dtype: data type of the returned matrices;
+    :return: a C-contiguous (number_of_projections, 6) matrix for scalar parameters, or a list with one such matrix per
+    configuration otherwise.
+    """
+    return _build(_inline_2d, number_of_projections, dtype, alpha=alpha, detector_cells=detector_cells,
+                  object_size=object_size, omega_total=omega_total)
+
+
+def inline_geometry_3d(alpha, detector_cells, number_of_projections, object_depth, vert_shift=0, tg_dir="esq",
+                       rotation=0, dtype=np.float32):
+    """
+    It builds the 'cone_vec' geometry matrix of the inline setup described in InlineScanningSetup3D.
+    Every parameter may be a scalar or an array; arrays are broadcast against each other and describe one
+    configuration per element.
+    :param alpha: fan-beam opening angle in the X-ray source;
+    :param detector_cells: number of detector elements;
+    :param number_of_projections: number of X-ray projections acquired during the object movement;
+    :param object_depth: size of the reconstruction grid along z (object_size[2] in InlineScanningSetup3D);
+    :param vert_shift: vertical shift of the source and detector;
+    :param tg_dir: direction of the conveyor belt, "left" or any other value for right;
+    :param rotation: tilt (in degrees) of the source-detector plane around the x axis;
+    :param dtype: data type of the returned matrices;
+    :return: a C-contiguous (number_of_projections, 12) matrix for scalar parameters, or a list with one such matrix per
+    configuration otherwise.
+    """
+    direction = np.where(np.asarray(tg_dir) == "left", 1.0, -1.0)
+    return _build(_inline_3d, number_of_projections, dtype, alpha=alpha, detector_cells=detector_cells,
+                  object_depth=object_depth, vert_shift=vert_shift, direction=direction, rotation=rotation)
+
+
+def semi_circular_geometry(radius, n_projs, src_dist, det_dist, dtype=np.float32):
+    """
+    It builds the 'fanflat_vec' geometry matrix of the semi-circular conveyor belt described in
+    SemiCircularConveyorBelt. Every parameter may be a scalar or an array; arrays are broadcast against each other and
+    describe one configuration per element.
+    :param radius: radius of the conveyor belt curve;
+    :param n_projs: number of X-ray projections acquired along the curve;
+    :param src_dist: distance between the conveyor belt and the X-ray source;
+    :param det_dist: distance between the conveyor belt and the detector;
+    :param dtype: data type of the returned matrices;
+    :return: a C-contiguous (n_projs, 6) matrix for scalar parameters, or a list with one such matrix per configuration
+    otherwise.
+    """
+    return _build(_semi_circular, n_projs, dtype, radius=radius, src_dist=src_dist, det_dist=det_dist)
+
+
+def semi_circular_det_size(radius, src_dist, det_dist, fan_beam_angle):
+    """
+    It computes the number of detector cells needed to cover the fan beam of the semi-circular conveyor belt.
+    :return: the detector size (an int, or an int array for array parameters).
+    """
+    size = 2 * np.tan(np.radians(np.asarray(fan_beam_angle) / 2)) * (np.asarray(radius) + src_dist + det_dist)
+    return size.astype(int) if size.ndim else int(size)
+
+
+def _build(function, number_of_projections, dtype, **params):
+    """
+    It evaluates a geometry function for every configuration, grouping the configurations that share the number of
+    projections so that each group is built by a single vectorized call.
+    """
+    n_proj = np.asarray(number_of_projections)
+    arrays = np.broadcast_arrays(n_proj, *[np.asarray(p, dtype=np.float64) for p in params.values()])
+    n_proj, values = arrays[0].ravel().astype(int), [a.ravel() for a in arrays[1:]]
+
+    if arrays[0].ndim == 0:
+        columns = function(_linspace_index(int(n_proj[0])), **{k: v[:, None] for k, v in zip(params, values)})
+        return np.ascontiguousarray(np.stack(np.broadcast_arrays(*columns), axis=-1)[0], dtype=dtype)
+
+    matrices = [None] * n_proj.size
+    for n in np.unique(n_proj):
+        members = np.flatnonzero(n_proj == n)
+        columns = function(_linspace_index(int(n)), **{k: v[members, None] for k, v in zip(params, values)})
+        block = np.ascontiguousarray(np.stack(np.broadcast_arrays(*columns), axis=-1), dtype=dtype)
+        for position, member in enumerate(members):
+            matrices[member] = block[position]
+    return matrices
+
+
+def _linspace_index(n):
+    """
+    It returns the fractions i / (n - 1) used by np.linspace(start, stop, num=n), as a (1, n) row.
+    """
+    return (np.arange(n) / max(n - 1, 1))[None, :]
+
+
+def _inline_2d(t, alpha, detector_cells, object_size, omega_total):
+    n = t.shape[1]
+    h = (detector_cells / 2) / np.tan(np.radians(alpha / 2))
+    ones = np.ones_like(t)
+
+    src_x = -detector_cells / 2 + detector_cells * t
+    src_y = (h - object_size / 2) * ones
+    d_x = src_x.copy()
+    d_y = -100 * ones
+
+    # projection p rotates the source of projection n - p - 1 and the detector of projection p by p * omega
+    omega = np.where(omega_total > 0, np.radians(omega_total / n), 0.0)
+    steps = np.arange(n)[None, :]
+    src_angle = (n - 1 - steps) * omega
+    det_angle = steps * omega
+    src_x, src_y = (src_x * np.cos(src_angle) - src_y * np.sin(src_angle),
+                    src_x * np.sin(src_angle) + src_y * np.cos(src_angle))
+    u_x, u_y = np.cos(det_angle) * ones, np.sin(det_angle) * ones
+
+    return src_x, src_y, d_x, d_y, u_x, u_y
+
+
+def _inline_3d(t, alpha, detector_cells, object_depth, vert_shift, direction, rotation):
+    h = (detector_cells / 2) / np.tan(np.radians(alpha / 2))
+    offset = -350
+    ones = np.ones_like(t)
+    cos, sin = np.cos(np.radians(rotation)) * ones, np.sin(np.radians(rotation)) * ones
+
+    start = direction * (-offset - detector_cells / 2)
+    src_x = start - 2 * start * t
+    z = h - object_depth / 2
+    src_z, src_y = z * cos, vert_shift + z * sin
+
+    d_x = src_x.copy()
+    z = -object_depth / 2
+    d_z, d_y = z * cos, vert_shift + z * sin
+
+    zeros = np.zeros_like(t)
+    return src_x, src_y, src_z, d_x, d_y, d_z, ones, zeros, zeros, zeros, cos, sin
+
+
+def _semi_circular(t, radius, src_dist, det_dist):
+    alpha = np.radians(60) + (np.radians(120) - np.radians(60)) * t
+    src_x = (src_dist + radius) - np.sin(alpha) * radius
+    src_y = -np.cos(alpha) * radius
+    d_x = (radius - det_dist) - np.sin(alpha) * radius
+    d_y = src_y.copy()
+    return src_x, src_y, d_x, d_y, np.cos(-alpha), np.sin(-alpha)
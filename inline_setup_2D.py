@@ -8,8 +8,8 @@
 # numpy_version   :1.13.3
 # ==============================================================================
 
-from math import floor, radians, tan, atan2, sin, cos
 import numpy as np
+from geometry_builder import inline_geometry_2d
 
 
 class InlineScanningSetup2D:
@@ -38,41 +38,7 @@ class InlineScanningSetup2D:
         acquisition.
         """
         self.det_size = detector_cells
-        h = (detector_cells / 2) / tan(radians(alpha / 2))
-
-        # src: the ray source
-        srcX = np.linspace(-detector_cells / 2, detector_cells / 2, num=number_of_projections)
-        srcY = np.linspace(h - object_size / 2, h - object_size / 2, num=number_of_projections)
-
-        # d :  the center of the detector
-        dX = np.linspace(-detector_cells / 2, detector_cells / 2, num=number_of_projections)
-        #dY = np.linspace(-object_size / 2 , -object_size / 2, num=number_of_projections)
-        dY = np.linspace(-100, -100, num=number_of_projections)
-
-        # u :  the vector between the centers of detector pixels 0 and 1
-        uX = np.linspace(1, 1, num=number_of_projections)
-        uY = np.linspace(0, 0, num=number_of_projections)
-        # pdb.set_trace()
-
-        if omega_total > 0:
-
-            omega = radians(omega_total / number_of_projections)
-
-            for p in range(number_of_projections):
-                retro = number_of_projections - p - 1
-
-                alfa_zero = atan2(srcY[retro], srcX[retro])
-                d = (srcY[retro] ** 2 + srcX[retro] ** 2) ** 0.5
-
-                alfa_atual = p * omega + alfa_zero
-
-                srcY[retro] = d * sin(alfa_atual)
-                srcX[retro] = d * cos(alfa_atual)
-
-                uY[p] = sin(p * omega)
-                uX[p] = cos(p * omega)
-
-        self.geometry_matrix = np.column_stack((srcX, srcY, dX, dY, uX, uY))
+        self.geometry_matrix = inline_geometry_2d(alpha, detector_cells, number_of_projections, object_size, omega_total)
 
     def get_geometry_matrix(self):
         """
@@ -1,6 +1,5 @@
-from math import floor, radians, tan, atan2, sin, cos
 import numpy as np
-import random
+from geometry_builder import inline_geometry_3d
 
 class InlineScanningSetup3D:
     """
@@ -28,48 +27,8 @@ class InlineScanningSetup3D:
         acquisition.
         """
 
-        #h = (125) / tan(radians(alpha / 2))
-        h = (detector_cells / 2) / tan(radians(alpha / 2))
-        offset = -350
-
-
-
-        # src: the ray source
-        if tg_dir == "left":
-            srcX = np.linspace(-offset-detector_cells/2, offset+detector_cells/2, num=number_of_projections)
-            #srcX = np.linspace(-125, 125, num=number_of_projections)
-        else:
-            srcX = np.linspace(offset+detector_cells/2, -offset-detector_cells/2, num=number_of_projections)
-            #srcX = np.linspace(125, -125, num=number_of_projections)
-
-        z = h - object_size[2]/2
-        srcZ = np.linspace(z*np.cos(np.deg2rad(rotation)), z*np.cos(np.deg2rad(rotation)), num=number_of_projections)
-        srcY = np.linspace(vert_shift+z*np.sin(np.deg2rad(rotation)),vert_shift+z*np.sin(np.deg2rad(rotation)), num=number_of_projections)
-
-        # d :  the center of the detector
-        if tg_dir == "left":
-            dX = np.linspace(-offset-detector_cells/2, offset+detector_cells/2, num=number_of_projections)
-            #dX = np.linspace(-125,125, num=number_of_projections)
-        else:
-            dX = np.linspace(offset+detector_cells/2, -offset-detector_cells/2, num=number_of_projections)
-            #dX = np.linspace(125, -125, num=number_of_projections)
-
-        z = -object_size[2] / 2
-        dZ = np.linspace(z*np.cos(np.deg2rad(rotation)), z*np.cos(np.deg2rad(rotation)), num=number_of_projections)
-        dY = np.linspace(vert_shift+z*np.sin(np.deg2rad(rotation)), vert_shift+z*np.sin(np.deg2rad(rotation)), num=number_of_projections)
-
-        # u :  the vector between the centers of detector pixels 0 and 1
-        uX = np.linspace(1, 1, num=number_of_projections)
-        uY = np.linspace(0, 0, num=number_of_projections)
-        uZ = np.linspace(0, 0, num=number_of_projections)
-        # pdb.set_trace()
-
-        vX = np.linspace(0, 0, num=number_of_projections)
-        vY = np.linspace(np.cos(np.deg2rad(rotation)), np.cos(np.deg2rad(rotation)), num=number_of_projections)
-        vZ = np.linspace(np.sin(np.deg2rad(rotation)), np.sin(np.deg2rad(rotation)), num=number_of_projections)
-
-
-        self.geometry_matrix = np.column_stack((srcX, srcY, srcZ,  dX, dY, dZ, uX, uY, uZ, vX, vY, vZ))
+        self.geometry_matrix = inline_geometry_3d(alpha, detector_cells, number_of_projections, object_size[2],
+                                                  vert_shift=vert_shift, tg_dir=tg_dir, rotation=rotation)
 
     def get_geometry_matrix(self):
         """
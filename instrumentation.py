@@ -0,0 +1,179 @@
+import csv
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+STAGES = ('geometry', 'upload', 'forward', 'rebinning', 'iterations', 'download', 'write')
+
+
+class Trace:
+    """
+    This class records where the time of the scanning objects is spent. Every stage (geometry build, data upload,
+    forward projection, rebinning, iterations, download and write) is recorded with its wall time, the CPU time of the
+    process and the number of bytes it moved; the iterations of the reconstructions are logged with their residuals, and
+    optional callbacks are called every `every` iterations. Traces may be shared by threads.
+    Attributes
+    ----------
+    records     : list
+        One dictionary per stage run: 'stage', 'start' (s since the trace was created), 'wall', 'cpu', 'bytes' and any
+        extra information given to stage();
+    iterations  : list
+        One dictionary per logged iteration: 'iteration', 'residual' and 'time' (s since the trace was created);
+    Methods
+    -------
+    stage(name, nbytes=0, **info)
+        Context manager recording a stage.
+    iteration(iteration, x=None, residual=None)
+        It logs an iteration and calls the callbacks.
+    add_callback(function)
+        It registers a function called as function(iteration, x, residual).
+    mark()
+        It returns a position in the records, to be given to summary().
+    summary(since=0)
+        It totals the wall time, CPU time and bytes of every stage.
+    to_json(path) / to_csv(path)
+        They export the trace.
+    """
+
+    def __init__(self, every=1, log_iterations=True):
+        """
+        It creates a new instance of the class Trace.
+        :param every: number of iterations between two calls of the callbacks;
+        :param log_iterations: keeps the log of iterations (residuals and times) in the trace.
+        """
+        self.every = every
+        self.log_iterations = log_iterations
+        self.records = []
+        self.iterations = []
+        self.callbacks = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return True
+
+    @contextmanager
+    def stage(self, name, nbytes=0, **info):
+        """
+        It records the wall time, CPU time and bytes of the block it wraps.
+        :param name: name of the stage (see STAGES);
+        :param nbytes: number of bytes moved by the stage;
+        :param info: extra values stored in the record;
+        :return: the record, whose 'bytes' may be updated inside the block.
+        """
+        record = dict(stage=name, start=time.perf_counter() - self._origin, bytes=int(nbytes), **info)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall'] = time.perf_counter() - wall
+            record['cpu'] = time.process_time() - cpu
+            with self._lock:
+                self.records.append(record)
+
+    def wants_iterations(self):
+        """
+        It tells whether reconstructions should report their iterations one by one (i.e. some callback is registered).
+        """
+        return bool(self.callbacks)
+
+    def iteration(self, iteration, x=None, residual=None):
+        """
+        It logs an iteration of a reconstruction and calls the callbacks every `every` iterations.
+        :param iteration: number of iterations run so far;
+        :param x: current reconstruction;
+        :param residual: current relative residual, when known.
+        """
+        if self.log_iterations:
+            with self._lock:
+                self.iterations.append({'iteration': iteration, 'residual': residual,
+                                        'time': time.perf_counter() - self._origin})
+        if self.callbacks and iteration % self.every == 0:
+            for function in self.callbacks:
+                function(iteration, x, residual)
+
+    def add_callback(self, function):
+        """
+        It registers a function called as function(iteration, x, residual) every `every` iterations.
+        """
+        self.callbacks.append(function)
+
+    def mark(self):
+        """
+        It returns the number of stages recorded so far, so that summary() can total the stages of a single run.
+        """
+        with self._lock:
+            return len(self.records)
+
+    def summary(self, since=0):
+        """
+        It totals the records of every stage.
+        :param since: position returned by mark(); only the stages recorded after it are totalled;
+        :return: a dictionary stage -> {'count', 'wall', 'cpu', 'bytes'}, in the order of STAGES.
+        """
+        totals = {}
+        with self._lock:
+            records = self.records[since:]
+        for record in records:
+            total = totals.setdefault(record['stage'], {'count': 0, 'wall': 0.0, 'cpu': 0.0, 'bytes': 0})
+            total['count'] += 1
+            for field in ('wall', 'cpu', 'bytes'):
+                total[field] += record[field]
+        order = {name: position for position, name in enumerate(STAGES)}
+        return dict(sorted(totals.items(), key=lambda item: order.get(item[0], len(STAGES))))
+
+    def to_json(self, path):
+        """
+        It writes the records, the iteration log and the summary into a JSON file.
+        """
+        with self._lock:
+            trace = {'records': list(self.records), 'iterations': list(self.iterations)}
+        trace['summary'] = self.summary()
+        with open(path, 'w') as file:
+            json.dump(trace, file, indent=1)
+
+    def to_csv(self, path):
+        """
+        It writes one line per stage record into a CSV file.
+        """
+        with self._lock:
+            records = list(self.records)
+        fields = ['stage', 'start', 'wall', 'cpu', 'bytes']
+        fields += sorted({name for record in records for name in record} - set(fields))
+        with open(path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(records)
+
+
+class NullTrace:
+    """
+    This class has the methods of Trace and records nothing; it is used when no trace is requested.
+    """
+
+    def __bool__(self):
+        return False
+
+    @contextmanager
+    def stage(self, name, nbytes=0, **info):
+        yield {}
+
+    def wants_iterations(self):
+        return False
+
+    def mark(self):
+        return 0
+
+    def iteration(self, iteration, x=None, residual=None):
+        pass
+
+
+NULL_TRACE = NullTrace()
+
+
+def nbytes(value):
+    """
+    It returns the size in bytes of an array (0 for the other values, such as ASTRA ids).
+    """
+    return int(getattr(value, 'nbytes', 0))
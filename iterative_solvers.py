@@ -0,0 +1,470 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from cpu_projector import RayDrivenProjector
+from fdk import fdk, fit_scale
+
+ITERATIVE_ALGORITHMS = ('SIRT', 'CGLS', 'SART')
+ANALYTIC_ALGORITHMS = ('FBP', 'FDK')
+
+_weight_cache = OrderedDict()
+_weight_lock = threading.Lock()
+WEIGHT_CACHE_BYTES = 2 ** 30
+
+
+class CPUOperator:
+    """
+    This class is the matrix-free projection operator A of a geometry computed by the CPU ray-driven projector.
+    Attributes
+    ----------
+    vol_shape   : tuple
+        Shape of the volume arrays, as in ASTRA;
+    sino_shape  : tuple
+        Shape of the sinogram arrays, as in ASTRA;
+    proj_axis   : int
+        Axis of the sinogram arrays indexing the projections;
+    key         : str
+        Hash of the geometry (see geometry_key), used to cache the weights of the operator;
+    Methods
+    -------
+    forward(volume)
+        It computes A x (for a volume or a stack of volumes along the leading axes).
+    backward(sinogram)
+        It computes A^T y (for a sinogram or a stack of sinograms along the leading axes).
+    subset(projections)
+        It returns the operator restricted to a subset of the projections.
+    close()
+        It stops the threads of the projector.
+    """
+
+    def __init__(self, proj_geom, vol_geom, **projector_options):
+        """
+        It creates a new instance of the class CPUOperator.
+        :param proj_geom: ASTRA projection geometry ('fanflat_vec' or 'cone_vec');
+        :param vol_geom: ASTRA volume geometry;
+        :param projector_options: keyword arguments forwarded to RayDrivenProjector.
+        """
+        self.proj_geom = proj_geom
+        self.vol_geom = vol_geom
+        self.projector_options = projector_options
+        self.projector = RayDrivenProjector(proj_geom, vol_geom, **projector_options)
+        self.vol_shape = self.projector.vol_shape
+        self.sino_shape = self.projector.sino_shape
+        self.proj_axis = 0 if self.projector.ndim == 2 else 1
+        self.key = geometry_key(proj_geom, vol_geom, 'cpu', projector_options.get('step', 0.5))
+
+    def forward(self, volume):
+        return self.projector.forward(volume)
+
+    def backward(self, sinogram):
+        return self.projector.backward(sinogram)
+
+    def subset(self, projections):
+        return CPUOperator(select_projections(self.proj_geom, projections), self.vol_geom, **self.projector_options)
+
+    def close(self):
+        """
+        It stops the threads of the projector.
+        """
+        self.projector.close()
+
+
+class AstraOperator:
+    """
+    This class is the matrix-free projection operator A of a geometry computed by the CUDA projectors of ASTRA Toolbox,
+    through astra.OpTomo. It provides the same methods as CPUOperator.
+    """
+
+    def __init__(self, proj_geom, vol_geom):
+        """
+        It creates a new instance of the class AstraOperator.
+        :param proj_geom: ASTRA projection geometry ('fanflat_vec' or 'cone_vec');
+        :param vol_geom: ASTRA volume geometry.
+        """
+        import astra
+        self.astra = astra
+        self.proj_geom = proj_geom
+        self.vol_geom = vol_geom
+        self.is_3d = proj_geom['type'].startswith('cone') or proj_geom['type'].startswith('parallel3d')
+        self.proj_id = astra.create_projector('cuda3d' if self.is_3d else 'cuda', proj_geom, vol_geom)
+        self.op = astra.OpTomo(self.proj_id)
+        self.vol_shape = tuple(self.op.vshape)
+        self.sino_shape = tuple(self.op.sshape)
+        self.proj_axis = 1 if self.is_3d else 0
+        self.key = geometry_key(proj_geom, vol_geom, 'cuda')
+
+    def forward(self, volume):
+        return _map_stack(lambda v: self.op.FP(v, out=None), volume, self.vol_shape, self.sino_shape)
+
+    def backward(self, sinogram):
+        return _map_stack(lambda s: self.op.BP(s, out=None), sinogram, self.sino_shape, self.vol_shape)
+
+    def subset(self, projections):
+        return AstraOperator(select_projections(self.proj_geom, projections), self.vol_geom)
+
+    def close(self):
+        """
+        It frees the ASTRA projector of the operator; calling it more than once is harmless.
+        """
+        if self.proj_id is not None:
+            (self.astra.projector3d if self.is_3d else self.astra.projector).delete(self.proj_id)
+            self.proj_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def geometry_key(*values):
+    """
+    It computes a canonical hash of geometries and related values, so that the quantities derived from them can be
+    cached: dicts are hashed in key order, arrays and sequences by their float64 contents and numbers by their float
+    value, so that e.g. 64 and 64.0 give the same key.
+    :param values: ASTRA projection and volume geometries, followed by any further values taking part in the hash (e.g.
+    the projector type);
+    :return: the hexadecimal SHA-1 digest.
+    """
+    digest = hashlib.sha1()
+    for value in values:
+        _hash_value(digest, value)
+    return digest.hexdigest()
+
+
+def _hash_value(digest, value):
+    if isinstance(value, dict):
+        for name in sorted(value):
+            digest.update(str(name).encode())
+            _hash_value(digest, value[name])
+    elif isinstance(value, (np.ndarray, list, tuple)):
+        array = np.ascontiguousarray(value, dtype=np.float64)
+        digest.update(str(array.shape).encode() + array.tobytes())
+    elif isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+        digest.update(repr(float(value)).encode())
+    else:
+        digest.update(repr(value).encode())
+
+
+def select_projections(proj_geom, projections):
+    """
+    It restricts a vector projection geometry to a subset of its projections.
+    :param proj_geom: ASTRA vector projection geometry;
+    :param projections: slice (or index array) of the projections to keep, or None to keep all of them;
+    :return: the restricted projection geometry.
+    """
+    if projections is None:
+        return proj_geom
+    selected = dict(proj_geom)
+    selected['Vectors'] = np.asarray(proj_geom['Vectors'])[projections]
+    return selected
+
+
+def operator_weights(operator):
+    """
+    It computes the inverse row and column sums R and C of a projection operator, caching them per geometry so that
+    every reconstruction in the same geometry reuses them. The least recently used entries are dropped once the cache
+    holds more than WEIGHT_CACHE_BYTES. The cache is shared by the threads of the process (e.g. the sweeps and the
+    dataset runner) and guarded by a lock.
+    :param operator: object providing forward(), backward(), vol_shape, sino_shape and key;
+    :return: the tuple (R, C) of float32 arrays with the shapes of a sinogram and of a volume.
+    """
+    key = getattr(operator, 'key', None)
+    if key is not None:
+        with _weight_lock:
+            if key in _weight_cache:
+                _weight_cache.move_to_end(key)
+                return _weight_cache[key]
+
+    # computed outside the lock: threads needing other geometries are not held up, and two threads computing the same
+    # weights store equal arrays
+    row_sum = operator.forward(np.ones(operator.vol_shape, dtype=np.float32))
+    col_sum = operator.backward(np.ones(operator.sino_shape, dtype=np.float32))
+    row_weight = np.divide(1, row_sum, out=np.zeros_like(row_sum), where=row_sum > 1e-6)
+    col_weight = np.divide(1, col_sum, out=np.zeros_like(col_sum), where=col_sum > 1e-6)
+    weights = (row_weight, col_weight)
+
+    if key is not None:
+        with _weight_lock:
+            _weight_cache[key] = weights
+            while len(_weight_cache) > 1 and sum(r.nbytes + c.nbytes for r, c in _weight_cache.values()) > \
+                    WEIGHT_CACHE_BYTES:
+                _weight_cache.popitem(last=False)
+    return weights
+
+
+def sirt(operator, sinogram, n_iterations=100, x0=None, tol=None, update_tol=None, weights=None, callback=None):
+    """
+    It runs the Simultaneous Iterative Reconstruction Technique, x += C A^T R (b - A x), with R and C the inverse row
+    and column sums of the projection operator, as in the SIRT algorithms of ASTRA.
+    :param operator: projection operator (see CPUOperator);
+    :param sinogram: measured projections b, optionally with leading axes holding a stack of sinograms;
+    :param n_iterations: maximum number of iterations;
+    :param x0: initial volume (default: zeros);
+    :param tol: stops once the relative residual ||b - A x|| / ||b|| falls below tol;
+    :param update_tol: stops once the relative update ||dx|| / ||x|| of an iteration falls below update_tol;
+    :param weights: the tuple (R, C) returned by operator_weights() (default: the cached weights of the operator);
+    :param callback: function called after every iteration as callback(iterations, x, residual), with residual the
+    relative residual of x after the iteration (e.g. instrumentation.Trace.iteration);
+    :return: a dictionary containing the reconstructed float32 volume into 'rec' index, the number of iterations
+    actually run into 'iterations' index, and the relative residual of x0 followed by the relative residual after
+    every iteration into 'residuals' index.
+    """
+    return _complete(sirt_steps(operator, sinogram, n_iterations, x0, tol, update_tol, weights), callback)
+
+
+def sirt_steps(operator, sinogram, n_iterations=100, x0=None, tol=None, update_tol=None, weights=None):
+    """
+    It runs sirt() one iteration at a time: the generator yields the tuple (iterations, x, residual) after every
+    iteration, x being the reconstruction itself (not a copy; the next iteration updates it in place), and returns the
+    output of sirt() once it stops. The caller may stop it at any time by leaving the loop.
+    """
+    b, x, batch_axes, b_norm = _prepare(operator, sinogram, x0)
+    row_weight, col_weight = operator_weights(operator) if weights is None else weights
+
+    residual = b - operator.forward(x)
+    residuals, iterations = [_relative(residual, b_norm, batch_axes)], 0
+    while iterations < n_iterations and not (tol is not None and residuals[-1] <= tol):
+        residual *= row_weight
+        update = col_weight * operator.backward(residual)
+        x += update
+        iterations += 1
+        # the residual of the updated volume, which the next iteration starts from
+        residual = b - operator.forward(x)
+        residuals.append(_relative(residual, b_norm, batch_axes))
+        yield iterations, x, residuals[-1]
+        if update_tol is not None and _relative(update, _norm(x, batch_axes), batch_axes) <= update_tol:
+            break
+
+    return {'rec': x, 'iterations': iterations, 'residuals': residuals}
+
+
+def cgls(operator, sinogram, n_iterations=100, x0=None, tol=None, update_tol=None, callback=None):
+    """
+    It runs the Conjugate Gradient method on the normal equations A^T A x = A^T b (CGLS), as in the CGLS algorithms of
+    ASTRA. Every sinogram of a stack is solved with its own step lengths.
+    :param operator: projection operator (see CPUOperator);
+    :param sinogram: measured projections b, optionally with leading axes holding a stack of sinograms;
+    :param n_iterations: maximum number of iterations;
+    :param x0: initial volume (default: zeros);
+    :param tol: stops once the relative residual ||b - A x|| / ||b|| falls below tol;
+    :param update_tol: stops once the relative update ||dx|| / ||x|| of an iteration falls below update_tol;
+    :param callback: function called after every iteration (see sirt());
+    :return: a dictionary as returned by sirt().
+    """
+    return _complete(cgls_steps(operator, sinogram, n_iterations, x0, tol, update_tol), callback)
+
+
+def cgls_steps(operator, sinogram, n_iterations=100, x0=None, tol=None, update_tol=None):
+    """
+    It runs cgls() one iteration at a time, as sirt_steps().
+    """
+    b, x, batch_axes, b_norm = _prepare(operator, sinogram, x0)
+    vol_axes = tuple(range(-len(operator.vol_shape), 0))
+    sino_axes = tuple(range(-len(operator.sino_shape), 0))
+
+    residual = b - operator.forward(x)
+    gradient = operator.backward(residual)
+    direction = gradient.copy()
+    gamma = np.sum(gradient * gradient, axis=vol_axes, keepdims=True)
+
+    residuals, iterations = [_relative(residual, b_norm, batch_axes)], 0
+    while iterations < n_iterations and not (tol is not None and residuals[-1] <= tol):
+        projected = operator.forward(direction)
+        energy = np.sum(projected * projected, axis=sino_axes, keepdims=True).reshape(gamma.shape)
+        alpha = np.divide(gamma, energy, out=np.zeros_like(gamma), where=energy > 0)
+        x += alpha * direction
+        residual -= alpha.reshape(alpha.shape[:-len(vol_axes)] + (1,) * len(sino_axes)) * projected
+        iterations += 1
+        residuals.append(_relative(residual, b_norm, batch_axes))
+        yield iterations, x, residuals[-1]
+        if update_tol is not None and _relative(alpha * direction, _norm(x, batch_axes), batch_axes) <= update_tol:
+            break
+
+        gradient = operator.backward(residual)
+        gamma_next = np.sum(gradient * gradient, axis=vol_axes, keepdims=True)
+        beta = np.divide(gamma_next, gamma, out=np.zeros_like(gamma), where=gamma > 0)
+        direction = gradient + beta * direction
+        gamma = gamma_next
+
+    return {'rec': x, 'iterations': iterations, 'residuals': residuals}
+
+
+def sart(operator, sinogram, n_iterations=100, x0=None, tol=None, update_tol=None, n_subsets=None, relaxation=1.0,
+         callback=None):
+    """
+    It runs the Simultaneous Algebraic Reconstruction Technique with ordered subsets: the SIRT update is applied to one
+    subset of projections at a time, subset s holding projections s, s + n_subsets, s + 2 * n_subsets, ... Unlike the
+    SART algorithms of ASTRA, an iteration is a sweep over every subset.
+    :param operator: projection operator (see CPUOperator), providing subset();
+    :param sinogram: measured projections b, optionally with leading axes holding a stack of sinograms;
+    :param n_iterations: maximum number of sweeps;
+    :param x0: initial volume (default: zeros);
+    :param tol: stops once the relative residual ||b - A x|| / ||b|| after a sweep falls below tol;
+    :param update_tol: stops once the relative update ||dx|| / ||x|| of a sweep falls below update_tol;
+    :param n_subsets: number of subsets (default: one per projection);
+    :param relaxation: relaxation factor of the updates;
+    :param callback: function called after every sweep (see sirt()), with residual None when tol is not given;
+    :return: a dictionary as returned by sirt(), with one residual per sweep when tol is given.
+    """
+    return _complete(sart_steps(operator, sinogram, n_iterations, x0, tol, update_tol, n_subsets, relaxation), callback)
+
+
+def sart_steps(operator, sinogram, n_iterations=100, x0=None, tol=None, update_tol=None, n_subsets=None,
+               relaxation=1.0):
+    """
+    It runs sart() one sweep at a time, as sirt_steps(); the residual is None when tol is not given.
+    """
+    b, x, batch_axes, b_norm = _prepare(operator, sinogram, x0)
+    n_proj = operator.sino_shape[operator.proj_axis]
+    n_subsets = n_proj if n_subsets is None else min(n_subsets, n_proj)
+    axis = len(batch_axes) + operator.proj_axis
+
+    subsets = []
+    try:
+        for s in range(n_subsets):
+            projections = np.arange(s, n_proj, n_subsets)
+            subsets.append((operator.subset(projections), np.take(b, projections, axis=axis)))
+
+        residuals, iterations = [], 0
+        while iterations < n_iterations:
+            previous = x.copy() if update_tol is not None else None
+            for sub_operator, sub_sinogram in subsets:
+                row_weight, col_weight = operator_weights(sub_operator)
+                residual = sub_sinogram - sub_operator.forward(x)
+                residual *= row_weight
+                x += relaxation * col_weight * sub_operator.backward(residual)
+            iterations += 1
+
+            if tol is not None:
+                residuals.append(_relative(b - operator.forward(x), b_norm, batch_axes))
+            yield iterations, x, residuals[-1] if tol is not None else None
+            if tol is not None and residuals[-1] <= tol:
+                break
+            if update_tol is not None and _relative(x - previous, _norm(x, batch_axes), batch_axes) <= update_tol:
+                break
+    finally:
+        for sub_operator, _ in subsets:
+            sub_operator.close()
+
+    return {'rec': x, 'iterations': iterations, 'residuals': residuals}
+
+
+def fbp(operator, sinogram, n_iterations=1, x0=None, tol=None, update_tol=None, callback=None, filter_name='ram-lak'):
+    """
+    It reconstructs in one pass with the filtered backprojection of fdk.py, for any vector geometry, with the interface
+    of the iterative solvers so that the sessions accept the FBP and FDK algorithm names. The volume is scaled by
+    fdk.fit_scale(), so that it can warm-start an iterative solver; n_iterations, x0, tol and update_tol are ignored.
+    :param operator: projection operator (see CPUOperator), providing the geometries;
+    :param sinogram: measured projections b, optionally with leading axes holding a stack of sinograms;
+    :param callback: function called once as callback(1, x, residual);
+    :param filter_name: window of the ramp filter (see fdk.FILTERS);
+    :return: a dictionary containing the reconstructed float32 volume into 'rec' index, 1 into 'iterations' index, and
+    the relative residual of the result into 'residuals' index.
+    """
+    return _complete(fbp_steps(operator, sinogram, n_iterations, x0, tol, update_tol, filter_name), callback)
+
+
+def fbp_steps(operator, sinogram, n_iterations=1, x0=None, tol=None, update_tol=None, filter_name='ram-lak'):
+    """
+    It runs fbp() as a step generator (see sirt_steps), yielding its only iteration.
+    """
+    b, x, batch_axes, b_norm = _prepare(operator, sinogram, None)
+    x = _map_stack(lambda item: fdk(operator.proj_geom, operator.vol_geom, item, filter_name), b,
+                   operator.sino_shape, operator.vol_shape)
+    stack = zip(x.reshape((-1,) + tuple(operator.vol_shape)), b.reshape((-1,) + tuple(operator.sino_shape)))
+    for volume, data in stack:
+        fit_scale(operator, volume, data)
+    residual = _relative(b - operator.forward(x), b_norm, batch_axes)
+    yield 1, x, residual
+    return {'rec': x, 'iterations': 1, 'residuals': [residual]}
+
+
+def get_solver(algorithm, steps=False):
+    """
+    It maps the name of an ASTRA algorithm (e.g. SIRT_CUDA, CGLS3D_CUDA, SART or FDK_CUDA) to the solver of this
+    module.
+    :param algorithm: name of the algorithm;
+    :param steps: returns the generator running the solver one iteration at a time (e.g. sirt_steps) instead;
+    :return: the solver function.
+    """
+    name = algorithm.upper()
+    for prefix, solver, solver_steps in (('SIRT', sirt, sirt_steps), ('CGLS', cgls, cgls_steps),
+                                         ('SART', sart, sart_steps), ('FBP', fbp, fbp_steps),
+                                         ('FDK', fbp, fbp_steps)):
+        if name.startswith(prefix):
+            return solver_steps if steps else solver
+    raise ValueError("Algorithm '{}' is not available ({})".format(
+        algorithm, ', '.join(ITERATIVE_ALGORITHMS + ANALYTIC_ALGORITHMS)))
+
+
+def progressive(steps, every=10):
+    """
+    It yields the state of a reconstruction run by a step generator (e.g. sirt_steps) every `every` iterations and once
+    it stops, so that the caller can use intermediate results or stop early, e.g. when a time budget runs out.
+    :param steps: generator returned by sirt_steps(), cgls_steps() or sart_steps();
+    :param every: number of iterations between two yielded states;
+    :return: a generator yielding dictionaries containing the current reconstruction into 'rec' index (a view updated in
+    place by the next iterations), the number of iterations run into 'iterations' index, the last relative residual
+    computed into 'residual' index and the time spent since the start into 'time' index.
+    """
+    start_time, last = time.time(), None
+    while True:
+        try:
+            iterations, x, residual = next(steps)
+        except StopIteration as stop:
+            result = stop.value
+            break
+        if iterations % every == 0:
+            last = iterations
+            yield {'rec': x, 'iterations': iterations, 'residual': residual, 'time': time.time() - start_time}
+
+    if result['iterations'] != last:
+        residual = result['residuals'][-1] if result['residuals'] else None
+        yield {'rec': result['rec'], 'iterations': result['iterations'], 'residual': residual,
+               'time': time.time() - start_time}
+
+
+def _complete(steps, callback):
+    """
+    It runs a step generator to its end, calling callback(iterations, x, residual) after every iteration.
+    """
+    while True:
+        try:
+            state = next(steps)
+        except StopIteration as stop:
+            return stop.value
+        if callback is not None:
+            callback(*state)
+
+
+def _prepare(operator, sinogram, x0):
+    b = np.asarray(sinogram, dtype=np.float32)
+    batch = b.shape[:b.ndim - len(operator.sino_shape)]
+    x = np.zeros(batch + tuple(operator.vol_shape), dtype=np.float32) if x0 is None else np.array(x0, dtype=np.float32)
+    batch_axes = tuple(range(len(batch)))
+    return b, x, batch_axes, _norm(b, batch_axes)
+
+
+def _norm(array, batch_axes):
+    """
+    It computes the norm of every array of a stack (the leading batch_axes index the stack).
+    """
+    return np.sqrt(np.sum(np.square(array, dtype=np.float64), axis=tuple(range(len(batch_axes), array.ndim))))
+
+
+def _relative(array, reference, batch_axes):
+    """
+    It computes the largest ratio between the norm of an array of a stack and its reference norm.
+    """
+    norm = _norm(array, batch_axes)
+    return float(np.max(np.divide(norm, reference, out=np.zeros_like(norm), where=reference > 0)))
+
+
+def _map_stack(function, data, shape, out_shape):
+    data = np.asarray(data, dtype=np.float32)
+    batch = data.shape[:data.ndim - len(shape)]
+    flat = data.reshape((-1,) + tuple(shape))
+    return np.stack([function(item) for item in flat]).reshape(batch + tuple(out_shape))
@@ -0,0 +1,71 @@
+import numpy as np
+from instrumentation import NULL_TRACE, nbytes
+from projector_backend import check_float32
+
+
+def motion_blurred_sinogram(backend, phantom, n_projections, supersampling, block_projs=None,
+                            memory_budget=512 * 2 ** 20, trace=NULL_TRACE, first_projection=0, out=None):
+    """
+    It simulates a continuous acquisition in which every projection integrates the object over `supersampling`
+    sub-positions of the conveyor belt. The sub-positions are forward projected in blocks into a single reused buffer
+    and averaged in place into the final float32 sinogram, so the peak memory grows with n_projections and not with
+    n_projections * supersampling, and nothing else is allocated per block.
+    :param backend: projector backend (see projector_backend.py) whose geometry holds n_projections * supersampling
+    consecutive sub-positions;
+    :param phantom: C-contiguous float32 volume in the ASTRA layout of the backend volume geometry;
+    :param n_projections: number of projections of the blurred sinogram;
+    :param supersampling: number S of sub-positions averaged into each projection;
+    :param block_projs: number of output projections simulated per block (default: derived from memory_budget);
+    :param memory_budget: upper bound (in bytes) on the size of the sub-position sinogram of a block;
+    :param trace: instrumentation.Trace recording the upload, forward and rebinning stages;
+    :param first_projection: index of the first projection to simulate, so that a part of the acquisition (e.g. one
+    stage of a multi-stage setup) is simulated on its own;
+    :param out: float32 array of shape (detector rows, n_projections, detector cols) receiving the sinogram, e.g. the
+    sinogram buffer of a session (default: a new array);
+    :return: the float32 sinogram of shape (detector rows, n_projections, detector cols).
+    """
+    rows, cols = backend.proj_geom['DetectorRowCount'], backend.proj_geom['DetectorColCount']
+    if block_projs is None:
+        block_projs = max(1, memory_budget // (rows * cols * 4 * supersampling))
+
+    if out is None:
+        sinogram = np.zeros((rows, n_projections, cols), dtype=np.float32)
+    else:
+        sinogram = check_float32(out, (rows, n_projections, cols), 'out')
+    # the blocks are C-contiguous prefixes of one buffer, so the projector writes them without copies
+    buffer = np.empty(rows * min(block_projs, n_projections) * supersampling * cols, dtype=np.float32)
+    with trace.stage('upload', nbytes(phantom)):
+        volume = backend.upload(phantom)
+    try:
+        for start in range(0, n_projections, block_projs):
+            stop = min(start + block_projs, n_projections)
+            with trace.stage('forward') as record:
+                first, last = (first_projection + start) * supersampling, (first_projection + stop) * supersampling
+                sub = buffer[:rows * (last - first) * cols].reshape(rows, last - first, cols)
+                backend.forward(volume, projections=slice(first, last), out=sub)
+                record['bytes'] = sub.nbytes
+            with trace.stage('rebinning', sub.nbytes):
+                block = sinogram[:, start:stop, :]
+                np.sum(sub.reshape(rows, stop - start, supersampling, cols), axis=2, out=block)
+                block /= supersampling
+    finally:
+        backend.release(volume)
+
+    return sinogram
+
+
+def rebinned_geometry(geometry_matrix, supersampling):
+    """
+    It averages the vectors of every group of `supersampling` consecutive sub-positions, which gives the geometry used
+    to reconstruct a motion-blurred sinogram: each projection is the mean over its S sub-positions, so its geometry is
+    centred on them for any S (a single row, e.g. the S / 2-th, is off-centre by half a sub-position when S is even).
+    :param geometry_matrix: vector geometry with one row per sub-position;
+    :param supersampling: number S of sub-positions per projection;
+    :return: the geometry matrix with one row per projection.
+    """
+    geometry_matrix = np.asarray(geometry_matrix)
+    supersampling = int(supersampling)
+    if len(geometry_matrix) % supersampling:
+        raise ValueError("Expected a multiple of {} sub-positions, got {}".format(supersampling, len(geometry_matrix)))
+    groups = geometry_matrix.reshape(-1, supersampling, geometry_matrix.shape[1])
+    return np.ascontiguousarray(groups.mean(axis=1, dtype=np.float64).astype(geometry_matrix.dtype))
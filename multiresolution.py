@@ -0,0 +1,156 @@
+import time
+import numpy as np
+from scipy.ndimage import zoom
+from projector_backend import create_backend
+from footprint import vol_shape
+from instrumentation import NULL_TRACE
+
+
+def coarse_geometry(proj_geom, vol_geom, factor):
+    """
+    It builds the geometries of a reconstruction level binned by `factor`: blocks of factor x factor detector pixels
+    (factor pixels in 2D) are merged and the volume grid has factor times fewer voxels along every axis. The whole
+    scene is then scaled by 1 / factor, so the coarse voxels and pixels keep the size of the original ones: the source
+    and detector positions and the volume window are rescaled while the pixel vectors are unchanged. The detector pixels
+    that do not fill a whole block are dropped evenly from both borders (see bin_sinogram).
+    :param proj_geom: ASTRA projection geometry ('fanflat_vec' or 'cone_vec');
+    :param vol_geom: ASTRA volume geometry;
+    :param factor: integer binning factor;
+    :return: the tuple (coarse projection geometry, coarse volume geometry).
+    """
+    vectors = np.array(proj_geom['Vectors'], dtype=np.float64)
+    coarse = dict(proj_geom)
+    if proj_geom['type'] == 'fanflat_vec':
+        coarse['DetectorCount'] = _bin_axis(vectors, slice(2, 4), slice(4, 6), proj_geom['DetectorCount'], factor)
+        vectors[:, 0:4] /= factor
+    else:
+        det = slice(3, 6)
+        coarse['DetectorColCount'] = _bin_axis(vectors, det, slice(6, 9), proj_geom['DetectorColCount'], factor)
+        coarse['DetectorRowCount'] = _bin_axis(vectors, det, slice(9, 12), proj_geom['DetectorRowCount'], factor)
+        vectors[:, 0:6] /= factor
+    coarse['Vectors'] = vectors.astype(np.asarray(proj_geom['Vectors']).dtype)
+    return coarse, coarse_vol_geom(vol_geom, factor)
+
+
+def _bin_axis(vectors, det, pixel, count, factor):
+    # moves the detector centre to the centre of the pixels kept by the binning, and returns the binned pixel count
+    binned, rest = divmod(int(count), factor)
+    if binned == 0:
+        raise ValueError("Cannot bin {} detector pixels by a factor {}".format(count, factor))
+    vectors[:, det] += (rest // 2 - rest / 2) * vectors[:, pixel]
+    return binned
+
+
+def coarse_vol_geom(vol_geom, factor):
+    """
+    It builds the volume geometry of a reconstruction level binned by `factor` (see coarse_geometry): every axis has
+    ceil(n / factor) voxels, centred on the original volume, in the scene scaled by 1 / factor.
+    :param vol_geom: ASTRA volume geometry;
+    :param factor: integer binning factor;
+    :return: the coarse ASTRA volume geometry.
+    """
+    option = dict(vol_geom.get('option', {}))
+    coarse = dict(vol_geom, option=option)
+    axes = [('X', 'GridColCount'), ('Y', 'GridRowCount')]
+    if 'GridSliceCount' in vol_geom:
+        axes.append(('Z', 'GridSliceCount'))
+    for axis, count in axes:
+        n = vol_geom[count]
+        low, high = option.get('WindowMin' + axis, -n / 2), option.get('WindowMax' + axis, n / 2)
+        coarse[count] = -(-n // factor)
+        centre, half = (low + high) / 2 / factor, (high - low) / n * coarse[count] / 2
+        option['WindowMin' + axis], option['WindowMax' + axis] = centre - half, centre + half
+    return coarse
+
+
+def bin_sinogram(sinogram, proj_geom, factor):
+    """
+    It bins a sinogram for the coarse geometry of coarse_geometry(): blocks of detector pixels are averaged, and the
+    result is divided by factor because the rays of the scaled scene are factor times shorter, so that the coarse
+    reconstruction has the attenuation values of the original one.
+    :param sinogram: sinogram in the ASTRA layout of proj_geom;
+    :param proj_geom: ASTRA projection geometry of the sinogram;
+    :param factor: integer binning factor;
+    :return: the C-contiguous float32 binned sinogram.
+    """
+    sinogram = np.asarray(sinogram, dtype=np.float32)
+    if proj_geom['type'] == 'fanflat_vec':
+        n_proj, cols = sinogram.shape
+        start, binned = (cols % factor) // 2, cols // factor
+        block = sinogram[:, start:start + binned * factor].reshape(n_proj, binned, factor)
+        axes = (2,)
+    else:
+        rows, n_proj, cols = sinogram.shape
+        row, col = (rows % factor) // 2, (cols % factor) // 2
+        block = sinogram[row:row + rows // factor * factor, :, col:col + cols // factor * factor]
+        block = block.reshape(rows // factor, factor, n_proj, cols // factor, factor)
+        axes = (1, 4)
+    return np.ascontiguousarray(block.mean(axis=axes, dtype=np.float32) / factor)
+
+
+def upsample_volume(volume, factor, shape):
+    """
+    It interpolates a reconstruction onto a grid factor times finer, centred on it, to start the next level.
+    :param volume: reconstruction of a level;
+    :param factor: integer ratio between the voxel sizes of the two levels;
+    :param shape: shape of the volume of the next level (at most factor times the shape of volume);
+    :return: the C-contiguous float32 volume of the given shape.
+    """
+    fine = zoom(np.asarray(volume, dtype=np.float32), factor, order=1, mode='nearest', grid_mode=True)
+    start = [(size - target) // 2 for size, target in zip(fine.shape, shape)]
+    return np.ascontiguousarray(fine[tuple(slice(s, s + target) for s, target in zip(start, shape))])
+
+
+def coarse_to_fine(backend_name, proj_geom, vol_geom, sinogram, factors=(4, 2, 1), n_iterations=(20, 20, 200),
+                   algorithm='SIRT3D_CUDA', tol=None, update_tol=None, trace=None, backend=None):
+    """
+    It reconstructs a volume level by level, from a binned detector and a coarse volume to the full resolution: every
+    level runs the iterative algorithm on the binned sinogram and the coarse geometries of coarse_geometry(), starting
+    from the upsampled reconstruction of the previous level, so the full-resolution level only refines a volume that is
+    already close to the solution and needs a fraction of the iterations of a reconstruction from zero. The binned
+    sinogram matches the coarse geometry only approximately (the rays of a block are averaged), so the coarse levels
+    should run few iterations: they recover the low frequencies quickly and start fitting the mismatch afterwards.
+    :param backend_name: projector backend, 'cuda', 'cpu' or 'sparse' (see projector_backend.py);
+    :param proj_geom: ASTRA projection geometry of the sinogram;
+    :param vol_geom: ASTRA volume geometry of the reconstruction;
+    :param sinogram: projections in the ASTRA layout of proj_geom;
+    :param factors: binning factors of the levels, from the coarsest to 1; each one is a multiple of the next;
+    :param n_iterations: maximum number of iterations of every level (or of all the levels);
+    :param algorithm: name of the iterative algorithm (e.g. SIRT3D_CUDA, SIRT_CUDA or CGLS3D_CUDA);
+    :param tol: stops the iterations of a level once the relative residual ||b - A x|| / ||b|| falls below it;
+    :param update_tol: stops the iterations of a level once the relative update falls below it;
+    :param trace: instrumentation.Trace recording the stages of every level, or None;
+    :param backend: backend of proj_geom and vol_geom, reused by the full-resolution level (default: a new one);
+    :return: a generator yielding, after each level, a dictionary containing the reconstructed volume of the level into
+    'rec' index, the time spent by the level into 'time' index, the number of iterations run into 'iterations' index and
+    the binning factor of the level into 'factor' index.
+    """
+    trace = NULL_TRACE if trace is None else trace
+    factors = [int(f) for f in factors]
+    if factors[-1] != 1 or any(coarse % fine for coarse, fine in zip(factors, factors[1:])):
+        raise ValueError("Expected binning factors ending with 1, each a multiple of the next, got {}".format(factors))
+    if np.ndim(n_iterations) == 0:
+        n_iterations = [n_iterations] * len(factors)
+
+    rec, previous = None, None
+    for factor, iterations in zip(factors, n_iterations):
+        if factor == 1:
+            level_geom, level_vol_geom, level_sinogram = proj_geom, vol_geom, sinogram
+        else:
+            with trace.stage('geometry'):
+                level_geom, level_vol_geom = coarse_geometry(proj_geom, vol_geom, factor)
+            with trace.stage('rebinning', np.asarray(sinogram).nbytes):
+                level_sinogram = bin_sinogram(sinogram, proj_geom, factor)
+        if factor != 1 or backend is None:
+            with trace.stage('geometry'):
+                level_backend = create_backend(backend_name, level_geom, level_vol_geom)
+        else:
+            level_backend = backend
+
+        start_time = time.time()
+        x0 = None if rec is None else upsample_volume(rec, previous // factor, vol_shape(level_vol_geom))
+        with level_backend.session(algorithm, iterations, tol=tol, update_tol=update_tol, trace=trace) as session:
+            output = session.reconstruct(level_sinogram, x0=x0)
+        rec, previous = output['rec'], factor
+        output.update(time=time.time() - start_time, factor=factor)
+        yield output
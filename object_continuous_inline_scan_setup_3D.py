@@ -13,13 +13,18 @@
 # pilow_version         :5.4.1
 # ==============================================================================
 
-from imageio import imread, imwrite
 from inline_setup_3D import InlineScanningSetup3D
-import astra
+from projector_backend import create_backend, create_vol_geom, create_proj_geom
+from motion_blur import motion_blurred_sinogram, rebinned_geometry
+from volume_store import load_slices
+from result_writer import ResultWriter
+from instrumentation import NULL_TRACE
+from footprint import CroppedSession, crop_detector, trimmed_detector, roi_geometry, vol_shape, pad_volume
+from multiresolution import coarse_to_fine
+from fdk import warm_start
 import time
 import numpy as np
 import os
-from scipy.io import savemat
 from matplotlib import pyplot as plt
 
 
@@ -35,71 +40,223 @@ class InlineContinuousScanningObject3D:
         It holds the scanning geometry to be used;
     vol_geom    : dict
         It holds the characteristics of the reconstruction volume;
+    backend     : object
+        It holds the projector backend that simulates the acquisition in the oversampled geometry;
+    roi         : tuple
+        It holds the slices of the voxels crossed by the rays (see footprint.py), or None when the whole grid is used;
+    trace       : Trace
+        It records the stages of the setup (see instrumentation.py);
     Methods
     -------
-    run(phantom_param, rec_algorithm_param='SIRT_CUDA', n_iterations_param=100)
-        It executes an image reconstruction using the projections acquired in the inline setup.
+    session(n_iterations_param=700, tol_param=None, update_tol_param=None)
+        It opens a session that reuses the reconstruction objects across many phantoms.
+    run(phantom_param, tol_param=None, update_tol_param=None, warm_start_param=False)
+        It executes an image reconstruction using the projections acquired in the inline setup, in a session of
+        session().
+    run_fdk(phantom_param, filter_param='hann')
+        It reconstructs the volume in one pass with a filtered backprojection, as a preview or a warm start.
+    run_progressive(phantom_param, n_iterations_param=700, every_param=10)
+        It yields the reconstruction every every_param iterations, so that it can be stopped early.
+    run_multiresolution(phantom_param, factors_param=(4, 2, 1), n_iterations_param=(20, 20, 200))
+        It reconstructs the volume coarse to fine, from a binned detector and a coarse grid to the full resolution.
     """
 
-    def __init__(self, alpha_param, n_cells_param, n_proj_param, rec_size_param, vert_shift=0, tg_dir="left"):
+    def __init__(self, alpha_param, n_cells_param, n_proj_param, rec_size_param, vert_shift=0, tg_dir="left", backend='cuda',
+                 supersampling=1, block_projs=None, cache=None, trace=None, crop_roi=False,
+                 trim_detector=False):
         """
         It creates a new instance of the class ScanningExecution.
         :param alpha_param: fan-beam opening angle of the X-ray source used in the inline CT setup;
         :param n_cells_param: number of detector elements used in the inline CT setup;
         :param n_proj_param: number of X-ray projections aquired during the object movement;
-        :param rec_size_param: number W of pixels of the W x W reconstruction grid;
-        :param omega_rotation: total object rotation (in degrees) around its own axis between the first and the last projection
-        acquisition.
+        :param rec_size_param: size (rows, cols, slices) of the reconstruction grid;
+        :param vert_shift: vertical shift of the source and detector;
+        :param tg_dir: direction of the conveyor belt, "left" or any other value for right;
+        :param backend: projector backend, 'cuda' (ASTRA Toolbox) or 'cpu' (see projector_backend.py);
+        :param supersampling: number S of belt sub-positions averaged into each projection to model motion blur;
+        :param block_projs: number of projections simulated at once (default: bounded by the memory of the sub-positions);
+        :param cache: ResultCache consulted by run() and by the sessions (see result_cache.py), or None;
+        :param trace: instrumentation.Trace recording the stages of the setup, its sessions and runs, or None;
+        :param crop_roi: simulates and reconstructs only the voxels crossed by the rays, padding the reconstructions
+        back to the full grid (the voxels never crossed cannot be reconstructed); off by default;
+        :param trim_detector: shrinks the detector to the rows and columns receiving rays through the volume (see
+        footprint.trimmed_detector); the sinograms then hold that window only, reported by detector_trim (default: the
+        whole n_cells_param x n_cells_param detector).
         """
-        self.S = 1
+        self.S = supersampling
+        self.block_projs = block_projs
         self.cells = n_cells_param
         self.desired_projs = n_proj_param
-        self.vol_geom = astra.create_vol_geom(rec_size_param[0], rec_size_param[1], rec_size_param[2])
-        self.setup = InlineScanningSetup3D(alpha=alpha_param, detector_cells=n_cells_param, number_of_projections=self.desired_projs*self.S, object_size=rec_size_param, vert_shift=vert_shift, tg_dir=tg_dir)
-        self.proj_geom = astra.create_proj_geom('cone_vec', n_cells_param, n_cells_param, self.setup.get_geometry_matrix())
+        self.trace = NULL_TRACE if trace is None else trace
+        with self.trace.stage('geometry'):
+            self.vol_geom = create_vol_geom(rec_size_param[0], rec_size_param[1], rec_size_param[2])
+            self.setup = InlineScanningSetup3D(alpha=alpha_param, detector_cells=n_cells_param, number_of_projections=self.desired_projs*self.S, object_size=rec_size_param, vert_shift=vert_shift, tg_dir=tg_dir)
+            self.proj_geom = create_proj_geom('cone_vec', n_cells_param, n_cells_param, self.setup.get_geometry_matrix())
+            self.full_vol_geom, self.roi = self.vol_geom, None
+            if crop_roi:
+                self.roi, self.vol_geom = roi_geometry(self.proj_geom, self.vol_geom)
+            self.detector_window, self.detector_trim = None, None
+            if trim_detector:
+                self.proj_geom, self.detector_window, self.detector_trim = trimmed_detector(self.proj_geom,
+                                                                                            self.vol_geom)
+            self.backend = create_backend(backend, self.proj_geom, self.vol_geom)
+
+            self.new_geom_matrix = rebinned_geometry(self.setup.get_geometry_matrix(), self.S)
+            self.new_geom = create_proj_geom('cone_vec', self.cells, self.cells, self.new_geom_matrix)
+            if self.detector_window is not None:
+                self.new_geom = crop_detector(self.new_geom, self.detector_window)
+            self.rec_backend = create_backend(backend, self.new_geom, self.vol_geom)
+        self.backend_name = backend
+        self.cache = cache
+
+    def simulate(self, phantom_param, out=None):
+        """
+        It simulates the continuous acquisition of a phantom, averaging S belt sub-positions into each projection.
+        :param phantom_param: C-contiguous float32 3D volume of the phantom, in the full grid;
+        :param out: float32 array receiving the sinogram, e.g. the sinogram buffer of a session (default: a new array);
+        :return: the float32 motion-blurred sinogram.
+        """
+        if self.roi is not None:
+            phantom_param = np.ascontiguousarray(phantom_param[self.roi])
+        return motion_blurred_sinogram(self.backend, phantom_param, self.desired_projs, self.S, self.block_projs,
+                                       trace=self.trace, out=out)
 
-    def run(self, phantom_param):
+    def session(self, n_iterations_param=700, tol_param=None, update_tol_param=None):
+        """
+        It opens a reconstruction session that keeps the data buffers and algorithm of the rebinned geometry alive between
+        phantoms; each call of its run() method has the same output as the run() method of this class.
+        :param n_iterations_param: maximum number of SIRT iterations;
+        :param tol_param: stops the iterations once the relative residual ||b - A x|| / ||b|| falls below it;
+        :param update_tol_param: stops the iterations once the relative update of the reconstruction falls below it;
+        :return: a session object, to be used as a context manager so that every handle is freed on exit.
         """
-        It executes an image reconstruction using the projections acquired in the inline setup.
-        :param phantom_param: 2D image of the phantom that should be used to simulate the acquisition of projections from
-        real object;
-        :param rec_algorithm_param: reconstruction algorithm to be used. The option available are: SIRT_CUDA and FBP_CUDA;
-        :param n_iterations_param: number of iterations to be used in case of iterative reconstructions;
+        session = self.rec_backend.session('SIRT3D_CUDA', n_iterations_param, simulate=self.simulate, tol=tol_param,
+                                           update_tol=update_tol_param, trace=self.trace)
+        if self.cache is not None:
+            session = self.cache.wrap(session, self.proj_geom, self.new_geom, self.vol_geom, self.backend_name, self.S,
+                                      'SIRT3D_CUDA', n_iterations_param, tol_param, update_tol_param)
+        if self.roi is None:
+            return session
+        return CroppedSession(session, self.roi, vol_shape(self.full_vol_geom))
+
+    def run(self, phantom_param, tol_param=None, update_tol_param=None, warm_start_param=False):
+        """
+        It executes an image reconstruction using the projections acquired in the inline setup: SIRT with the default
+        number of iterations of session(), that opens and releases its reconstruction objects for this phantom only.
+        :param phantom_param: 3D volume of the phantom that should be used to simulate the acquisition of projections
+        from real object;
+        :param tol_param: stops the iterations once the relative residual ||b - A x|| / ||b|| falls below it;
+        :param update_tol_param: stops the iterations once the relative update of the reconstruction falls below it;
+        :param warm_start_param: starts the iterations from the filtered backprojection of reconstruct_fdk() instead of
+        zeros, so that fewer iterations reach the same quality (the output is then not cached);
         :return: a dictionary containing the reconstructed image into 'rec' index, the reconstruction time into 'time' index,
-        and the acquired sinogram into the 'sino' index;
+        the number of iterations run into 'iterations' index, the acquired sinogram into the 'sino' index, and, with a
+        trace, the wall time, CPU time and bytes of every stage of the run into the 'stages' index;
         """
 
-        id_old, proj_data = astra.create_sino3d_gpu(phantom_param, self.proj_geom, self.vol_geom)
-        new_proj = np.zeros((self.cells, self.desired_projs, self.cells))
-
-        for j in range(self.desired_projs):
-            temp = np.sum(proj_data[:, j*self.S : j*self.S+self.S, :], axis=1)
-            new_proj[:,j,:] = temp
-
-        past_geom_matrix = self.setup.get_geometry_matrix()
-        self.new_geom_matrix = past_geom_matrix[range(int(self.S/2),past_geom_matrix.shape[0],int(self.S)), :]
+        mark = self.trace.mark()
+        with self.session(tol_param=tol_param, update_tol_param=update_tol_param) as session:
+            if warm_start_param:
+                sinogram = session.forward(phantom_param)
+                preview = self.reconstruct_fdk(sinogram)
+                output = session.reconstruct(x0=preview['rec'])
+                output.update(time=output['time'] + preview['time'], sino=sinogram)
+            else:
+                output = session.run(phantom_param)
+        if self.trace:
+            output['stages'] = self.trace.summary(mark)
 
-        new_geom = astra.create_proj_geom('cone_vec', self.cells, self.cells, self.new_geom_matrix)
-        proj_id = astra.data3d.create('-sino', new_geom, new_proj)
+        return output
 
-        rec_id = astra.data3d.create('-vol', self.vol_geom)
-        cfg = astra.astra_dict('SIRT3D_CUDA')
-        cfg['ReconstructionDataId'] = rec_id
-        cfg['ProjectionDataId'] = proj_id
-        alg_id = astra.algorithm.create(cfg)
+    def reconstruct_fdk(self, sinogram_param, filter_param='hann'):
+        """
+        It reconstructs the volume in one pass with the filtered backprojection of fdk.py in the rebinned geometry,
+        scaled to fit the sinogram and clipped to non-negative values (see fdk.warm_start). It costs about as much as a
+        few SIRT iterations, gives a preview of the volume and, as x0 of a session, a warm start for SIRT.
+        :param sinogram_param: sinogram in the rebinned geometry, e.g. the output of simulate();
+        :param filter_param: window of the ramp filter (see fdk.FILTERS);
+        :return: a dictionary containing the volume in the full grid into 'rec' index, the reconstruction time into
+        'time' index and 1 into 'iterations' index.
+        """
         start_time = time.time()
-        astra.algorithm.run(alg_id, 700)
-        elapsed_time = time.time() - start_time
+        with self.trace.stage('iterations', algorithm='FDK'):
+            rec = warm_start(self.rec_backend, sinogram_param, filter_param)
+        if self.roi is not None:
+            rec = pad_volume(rec, self.roi, vol_shape(self.full_vol_geom))
+        return {'rec': rec, 'time': time.time() - start_time, 'iterations': 1}
 
+    def run_fdk(self, phantom_param, filter_param='hann'):
+        """
+        It simulates the acquisition of a phantom and reconstructs it in one pass (see reconstruct_fdk()).
+        :param phantom_param: 3D volume of the phantom;
+        :param filter_param: window of the ramp filter (see fdk.FILTERS);
+        :return: the output of reconstruct_fdk(), with the acquired sinogram into the 'sino' index.
+        """
+        sinogram = self.simulate(phantom_param)
+        output = self.reconstruct_fdk(sinogram, filter_param)
+        output['sino'] = sinogram
+        return output
 
-        output = {'rec': astra.data3d.get(rec_id), 'time': elapsed_time, 'sino': new_proj}
-
-        astra.algorithm.delete(alg_id)
-        astra.data3d.delete(rec_id)
-        #astra.data3d.delete(proj_id)
-        astra.projector.delete(id_old)
+    def run_progressive(self, phantom_param, n_iterations_param=700, every_param=10, tol_param=None,
+                        update_tol_param=None):
+        """
+        It executes an image reconstruction progressively: the current reconstruction is yielded every every_param
+        iterations, so that the caller can use it or stop early (e.g. once it is good enough or a deadline is reached)
+        by leaving the loop; the session is then closed.
+        :param phantom_param: volume of the phantom;
+        :param n_iterations_param: maximum number of iterations;
+        :param every_param: number of iterations between two yielded reconstructions;
+        :param tol_param: stops the iterations once the relative residual ||b - A x|| / ||b|| falls below it;
+        :param update_tol_param: stops the iterations once the relative update of the reconstruction falls below it;
+        :return: a generator yielding dictionaries containing the current reconstruction into 'rec' index (a view
+        updated by the next iterations; the last one yielded is copied when the generator ends), the number of
+        iterations run into 'iterations' index, the relative residual into 'residual' index, the time spent into 'time'
+        index and the acquired sinogram into the 'sino' index;
+        """
+        with self.session(n_iterations_param, tol_param, update_tol_param) as session:
+            yield from session.run_progressive(phantom_param, every_param)
 
-        return output
+    def reconstruct_multiresolution(self, sinogram_param, factors_param=(4, 2, 1), n_iterations_param=(20, 20, 200),
+                                    tol_param=None, update_tol_param=None):
+        """
+        It reconstructs the volume coarse to fine (see multiresolution.coarse_to_fine): SIRT runs first on a binned
+        detector and a coarse volume, and every finer level starts from the upsampled result of the previous one, so the
+        full-resolution level needs a fraction of the iterations of a reconstruction from zero.
+        :param sinogram_param: sinogram in the rebinned geometry, e.g. the output of simulate();
+        :param factors_param: binning factors of the levels, from the coarsest to 1; each one is a multiple of the next;
+        :param n_iterations_param: maximum number of SIRT iterations of every level;
+        :param tol_param: stops the iterations of a level once the relative residual ||b - A x|| / ||b|| falls below it;
+        :param update_tol_param: stops the iterations of a level once the relative update falls below it;
+        :return: a generator yielding, after each level, a dictionary containing the reconstructed volume into 'rec'
+        index (in the full grid for the last level), the time spent by the level into 'time' index, the number of
+        iterations run into 'iterations' index and the binning factor into 'factor' index.
+        """
+        levels = coarse_to_fine(self.backend_name, self.new_geom, self.vol_geom, sinogram_param, factors_param,
+                                n_iterations_param, 'SIRT3D_CUDA', tol_param, update_tol_param, self.trace,
+                                self.rec_backend)
+        for output in levels:
+            if self.roi is not None and output['factor'] == 1:
+                output['rec'] = pad_volume(output['rec'], self.roi, vol_shape(self.full_vol_geom))
+            yield output
+
+    def run_multiresolution(self, phantom_param, factors_param=(4, 2, 1), n_iterations_param=(20, 20, 200),
+                            tol_param=None, update_tol_param=None):
+        """
+        It simulates the acquisition of a phantom and reconstructs it coarse to fine (see
+        reconstruct_multiresolution()).
+        :param phantom_param: 3D volume of the phantom;
+        :param factors_param: binning factors of the levels, from the coarsest to 1;
+        :param n_iterations_param: maximum number of SIRT iterations of every level;
+        :param tol_param: stops the iterations of a level once the relative residual falls below it;
+        :param update_tol_param: stops the iterations of a level once the relative update falls below it;
+        :return: a generator yielding the output of every level, as reconstruct_multiresolution(), with the acquired
+        sinogram into the 'sino' index.
+        """
+        sinogram = self.simulate(phantom_param)
+        for output in self.reconstruct_multiresolution(sinogram, factors_param, n_iterations_param, tol_param,
+                                                       update_tol_param):
+            output['sino'] = sinogram
+            yield output
 
 
 
@@ -116,32 +273,18 @@ if __name__ == '__main__':
     if not os.path.isdir(dest):
         os.mkdir(dest)
 
-    data = os.listdir(src)
-    plane = np.zeros((187, 565, 547))
-    k = 0
-    for file in data:
-        print(file)
-        i = imread(src + file)
-        plane[:, :, k] = np.transpose(i) # i = 565x187
-        k = k + 1
-
-    np.save('lamino_phantom.npy', plane)
+    # (187, 565, 547) memory-mapped float32 volume of the slice stack: plane[:, :, k] = transpose(slice k)
+    plane = load_slices(src, 'lamino_phantom_slices_210.npy', axes=(2, 1, 0))
 
     setup = InlineContinuousScanningObject3D(alpha_param=a, n_cells_param=1200, n_proj_param=p, rec_size_param=(565, 547, 187))
     out = setup.run(plane)
 
 
-    for k in range(547):
-        if not os.path.isdir(dest + "\\rec-continuous\\"):
-            os.mkdir(dest + "\\rec-continuous\\")
-        final = out['rec']
-        imwrite(dest+"\\rec\\slice{:05d}.png".format(k), np.transpose(final[:,:,k]))
-
-
-    if not os.path.isdir(dest+"\\sino\\"):
-        os.mkdir(dest+"\\sino\\")
-    for k in range(p):
-        imwrite(dest+"\\sino\\proj_{:5d}.png".format(k),out['sino'][:,k,:])
+    with ResultWriter() as writer:
+        writer.write_volume(dest + "\\rec.vol", out['rec'], copy=False)
+        writer.write_volume(dest + "\\sino.vol", out['sino'], copy=False)
+        writer.write_slices(dest + "\\rec\\", out['rec'], axis=2, transpose=True, copy=False)
+        writer.write_slices(dest + "\\sino\\", out['sino'], axis=1, pattern="proj_{:5d}.png", copy=False)
 
 
 
@@ -1,67 +1,330 @@
 from inline_setup_3D import InlineScanningSetup3D
-import astra
+from projector_backend import create_backend, create_vol_geom, create_proj_geom
+from iterative_solvers import select_projections
+from motion_blur import motion_blurred_sinogram, rebinned_geometry
+from volume_store import load_slices
+from result_writer import ResultWriter
+from instrumentation import NULL_TRACE
+from footprint import CroppedSession, crop_detector, trimmed_detector, pad_volume, roi_geometry, vol_shape
+from multiresolution import coarse_to_fine
+from fdk import warm_start
+import time
 import numpy as np
 
 class MultipleInlineContinuousScanningObject3D:
+    """
+    This class defines a setup of several inline stages (views) scanning the same object continuously and executes
+    image reconstructions from the projections of all the views.
+    Attributes
+    ----------
+    stages      : list
+        It holds the InlineScanningSetup3D of every view;
+    proj_geom   : dict
+        It holds the projection geometry of the oversampled acquisition of all the views;
+    new_geom    : dict
+        It holds the rebinned projection geometry used by the reconstructions;
+    vol_geom    : dict
+        It holds the characteristics of the reconstruction volume;
+    roi         : tuple
+        It holds the slices of the voxels crossed by the rays (see footprint.py), or None when the whole grid is used;
+    trace       : Trace
+        It records the stages of the setup (see instrumentation.py);
+    Methods
+    -------
+    session(n_iterations_param=700, tol_param=None, update_tol_param=None)
+        It opens a session that reuses the reconstruction objects across many phantoms.
+    run(phantom_param, n_iterations_param=700, tol_param=None, update_tol_param=None, warm_start_param=False)
+        It executes an image reconstruction using the projections acquired by all the views.
+    run_incremental(phantom_param, n_iterations_param=100)
+        It reconstructs the volume after every view, warm-started from the previous estimate.
+    run_multiresolution(phantom_param, factors_param=(4, 2, 1), n_iterations_param=(20, 20, 200))
+        It reconstructs the volume coarse to fine, from a binned detector and a coarse grid to the full resolution.
+    """
 
-    def __init__(self, views_param, rec_size_param, n_proj_param, cells):
-        self.S = 1
+    def __init__(self, views_param, rec_size_param, n_proj_param, cells, backend='cuda', supersampling=1, block_projs=None,
+                 cache=None, trace=None, crop_roi=False,
+                 trim_detector=False):
+        """
+        It creates a new instance of the class MultipleInlineContinuousScanningObject3D: views_param inline stages with
+        alternate conveyor directions, each one 25 pixels above the previous one.
+        :param views_param: number of inline stages (views) of the setup;
+        :param rec_size_param: size (rows, cols, slices) of the reconstruction grid;
+        :param n_proj_param: number of X-ray projections acquired by every view during the object movement;
+        :param cells: number of detector elements per row and per column;
+        :param backend: projector backend, 'cuda' (ASTRA Toolbox) or 'cpu' (see projector_backend.py);
+        :param supersampling: number S of belt sub-positions averaged into each projection to model motion blur;
+        :param block_projs: number of projections simulated at once (see motion_blur.motion_blurred_sinogram);
+        :param cache: ResultCache consulted by the sessions (see result_cache.py), or None;
+        :param trace: Trace recording the stages of the setup and of the runs (see instrumentation.py), or None;
+        :param crop_roi: simulates and reconstructs only the voxels crossed by the rays, padding the reconstructions
+        back to the full grid (see footprint.roi_geometry); off by default;
+        :param trim_detector: drops the detector rows and columns that no ray through the volume reaches (see
+        footprint.trimmed_detector); the sinograms then hold that window only, reported by detector_trim (default: the
+        whole cells x cells detector);
+        """
+        self.S = supersampling
+        self.block_projs = block_projs
         self.cells = cells
-        self.stages = []
-
-        rot = 0
-        vert_shift = -50#antes -250
-        views = views_param
-        for z in range(views):
-            if z%2==0:
-                dir = "left"
-            else:
-                dir = "right"
-            self.stages.append(InlineScanningSetup3D(alpha=60, detector_cells=cells, number_of_projections=n_proj_param*self.S, object_size=rec_size_param, vert_shift=vert_shift, tg_dir=dir, rotation=rot))
-            vert_shift = vert_shift + 25
-            #rot = (z/views)*180
+        self.n_proj = n_proj_param
+        self.trace = NULL_TRACE if trace is None else trace
+        with self.trace.stage('geometry'):
+            self.stages = []
 
+            rot = 0
+            vert_shift = -50#antes -250
+            views = views_param
+            for z in range(views):
+                if z%2==0:
+                    dir = "left"
+                else:
+                    dir = "right"
+                self.stages.append(InlineScanningSetup3D(alpha=60, detector_cells=cells, number_of_projections=n_proj_param*self.S, object_size=rec_size_param, vert_shift=vert_shift, tg_dir=dir, rotation=rot))
+                vert_shift = vert_shift + 25
+                #rot = (z/views)*180
 
-        self.geom_matrix = self.stages[0].get_geometry_matrix()
-        for z in range(1, views):
-            self.geom_matrix = np.concatenate((self.geom_matrix, self.stages[z].get_geometry_matrix()), axis=0)
 
+            self.geom_matrix = np.concatenate([stage.get_geometry_matrix() for stage in self.stages], axis=0)
 
-        self.proj_geom = astra.create_proj_geom('cone_vec', cells, cells, self.geom_matrix)
-        self.vol_geom = astra.create_vol_geom(rec_size_param[0], rec_size_param[1], rec_size_param[2])
-        self.desired_projs = views*n_proj_param
 
-    def run(self, phantom_param, n_iterations_param=700):
+            self.proj_geom = create_proj_geom('cone_vec', cells, cells, self.geom_matrix)
+            self.vol_geom = create_vol_geom(rec_size_param[0], rec_size_param[1], rec_size_param[2])
+            # only the voxels crossed by the rays are simulated and reconstructed (see footprint.py)
+            self.full_vol_geom, self.roi = self.vol_geom, None
+            if crop_roi:
+                self.roi, self.vol_geom = roi_geometry(self.proj_geom, self.vol_geom)
+            self.detector_window, self.detector_trim = None, None
+            if trim_detector:
+                self.proj_geom, self.detector_window, self.detector_trim = trimmed_detector(self.proj_geom,
+                                                                                            self.vol_geom)
+            self.desired_projs = views*n_proj_param
+            self.backend = create_backend(backend, self.proj_geom, self.vol_geom)
 
-        id_old, proj_data = astra.create_sino3d_gpu(phantom_param, self.proj_geom, self.vol_geom)
-        new_proj = np.zeros((self.cells, self.desired_projs, self.cells))
+            self.new_geom_matrix = rebinned_geometry(self.geom_matrix, self.S)
+            self.new_geom = create_proj_geom('cone_vec', self.cells, self.cells, self.new_geom_matrix)
+            if self.detector_window is not None:
+                self.new_geom = crop_detector(self.new_geom, self.detector_window)
+            self.rec_backend = create_backend(backend, self.new_geom, self.vol_geom)
+        self.backend_name = backend
+        self.cache = cache
 
-        for j in range(self.desired_projs):
+    def simulate(self, phantom_param, out=None):
+        """
+        It simulates the continuous acquisition of a phantom by all the views, with the motion blur of S sub-positions
+        per projection.
+        :param phantom_param: 3D volume of the phantom, in the full grid;
+        :param out: float32 array receiving the sinogram, or None;
+        :return: the motion-blurred sinogram of the views_param * n_proj_param projections.
+        """
+        if self.roi is not None:
+            phantom_param = np.ascontiguousarray(phantom_param[self.roi])
+        return motion_blurred_sinogram(self.backend, phantom_param, self.desired_projs, self.S, self.block_projs,
+                                       trace=self.trace, out=out)
 
-            temp = np.sum(proj_data[:, j * self.S: j * self.S + self.S, :], axis=1)
-            new_proj[:, j, :] = temp
+    def session(self, n_iterations_param=700, tol_param=None, update_tol_param=None):
+        """
+        It opens a session that reuses the reconstruction objects of the rebinned geometry across many phantoms (see
+        projector_backend.py), cached when the instance has a cache and padded to the full grid when the volume is
+        cropped to the rays.
+        :param n_iterations_param: maximum number of SIRT iterations;
+        :param tol_param: stops the iterations once the relative residual ||b - A x|| / ||b|| falls below it;
+        :param update_tol_param: stops the iterations once the relative update of the reconstruction falls below it;
+        :return: the session, to be used as a context manager.
+        """
+        session = self.rec_backend.session('SIRT3D_CUDA', n_iterations_param, simulate=self.simulate, tol=tol_param,
+                                           update_tol=update_tol_param, trace=self.trace)
+        if self.cache is not None:
+            session = self.cache.wrap(session, self.proj_geom, self.new_geom, self.vol_geom, self.backend_name, self.S,
+                                      'SIRT3D_CUDA', n_iterations_param, tol_param, update_tol_param)
+        if self.roi is None:
+            return session
+        return CroppedSession(session, self.roi, vol_shape(self.full_vol_geom))
 
-        past_geom_matrix = self.geom_matrix
-        self.new_geom_matrix = past_geom_matrix[range(int(self.S / 2), past_geom_matrix.shape[0], int(self.S)), :]
-        new_geom = astra.create_proj_geom('cone_vec', self.cells, self.cells, self.new_geom_matrix)
+    def run(self, phantom_param, n_iterations_param=700, tol_param=None, update_tol_param=None,
+            warm_start_param=False):
+        """
+        It executes an image reconstruction using the projections acquired by all the views.
+        :param phantom_param: 3D volume of the phantom that should be used to simulate the acquisition of projections
+        from real object;
+        :param n_iterations_param: maximum number of SIRT iterations;
+        :param tol_param: stops the iterations once the relative residual ||b - A x|| / ||b|| falls below it;
+        :param update_tol_param: stops the iterations once the relative update of the reconstruction falls below it;
+        :param warm_start_param: starts the iterations from the filtered backprojection of reconstruct_fdk() instead of
+        zeros;
+        :return: a dictionary containing the reconstructed volume into 'rec' index, the reconstruction time into 'time'
+        index, the number of iterations run into 'iterations' index, the acquired sinogram into the 'sino' index, and,
+        with a trace, the wall time, CPU time and bytes of every stage of the run into the 'stages' index;
+        """
+        mark = self.trace.mark()
+        with self.session(n_iterations_param, tol_param, update_tol_param) as session:
+            if warm_start_param:
+                # SIRT starts from the filtered backprojection (see reconstruct_fdk)
+                sinogram = session.forward(phantom_param)
+                preview = self.reconstruct_fdk(sinogram)
+                output = session.reconstruct(x0=preview['rec'])
+                output.update(time=output['time'] + preview['time'], sino=sinogram)
+            else:
+                output = session.run(phantom_param)
+        if self.trace:
+            output['stages'] = self.trace.summary(mark)
 
-        proj_id = astra.data3d.create('-sino', new_geom, new_proj)
-        rec_id = astra.data3d.create('-vol', self.vol_geom)
-        cfg = astra.astra_dict('SIRT3D_CUDA')
-        cfg['ReconstructionDataId'] = rec_id
-        cfg['ProjectionDataId'] = proj_id
-        alg_id = astra.algorithm.create(cfg)
-        astra.algorithm.run(alg_id, n_iterations_param)
+        return output
 
-        output = {'rec': astra.data3d.get(rec_id), 'sino': new_proj}
+    def run_progressive(self, phantom_param, n_iterations_param=700, every_param=10, tol_param=None,
+                        update_tol_param=None):
+        """
+        It executes an image reconstruction progressively: the current reconstruction is yielded every every_param
+        iterations, so that the caller can use it or stop early (e.g. once it is good enough or a deadline is reached)
+        by leaving the loop; the session is then closed.
+        :param phantom_param: volume of the phantom;
+        :param n_iterations_param: maximum number of iterations;
+        :param every_param: number of iterations between two yielded reconstructions;
+        :param tol_param: stops the iterations once the relative residual ||b - A x|| / ||b|| falls below it;
+        :param update_tol_param: stops the iterations once the relative update of the reconstruction falls below it;
+        :return: a generator yielding dictionaries containing the current reconstruction into 'rec' index (a view
+        updated by the next iterations; the last one yielded is copied when the generator ends), the number of
+        iterations run into 'iterations' index, the relative residual into 'residual' index, the time spent into 'time'
+        index and the acquired sinogram into the 'sino' index;
+        """
+        with self.session(n_iterations_param, tol_param, update_tol_param) as session:
+            yield from session.run_progressive(phantom_param, every_param)
 
-        astra.algorithm.delete(alg_id)
-        astra.data3d.delete(rec_id)
-        astra.data3d.delete(proj_id)
-        astra.projector.delete(id_old)
+    def reconstruct_fdk(self, sinogram_param, filter_param='hann'):
+        """
+        It reconstructs the volume of all the views in one pass with the filtered backprojection of fdk.py, scaled to
+        fit the sinogram and clipped to non-negative values (see fdk.warm_start), as a preview or a warm start for SIRT.
+        :param sinogram_param: sinogram in the rebinned geometry of all the views, e.g. the output of simulate();
+        :param filter_param: window of the ramp filter (see fdk.FILTERS);
+        :return: a dictionary containing the volume in the full grid into 'rec' index, the reconstruction time into
+        'time' index and 1 into 'iterations' index.
+        """
+        start_time = time.time()
+        with self.trace.stage('iterations', algorithm='FDK'):
+            rec = warm_start(self.rec_backend, sinogram_param, filter_param)
+        if self.roi is not None:
+            rec = pad_volume(rec, self.roi, vol_shape(self.full_vol_geom))
+        return {'rec': rec, 'time': time.time() - start_time, 'iterations': 1}
 
+    def run_fdk(self, phantom_param, filter_param='hann'):
+        """
+        It simulates the acquisition of a phantom and reconstructs it in one pass (see reconstruct_fdk()).
+        :param phantom_param: 3D volume of the phantom;
+        :param filter_param: window of the ramp filter (see fdk.FILTERS);
+        :return: the output of reconstruct_fdk(), with the acquired sinogram into the 'sino' index.
+        """
+        sinogram = self.simulate(phantom_param)
+        output = self.reconstruct_fdk(sinogram, filter_param)
+        output['sino'] = sinogram
         return output
 
+    def simulate_stage(self, phantom_param, stage):
+        """
+        It simulates the continuous acquisition of a phantom by one of the stages of the setup.
+        :param phantom_param: 3D volume of the phantom, in the full grid;
+        :param stage: index of the stage;
+        :return: the float32 motion-blurred sinogram of the n_proj projections of the stage.
+        """
+        if self.roi is not None:
+            phantom_param = np.ascontiguousarray(phantom_param[self.roi])
+        return motion_blurred_sinogram(self.backend, phantom_param, self.n_proj, self.S, self.block_projs,
+                                       trace=self.trace, first_projection=stage * self.n_proj)
+
+    def reconstruct_incremental(self, stage_sinograms, n_iterations_param=100, tol_param=None, update_tol_param=None):
+        """
+        It reconstructs the volume while the stages of the setup are acquired: as soon as the sinogram of a stage is
+        available, the volume is reconstructed from the projections of every stage acquired so far, with SIRT
+        warm-started from the estimate of the previous stage, so only the last update separates the last acquisition
+        from the final volume.
+        :param stage_sinograms: iterable yielding the sinograms of the stages in acquisition order, each of shape
+        (cells, n_proj, cells), or restricted to the detector window when the detector is trimmed (see detector_trim);
+        :param n_iterations_param: maximum number of SIRT iterations per stage;
+        :param tol_param: stops the iterations of a stage once the relative residual ||b - A x|| / ||b|| falls below it;
+        :param update_tol_param: stops the iterations of a stage once the relative update falls below it;
+        :return: a generator yielding, after each stage, a dictionary containing the reconstructed volume into 'rec'
+        index, the time spent by the update into 'time' index, the number of iterations run into 'iterations' index,
+        the sinogram of the stages acquired so far into the 'sino' index and the number of stages into 'stage' index.
+        """
+        rows, cols = self.new_geom['DetectorRowCount'], self.new_geom['DetectorColCount']
+        sinogram = np.zeros((rows, self.desired_projs, cols), dtype=np.float32)
+        rec = None
+        for stage, stage_sinogram in enumerate(stage_sinograms):
+            end = (stage + 1) * self.n_proj
+            if self.detector_window is not None and np.shape(stage_sinogram)[0::2] == (self.cells, self.cells):
+                stage_sinogram = stage_sinogram[self.detector_window[0], :, self.detector_window[1]]
+            sinogram[:, end - self.n_proj:end, :] = stage_sinogram
+
+            if end == self.desired_projs:
+                backend = self.rec_backend
+            else:
+                with self.trace.stage('geometry'):
+                    proj_geom = select_projections(self.new_geom, slice(0, end))
+                    backend = create_backend(self.backend_name, proj_geom, self.vol_geom)
+
+            with backend.session('SIRT3D_CUDA', n_iterations_param, tol=tol_param, update_tol=update_tol_param,
+                                 trace=self.trace) as session:
+                # the projections of the stages acquired so far are not contiguous in the sinogram of every stage
+                output = session.reconstruct(np.ascontiguousarray(sinogram[:, :end, :]), x0=rec)
+            rec = output['rec']
+
+            output.update(sino=sinogram[:, :end, :], stage=stage + 1)
+            if self.roi is not None:
+                output['rec'] = pad_volume(rec, self.roi, vol_shape(self.full_vol_geom))
+            yield output
+
+    def run_incremental(self, phantom_param, n_iterations_param=100, tol_param=None, update_tol_param=None):
+        """
+        It simulates the stages of the setup one by one and reconstructs the volume incrementally (see
+        reconstruct_incremental()).
+        :param phantom_param: 3D volume of the phantom;
+        :param n_iterations_param: maximum number of SIRT iterations per stage;
+        :param tol_param: stops the iterations of a stage once the relative residual falls below it;
+        :param update_tol_param: stops the iterations of a stage once the relative update falls below it;
+        :return: a generator yielding the output of every stage, as reconstruct_incremental().
+        """
+        stage_sinograms = (self.simulate_stage(phantom_param, stage) for stage in range(len(self.stages)))
+        return self.reconstruct_incremental(stage_sinograms, n_iterations_param, tol_param, update_tol_param)
+
+    def reconstruct_multiresolution(self, sinogram_param, factors_param=(4, 2, 1), n_iterations_param=(20, 20, 200),
+                                    tol_param=None, update_tol_param=None):
+        """
+        It reconstructs the volume coarse to fine (see multiresolution.coarse_to_fine): SIRT runs first on a binned
+        detector and a coarse volume, and every finer level starts from the upsampled result of the previous one, so the
+        full-resolution level needs a fraction of the iterations of a reconstruction from zero.
+        :param sinogram_param: sinogram in the rebinned geometry, e.g. the output of simulate();
+        :param factors_param: binning factors of the levels, from the coarsest to 1; each one is a multiple of the next;
+        :param n_iterations_param: maximum number of SIRT iterations of every level;
+        :param tol_param: stops the iterations of a level once the relative residual ||b - A x|| / ||b|| falls below it;
+        :param update_tol_param: stops the iterations of a level once the relative update falls below it;
+        :return: a generator yielding, after each level, a dictionary containing the reconstructed volume into 'rec'
+        index (in the full grid for the last level), the time spent by the level into 'time' index, the number of
+        iterations run into 'iterations' index and the binning factor into 'factor' index.
+        """
+        levels = coarse_to_fine(self.backend_name, self.new_geom, self.vol_geom, sinogram_param, factors_param,
+                                n_iterations_param, 'SIRT3D_CUDA', tol_param, update_tol_param, self.trace,
+                                self.rec_backend)
+        for output in levels:
+            if self.roi is not None and output['factor'] == 1:
+                output['rec'] = pad_volume(output['rec'], self.roi, vol_shape(self.full_vol_geom))
+            yield output
+
+    def run_multiresolution(self, phantom_param, factors_param=(4, 2, 1), n_iterations_param=(20, 20, 200),
+                            tol_param=None, update_tol_param=None):
+        """
+        It simulates the acquisition of a phantom and reconstructs it coarse to fine (see
+        reconstruct_multiresolution()).
+        :param phantom_param: 3D volume of the phantom;
+        :param factors_param: binning factors of the levels, from the coarsest to 1;
+        :param n_iterations_param: maximum number of SIRT iterations of every level;
+        :param tol_param: stops the iterations of a level once the relative residual falls below it;
+        :param update_tol_param: stops the iterations of a level once the relative update falls below it;
+        :return: a generator yielding the output of every level, as reconstruct_multiresolution(), with the acquired
+        sinogram into the 'sino' index.
+        """
+        sinogram = self.simulate(phantom_param)
+        for output in self.reconstruct_multiresolution(sinogram, factors_param, n_iterations_param, tol_param,
+                                                       update_tol_param):
+            output['sino'] = sinogram
+            yield output
+
 
 if __name__ == '__main__':
 
@@ -79,35 +342,17 @@ if __name__ == '__main__':
     if not os.path.isdir(dest):
         os.mkdir(dest)
 
-    data = os.listdir(src)
-    plane = np.zeros((187, 565, 547))
-    k = 0
-    for file in data:
-        print(file)
-        i = imread(src + file)
-        plane[:, :, k] = np.transpose(i)
-        k = k + 1
-
-    np.save('lamino_phantom.npy', plane)
+    # (187, 565, 547) memory-mapped float32 volume of the slice stack: plane[:, :, k] = transpose(slice k)
+    plane = load_slices(src, 'lamino_phantom_slices_210.npy', axes=(2, 1, 0))
 
     setup = MultipleInlineContinuousScanningObject3D(views_param = views, n_proj_param=p, rec_size_param=(565, 547, 187), cells=600 ) #antes800
     out = setup.run(plane)
 
-    for k in range(187):
-        if not os.path.isdir(dest + "\\{}-rows-{}-projs-continuous\\".format(views,p)):
-            os.mkdir(dest + "\\{}-rows-{}-projs-continuous\\".format(views,p))
-        final = out['rec']
-        #final = (out['rec']-np.min(out['rec']))/(np.max(out['rec'])-np.min(out['rec']))
-        imwrite(dest+"\\{}-rows-{}-projs-continuous\\slice{:05d}.png".format(views,p,k), final[k,:,:])
-
-    for k in range(547):
-        if not os.path.isdir(dest + "\\{}-rows-{}-projs-rec-continuous-2\\".format(views,p)):
-            os.mkdir(dest + "\\{}-rows-{}-projs-rec-continuous-2\\".format(views,p))
-        final = out['rec']
-        #final = (out['rec']-np.min(out['rec']))/(np.max(out['rec'])-np.min(out['rec']))
-        imwrite(dest+"\\{}-rows-{}-projs-rec-continuous-2\\slice{:05d}.png".format(views,p,k), final[:,:,k])
-
-    if not os.path.isdir(dest+"\\{}-rows-{}-projs-sino-continuous\\".format(views,p)):
-        os.mkdir(dest+"\\{}-rows-{}-projs-sino-continuous\\".format(views,p))
-    for k in range(views*p):
-        imwrite(dest+"\\{}-rows-{}-projs-sino-continuous\\proj_{:5d}.png".format(views,p,k),out['sino'][:,k,:])
+    name = "{}-rows-{}-projs".format(views, p)
+    with ResultWriter() as writer:
+        writer.write_volume(dest + "\\{}-rec-continuous.vol".format(name), out['rec'], copy=False)
+        writer.write_volume(dest + "\\{}-sino-continuous.vol".format(name), out['sino'], copy=False)
+        writer.write_slices(dest + "\\{}-continuous\\".format(name), out['rec'], axis=0, copy=False)
+        writer.write_slices(dest + "\\{}-rec-continuous-2\\".format(name), out['rec'], axis=2, copy=False)
+        writer.write_slices(dest + "\\{}-sino-continuous\\".format(name), out['sino'], axis=1,
+                            pattern="proj_{:5d}.png", copy=False)
@@ -1,17 +1,12 @@
 from inline_setup_3D import *
-import astra
+from projector_backend import create_backend, create_vol_geom, create_proj_geom
+from instrumentation import NULL_TRACE
+from footprint import trimmed_detector
+from fdk import warm_start
 import time
 from imageio import imread, imwrite
 from matplotlib import pyplot as plt
 
-# optomo fix
-def _matvec(self,v):
-    return self.FP(v.ravel(), out=None).ravel()
-def _rmatvec(self,s):
-    return self.BP(s.ravel(), out=None).ravel()
-astra.OpTomo._matvec = _matvec
-astra.OpTomo._rmatvec = _rmatvec
-
 class ScanningObject:
     """
     This class defines an inline scanning geometry and executes image reconstructions.
@@ -23,80 +18,156 @@ class ScanningObject:
         It holds the scanning geometry to be used;
     vol_geom    : dict
         It holds the characteristics of the reconstruction volume;
+    backend     : object
+        It holds the projector backend that executes projections and reconstructions;
+    trace       : Trace
+        It records the stages of the setup (see instrumentation.py);
+    detector_trim : dict
+        It reports the detector window kept (see footprint.window_report), or None when the whole detector is used;
     Methods
     -------
+    session(rec_algorithm_param, n_iterations_param, tol_param=None, update_tol_param=None)
+        It opens a session that reuses the reconstruction objects across many phantoms.
     run(phantom_param, rec_algorithm_param='SIRT_CUDA', n_iterations_param=100)
         It executes an image reconstruction using the projections acquired in the inline setup.
+    run_fdk(phantom_param, filter_param='hann')
+        It reconstructs the volume in one pass with a filtered backprojection, as a preview or a warm start.
+    run_progressive(phantom_param, rec_algorithm_param='SIRT3D_CUDA', n_iterations_param=100, every_param=10)
+        It yields the reconstruction every every_param iterations, so that it can be stopped early.
     """
 
-    def __init__(self, alpha_param, n_cells_param, n_proj_param, rec_size_param=256):
+    def __init__(self, alpha_param, n_cells_param, n_proj_param, rec_size_param=256, backend='cuda', cache=None,
+                 trace=None, trim_detector=False):
         """
         It creates a new instance of the class ScanningExecution.
         :param alpha_param: fan-beam opening angle of the X-ray source used in the inline CT setup;
         :param n_cells_param: number of detector elements used in the inline CT setup;
         :param n_proj_param: number of X-ray projections aquired during the object movement;
-        :param rec_size_param: number W of pixels of the W x W reconstruction grid;
-
-        acquisition.
+        :param rec_size_param: number W of pixels of the W x W x 10 reconstruction grid, or its size (rows, cols, slices);
+        :param backend: projector backend, 'cuda' (ASTRA Toolbox) or 'cpu' (see projector_backend.py);
+        :param cache: ResultCache consulted by run() and by the sessions (see result_cache.py), or None;
+        :param trace: instrumentation.Trace recording the stages of the setup, its sessions and runs, or None;
+        :param trim_detector: shrinks the detector to the rows and columns receiving rays through the volume (see
+        footprint.trimmed_detector); the sinograms then hold that window only, reported by detector_trim (default: the
+        whole n_cells_param x n_cells_param detector).
         """
 
-        self.vol_geom = astra.create_vol_geom(128, 128, 10)
+        self.trace = NULL_TRACE if trace is None else trace
+        with self.trace.stage('geometry'):
+            rec_size = (rec_size_param, rec_size_param, 10) if np.ndim(rec_size_param) == 0 else tuple(rec_size_param)
+            self.vol_geom = create_vol_geom(rec_size[0], rec_size[1], rec_size[2])
 
-        self.setup = InlineScanningSetup(alpha=alpha_param, detector_cells=n_cells_param,
-                                         number_of_projections=n_proj_param, object_size=rec_size_param)
+            self.setup = InlineScanningSetup3D(alpha=alpha_param, detector_cells=n_cells_param,
+                                               number_of_projections=n_proj_param, object_size=rec_size)
 
-        self.proj_geom = astra.create_proj_geom('cone_vec', n_cells_param, n_cells_param, self.setup.get_geometry_matrix())
+            self.proj_geom = create_proj_geom('cone_vec', n_cells_param, n_cells_param, self.setup.get_geometry_matrix())
+            self.detector_window, self.detector_trim = None, None
+            if trim_detector:
+                self.proj_geom, self.detector_window, self.detector_trim = trimmed_detector(self.proj_geom,
+                                                                                            self.vol_geom)
+            self.backend_name = backend
+            self.backend = create_backend(backend, self.proj_geom, self.vol_geom)
+        self.cache = cache
 
-    def run(self, phantom_param, rec_algorithm_param='SIRT3D_CUDA', n_iterations_param=100):
+    def session(self, rec_algorithm_param='SIRT3D_CUDA', n_iterations_param=100, tol_param=None, update_tol_param=None):
+        """
+        It opens a reconstruction session that keeps the projector, data buffers and algorithm of the inline setup alive
+        between images; each call of its run() method has the same output as the run() method of this class.
+        :param rec_algorithm_param: reconstruction algorithm to be used;
+        :param n_iterations_param: maximum number of iterations to be used in case of iterative reconstructions;
+        :param tol_param: stops the iterations once the relative residual ||b - A x|| / ||b|| falls below it;
+        :param update_tol_param: stops the iterations once the relative update of the reconstruction falls below it;
+        :return: a session object, to be used as a context manager so that every handle is freed on exit.
+        """
+        session = self.backend.session(rec_algorithm_param, n_iterations_param, tol=tol_param,
+                                       update_tol=update_tol_param, trace=self.trace)
+        if self.cache is None:
+            return session
+        return self.cache.wrap(session, self.proj_geom, self.vol_geom, self.backend_name, rec_algorithm_param,
+                               n_iterations_param, tol_param, update_tol_param)
+
+    def run(self, phantom_param, rec_algorithm_param='SIRT3D_CUDA', n_iterations_param=100, tol_param=None,
+            update_tol_param=None, warm_start_param=False):
         """
         It executes an image reconstruction using the projections acquired in the inline setup.
         :param phantom_param: 3D volume of the phantom that should be used to simulate the acquisition of projections from
         real object;
         :param rec_algorithm_param: reconstruction algorithm to be used. The option available are: SIRT_CUDA and FBP_CUDA;
-        :param n_iterations_param: number of iterations to be used in case of iterative reconstructions;
+        :param n_iterations_param: maximum number of iterations to be used in case of iterative reconstructions;
+        :param tol_param: stops the iterations once the relative residual ||b - A x|| / ||b|| falls below it;
+        :param update_tol_param: stops the iterations once the relative update of the reconstruction falls below it;
+        :param warm_start_param: starts the iterations from the filtered backprojection of run_fdk() instead of zeros,
+        so that fewer iterations reach the same quality (the output is then not cached);
         :return: a dictionary containing the reconstructed image into 'rec' index, the reconstruction time into 'time' index,
-        and the acquired sinogram into the 'sino' index;
+        the number of iterations run into 'iterations' index, the acquired sinogram into the 'sino' index, and, with a
+        trace, the wall time, CPU time and bytes of every stage of the run into the 'stages' index;
         """
 
 
-        #proj_id = astra.create_projector('cuda', self.proj_geom, self.vol_geom)
-        proj_id, proj_data = astra.create_sino3d_gpu(phantom_param, self.proj_geom, self.vol_geom)
+        mark = self.trace.mark()
+        with self.session(rec_algorithm_param, n_iterations_param, tol_param, update_tol_param) as session:
+            if warm_start_param:
+                sinogram = session.forward(phantom_param)
+                start_time = time.time()
+                with self.trace.stage('iterations', algorithm='FDK'):
+                    x0 = warm_start(self.backend, sinogram)
+                output = session.reconstruct(x0=x0)
+                output.update(time=output['time'] + time.time() - start_time, sino=sinogram)
+            else:
+                output = session.run(phantom_param)
+        if self.trace:
+            output['stages'] = self.trace.summary(mark)
 
         #plt.figure("sino")
-        #plt.imshow(proj_data[:,5,:])
+        #plt.imshow(output['sino'][:,5,:])
         #plt.show()
 
-        rec_id = astra.data3d.create('-vol', self.vol_geom)
-
-
-        if rec_algorithm_param == 'SIRT3D_CUDA':
-            cfg = astra.astra_dict(rec_algorithm_param)
-            cfg['ReconstructionDataId'] = rec_id
-            cfg['ProjectionDataId'] = proj_id
-            alg_id = astra.algorithm.create(cfg)
-
-            start_time = time.time()
-            astra.algorithm.run(alg_id, n_iterations_param)
-            elapsed_time = time.time() - start_time
-
-            astra.algorithm.delete(alg_id)
-
-            output = {'rec': astra.data3d.get(rec_id), 'time': elapsed_time, 'sino': proj_data}
-
-
-        astra.data3d.delete(rec_id)
-        astra.data3d.delete(proj_id)
-
 
         return output
 
+    def run_fdk(self, phantom_param, filter_param='hann'):
+        """
+        It simulates the acquisition of a phantom and reconstructs it in one pass with the filtered backprojection of
+        fdk.py, scaled to fit the sinogram and clipped to non-negative values (see fdk.warm_start).
+        :param phantom_param: 3D volume of the phantom;
+        :param filter_param: window of the ramp filter (see fdk.FILTERS);
+        :return: a dictionary containing the reconstructed volume into 'rec' index, the reconstruction time into 'time'
+        index, 1 into 'iterations' index and the acquired sinogram into the 'sino' index.
+        """
+        with self.trace.stage('forward'):
+            sinogram = self.backend.forward(phantom_param)
+        start_time = time.time()
+        with self.trace.stage('iterations', algorithm='FDK'):
+            rec = warm_start(self.backend, sinogram, filter_param)
+        return {'rec': rec, 'time': time.time() - start_time, 'iterations': 1, 'sino': sinogram}
+
+    def run_progressive(self, phantom_param, rec_algorithm_param='SIRT3D_CUDA', n_iterations_param=100, every_param=10,
+                        tol_param=None, update_tol_param=None):
+        """
+        It executes an image reconstruction progressively: the current reconstruction is yielded every every_param
+        iterations, so that the caller can use it or stop early (e.g. once it is good enough or a deadline is reached)
+        by leaving the loop; the session is then closed.
+        :param phantom_param: volume of the phantom;
+        :param rec_algorithm_param: reconstruction algorithm to be used;
+        :param n_iterations_param: maximum number of iterations;
+        :param every_param: number of iterations between two yielded reconstructions;
+        :param tol_param: stops the iterations once the relative residual ||b - A x|| / ||b|| falls below it;
+        :param update_tol_param: stops the iterations once the relative update of the reconstruction falls below it;
+        :return: a generator yielding dictionaries containing the current reconstruction into 'rec' index (a view
+        updated by the next iterations; the last one yielded is copied when the generator ends), the number of
+        iterations run into 'iterations' index, the relative residual into 'residual' index, the time spent into 'time'
+        index and the acquired sinogram into the 'sino' index;
+        """
+        with self.session(rec_algorithm_param, n_iterations_param, tol_param, update_tol_param) as session:
+            yield from session.run_progressive(phantom_param, every_param)
+
 
 if __name__ == '__main__':
 
     #test code by running scanning_object.py
     src = "D:\\Datasets\\demo_data_plates\\plate_00000\\"
 
-    plane = np.zeros((10, 128, 128))
+    plane = np.zeros((10, 128, 128), dtype=np.float32)
     for k in range(10):
         i = imread(src + 'slice_{}.png'.format(k), pilmode='F')
         plane[k,:, :] = i
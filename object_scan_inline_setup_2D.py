@@ -16,8 +16,11 @@
 from imageio import imread, imwrite
 from skimage.transform import resize
 from inline_setup_2D import InlineScanningSetup2D
-import astra
+from projector_backend import create_backend, create_vol_geom, create_proj_geom
+from batched_2d import BatchedScanning2D
+from instrumentation import NULL_TRACE
 import time
+import numpy as np
 from scipy import misc
 from matplotlib import pyplot as plt
 
@@ -33,13 +36,24 @@ class InlineScanningObject:
         It holds the scanning geometry to be used;
     vol_geom    : dict
         It holds the characteristics of the reconstruction volume;
+    backend     : object
+        It holds the projector backend that executes projections and reconstructions;
+    trace       : Trace
+        It records the stages of the setup (see instrumentation.py);
     Methods
     -------
+    session(rec_algorithm_param, n_iterations_param, tol_param=None, update_tol_param=None)
+        It opens a session that reuses the reconstruction objects across many phantoms.
     run(phantom_param, rec_algorithm_param='SIRT_CUDA', n_iterations_param=100)
         It executes an image reconstruction using the projections acquired in the inline setup.
+    run_progressive(phantom_param, rec_algorithm_param='SIRT_CUDA', n_iterations_param=100, every_param=10)
+        It yields the reconstruction every every_param iterations, so that it can be stopped early.
+    run_batch(phantoms_param, rec_algorithm_param='SIRT_CUDA', n_iterations_param=100, batch_size=64)
+        It executes the image reconstructions of a stack of phantoms in batches.
     """
 
-    def __init__(self, alpha_param, n_cells_param, n_proj_param, rec_size_param=128, omega_rotation=0):
+    def __init__(self, alpha_param, n_cells_param, n_proj_param, rec_size_param=128, omega_rotation=0, backend='cuda',
+                 cache=None, trace=None):
         """
         It creates a new instance of the class ScanningExecution.
         :param alpha_param: fan-beam opening angle of the X-ray source used in the inline CT setup;
@@ -47,56 +61,101 @@ class InlineScanningObject:
         :param n_proj_param: number of X-ray projections aquired during the object movement;
         :param rec_size_param: number W of pixels of the W x W reconstruction grid;
         :param omega_rotation: total object rotation (in degrees) around its own axis between the first and the last projection
-        acquisition.
+        acquisition;
+        :param backend: projector backend, 'cuda' (ASTRA Toolbox), 'cpu' or 'sparse' (cached system matrix, for small
+        geometries) (see projector_backend.py);
+        :param cache: ResultCache consulted by run() and by the sessions (see result_cache.py), or None;
+        :param trace: instrumentation.Trace recording the stages of the setup, its sessions and runs, or None.
         """
 
 
-        self.vol_geom = astra.create_vol_geom(rec_size_param, rec_size_param)
+        self.trace = NULL_TRACE if trace is None else trace
+        with self.trace.stage('geometry'):
+            self.vol_geom = create_vol_geom(rec_size_param, rec_size_param)
 
-        self.setup = InlineScanningSetup2D(alpha=alpha_param, detector_cells=n_cells_param,
-                                         number_of_projections=n_proj_param, object_size=rec_size_param,
-                                         omega_total=omega_rotation)
+            self.setup = InlineScanningSetup2D(alpha=alpha_param, detector_cells=n_cells_param,
+                                             number_of_projections=n_proj_param, object_size=rec_size_param,
+                                             omega_total=omega_rotation)
 
-        self.proj_geom = astra.create_proj_geom('fanflat_vec', n_cells_param, self.setup.get_geometry_matrix())
+            self.proj_geom = create_proj_geom('fanflat_vec', n_cells_param, self.setup.get_geometry_matrix())
+            self.backend_name = backend
+            self.backend = create_backend(backend, self.proj_geom, self.vol_geom)
+        self.cache = cache
 
-    def run(self, phantom_param, rec_algorithm_param='SIRT_CUDA', n_iterations_param=100):
+    def session(self, rec_algorithm_param='SIRT_CUDA', n_iterations_param=100, tol_param=None, update_tol_param=None):
+        """
+        It opens a reconstruction session that keeps the projector, data buffers and algorithm of the inline setup alive
+        between images; each call of its run() method has the same output as the run() method of this class.
+        :param rec_algorithm_param: reconstruction algorithm to be used;
+        :param n_iterations_param: maximum number of iterations to be used in case of iterative reconstructions;
+        :param tol_param: stops the iterations once the relative residual ||b - A x|| / ||b|| falls below it;
+        :param update_tol_param: stops the iterations once the relative update of the reconstruction falls below it;
+        :return: a session object, to be used as a context manager so that every handle is freed on exit.
+        """
+        session = self.backend.session(rec_algorithm_param, n_iterations_param, tol=tol_param,
+                                       update_tol=update_tol_param, trace=self.trace)
+        if self.cache is None:
+            return session
+        return self.cache.wrap(session, self.proj_geom, self.vol_geom, self.backend_name, rec_algorithm_param,
+                               n_iterations_param, tol_param, update_tol_param)
+
+    def run(self, phantom_param, rec_algorithm_param='SIRT_CUDA', n_iterations_param=100, tol_param=None,
+            update_tol_param=None):
         """
         It executes an image reconstruction using the projections acquired in the inline setup.
         :param phantom_param: 2D image of the phantom that should be used to simulate the acquisition of projections from
         real object;
         :param rec_algorithm_param: reconstruction algorithm to be used. The option available are: SIRT_CUDA and FBP_CUDA;
-        :param n_iterations_param: number of iterations to be used in case of iterative reconstructions;
+        :param n_iterations_param: maximum number of iterations to be used in case of iterative reconstructions;
+        :param tol_param: stops the iterations once the relative residual ||b - A x|| / ||b|| falls below it;
+        :param update_tol_param: stops the iterations once the relative update of the reconstruction falls below it;
         :return: a dictionary containing the reconstructed image into 'rec' index, the reconstruction time into 'time' index,
-        and the acquired sinogram into the 'sino' index;
+        the number of iterations run into 'iterations' index, the acquired sinogram into the 'sino' index, and, with a
+        trace, the wall time, CPU time and bytes of every stage of the run into the 'stages' index;
         """
 
 
-        proj_id = astra.create_projector('cuda', self.proj_geom, self.vol_geom)
-        sinogram_id, sinogram = astra.create_sino(phantom_param, proj_id)
-
-        rec_id = astra.data2d.create('-vol', self.vol_geom)
-        cfg = astra.astra_dict(rec_algorithm_param)
-        cfg['ReconstructionDataId'] = rec_id
-        cfg['ProjectionDataId'] = sinogram_id
-        alg_id = astra.algorithm.create(cfg)
+        mark = self.trace.mark()
+        with self.session(rec_algorithm_param, n_iterations_param, tol_param, update_tol_param) as session:
+            output = session.run(phantom_param)
+        if self.trace:
+            output['stages'] = self.trace.summary(mark)
 
-        if rec_algorithm_param == 'SIRT_CUDA':
-            start_time = time.time()
-            astra.algorithm.run(alg_id, n_iterations_param)
-            elapsed_time = time.time() - start_time
-        else:
-            astra.algorithm.run(alg_id)
-            start_time = time.time()
-            elapsed_time = time.time() - start_time
-
-        output = {'rec': astra.data2d.get(rec_id), 'time': elapsed_time, 'sino': sinogram}
+        return output
 
-        astra.algorithm.delete(alg_id)
-        astra.data2d.delete(rec_id)
-        astra.data2d.delete(sinogram_id)
-        astra.projector.delete(proj_id)
+    def run_progressive(self, phantom_param, rec_algorithm_param='SIRT_CUDA', n_iterations_param=100, every_param=10,
+                        tol_param=None, update_tol_param=None):
+        """
+        It executes an image reconstruction progressively: the current reconstruction is yielded every every_param
+        iterations, so that the caller can use it or stop early (e.g. once it is good enough or a deadline is reached)
+        by leaving the loop; the session is then closed.
+        :param phantom_param: volume of the phantom;
+        :param rec_algorithm_param: reconstruction algorithm to be used;
+        :param n_iterations_param: maximum number of iterations;
+        :param every_param: number of iterations between two yielded reconstructions;
+        :param tol_param: stops the iterations once the relative residual ||b - A x|| / ||b|| falls below it;
+        :param update_tol_param: stops the iterations once the relative update of the reconstruction falls below it;
+        :return: a generator yielding dictionaries containing the current reconstruction into 'rec' index (a view
+        updated by the next iterations; the last one yielded is copied when the generator ends), the number of
+        iterations run into 'iterations' index, the relative residual into 'residual' index, the time spent into 'time'
+        index and the acquired sinogram into the 'sino' index;
+        """
+        with self.session(rec_algorithm_param, n_iterations_param, tol_param, update_tol_param) as session:
+            yield from session.run_progressive(phantom_param, every_param)
 
-        return output
+    def run_batch(self, phantoms_param, rec_algorithm_param='SIRT_CUDA', n_iterations_param=100, batch_size=64):
+        """
+        It executes the image reconstruction of a stack of phantoms, solving batch_size of them in each 3D projection and
+        SIRT call (see batched_2d.py).
+        :param phantoms_param: array of shape (N, W, W) with the 2D phantoms;
+        :param rec_algorithm_param: reconstruction algorithm to be used; only SIRT is available for stacks;
+        :param n_iterations_param: number of SIRT iterations;
+        :param batch_size: number of phantoms per 3D call; larger batches trade latency for throughput;
+        :return: a dictionary containing the N reconstructed images into 'rec' index, the total reconstruction time into
+        'time' index, and the N sinograms into the 'sino' index;
+        """
+        batched = BatchedScanning2D(self.backend_name, self.proj_geom, self.vol_geom, batch_size)
+        return batched.run(phantoms_param, rec_algorithm_param, n_iterations_param)
 
 
 if __name__ == '__main__':
@@ -106,7 +165,7 @@ if __name__ == '__main__':
     a = 45
 
     plane = imread("test.tif")
-    plane = resize(plane, (128, 128))
+    plane = resize(plane, (128, 128)).astype(np.float32)
     setup = InlineScanningObject(alpha_param=a, n_cells_param=519, n_proj_param=p, rec_size_param=128, omega_rotation=0)
     out = setup.run(plane)
 
@@ -1,7 +1,8 @@
 import astra
 import numpy as np
-from imageio import imread, imwrite
 import os
+from volume_store import load_slices
+from result_writer import ResultWriter
 
 vol_geom = astra.create_vol_geom(187, 547, 565)
 
@@ -9,17 +10,12 @@ src = "C:\\Users\\Luis\\Desktop\\PC Antuerpia\\Datasets\\Lamino\\pssp_cfk91_CT1_
 angles = np.linspace(0, np.pi, 300,False)
 proj_geom = astra.create_proj_geom('cone', 1.0, 1.0, 800, 800, angles, 1200, 95)
 
-data = os.listdir(src)
-plane = np.zeros((565, 187, 547))
-k = 0
-for file in data:
-    print(file)
-    i = imread(src + file)
-    plane[:, :, k] = (i)
-    k = k + 1
+# (565, 187, 547) memory-mapped float32 volume of the slice stack: plane[:, :, k] = slice k
+plane = load_slices(src, 'lamino_phantom_slices_120.npy', axes=(1, 2, 0))
 
-# Create projection data from this
-proj_id, proj_data = astra.create_sino3d_gpu(plane, proj_geom, vol_geom)
+# Link the phantom to a data object (no copy) and create projection data from it
+vol_id = astra.data3d.link('-vol', vol_geom, plane)
+proj_id, proj_data = astra.create_sino3d_gpu(vol_id, proj_geom, vol_geom)
 
 # Create a data object for the reconstruction
 rec_id = astra.data3d.create('-vol', vol_geom)
@@ -50,11 +46,12 @@ if not os.path.isdir(".\\PROJS\\"):
 
 #for z in range(360):
 #    imwrite(".\\PROJS\\proj{:05d}.png".format(z), proj_data[:, z, :])
-for k in range(547):
-    imwrite(".\\REC\\slice{:05d}.png".format(k), np.transpose(rec[:,:,k]))
+with ResultWriter() as writer:
+    writer.write_slices(".\\REC\\", rec, axis=2, transpose=True, copy=False)
 
 # Clean up. Note that GPU memory is tied up in the algorithm object,
 # and main RAM in the data objects.
 astra.algorithm.delete(alg_id)
 astra.data3d.delete(rec_id)
-astra.data3d.delete(proj_id)
\ No newline at end of file
+astra.data3d.delete(proj_id)
+astra.data3d.delete(vol_id)
\ No newline at end of file
@@ -1,34 +1,70 @@
-
 import os
-import random
-from imageio import imread, imwrite
+import zlib
+from functools import partial
+import numpy as np
 from skimage.transform import resize
+from sample_store import pack_images
 
 defect = "D:\\Datasets\\kuLeuven\\defect\\"
 healthy = "D:\\Datasets\\kuLeuven\\healthy\\"
 
-dest = "D:\\Datasets\\kuLeuven\\sample-128\\"
+dest = "D:\\Datasets\\kuLeuven\\sample-128.npy"
 
 sampling = 100
+seed = 0
+size = (128, 128)
+
+
+def select_slices(folder, sampling, seed, first=75, last=250):
+    """
+    It draws the slices of a sample: `sampling` slices among the .tif files first..last of its stacked0/merge folder.
+    The draw only depends on the seed and on the name of the sample, so it is the same whatever the other samples, the
+    order in which the samples are listed or the number of workers.
+    :param folder: folder of the sample;
+    :param sampling: number of slices per sample;
+    :param seed: seed of the dataset;
+    :param first: first candidate slice (in name order);
+    :param last: end of the candidate slices;
+    :return: the list of the selected slice files.
+    """
+    merge = os.path.join(folder, "stacked0", "merge")
+    slices = sorted(x for x in os.listdir(merge) if x.endswith(".tif"))[first:last]
+    name = os.path.basename(os.path.normpath(folder))
+    rng = np.random.default_rng([seed, zlib.crc32(name.encode())])
+    return [os.path.join(merge, slices[k]) for k in rng.permutation(len(slices))[:sampling]]
+
+
+def resize_slice(image, size, scale=255.0):
+    """
+    It resizes a slice to the size of the dataset, with the intensities of the 8-bit images of the former PNG dataset
+    (0..255) but without their quantization.
+    """
+    return resize(image, size) * scale
+
 
-for data in [defect, healthy]:
-    m = 0
-    for folder in os.listdir(data):
-        slices = os.listdir(data+folder+"\\stacked0\\merge\\")
-        slices = [x for x in slices if x.endswith(".tif")]
-        slices = slices[75:250]
-        random.shuffle(slices)
-        selected = slices[0:sampling]
-
-        s = 0
-        for img in selected:
-            i = imread(data+folder+"\\stacked0\\merge\\"+img)
-            i = resize(i, (128, 128))
-            if data == healthy:
-                imwrite(dest+"health_sample_{}_slice_{}.png".format(m,s), i)
-            else:
-                imwrite(dest +"defect_sample_{}_slice_{}.png".format(m, s), i)
-            s = s + 1
-        m = m + 1
+def preprocess(sources, dest, sampling=100, seed=0, size=(128, 128), first=75, last=250, workers=None):
+    """
+    It builds the packed 2D dataset of the Leuven samples: the slices selected by select_slices() are read and resized
+    in parallel and written into the store dest (see sample_store.py), indexed by their name, label, sample and slice.
+    :param sources: dictionary label -> folder holding one folder per sample (e.g. {'defect': ..., 'health': ...});
+    :param dest: name of the .npy file of the store;
+    :param sampling: number of slices per sample;
+    :param seed: seed of the dataset;
+    :param size: size of the stored slices;
+    :param first: first candidate slice of every sample (in name order);
+    :param last: end of the candidate slices;
+    :param workers: number of worker processes (default: all cores);
+    :return: dest.
+    """
+    files, rows = [], []
+    for label, data in sources.items():
+        for m, folder in enumerate(sorted(os.listdir(data))):
+            for s, img in enumerate(select_slices(os.path.join(data, folder), sampling, seed, first, last)):
+                files.append(img)
+                rows.append({'name': "{}_sample_{}_slice_{}".format(label, m, s), 'label': label, 'sample': folder,
+                             'slice': os.path.basename(img), 'seed': seed})
+    return pack_images(files, dest, size, rows, partial(resize_slice, size=size), workers)
 
 
+if __name__ == '__main__':
+    preprocess({"defect": defect, "health": healthy}, dest, sampling, seed, size)
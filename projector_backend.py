@@ -0,0 +1,746 @@
+import time
+import numpy as np
+from iterative_solvers import CPUOperator, AstraOperator, ITERATIVE_ALGORITHMS, get_solver, progressive, \
+    select_projections
+from system_matrix import SparseOperator, CACHE_DIR, array_shapes
+from instrumentation import NULL_TRACE, nbytes
+
+BACKENDS = ('cuda', 'cpu', 'sparse')
+# reconstruction algorithms of ASTRA Toolbox run by AstraSession; the others run on AstraOperator (see
+# AstraCudaBackend.session)
+ASTRA_ALGORITHMS = ('FBP_CUDA', 'SIRT_CUDA', 'SART_CUDA', 'CGLS_CUDA', 'EM_CUDA')
+ASTRA_3D_ALGORITHMS = ('FDK_CUDA', 'SIRT3D_CUDA', 'CGLS3D_CUDA')
+
+
+class AstraCudaBackend:
+    """
+    This class executes the projections and reconstructions of a scanning geometry with the CUDA algorithms of ASTRA
+    Toolbox.
+    Attributes
+    ----------
+    proj_geom   : dict
+        It holds the projection geometry to be used;
+    vol_geom    : dict
+        It holds the characteristics of the reconstruction volume;
+    vol_shape   : tuple
+        Shape of the volume arrays, as in ASTRA;
+    sino_shape  : tuple
+        Shape of the sinogram arrays, as in ASTRA;
+    operator    : AstraOperator
+        It holds the matrix-free projection operator of the geometry, created on first use, on which the algorithms
+        that ASTRA does not provide run (see session());
+    Methods
+    -------
+    upload(volume)
+        It links a volume to an ASTRA data object so that several forward projections can share it.
+    release(handle)
+        It frees a volume returned by upload().
+    forward(volume, projections=None, out=None)
+        It simulates the acquisition of the projections of a volume.
+    reconstruct(sinogram, algorithm, n_iterations, tol=None, update_tol=None)
+        It reconstructs a volume from the given projections.
+    session(algorithm, n_iterations, simulate=None, tol=None, update_tol=None, trace=None)
+        It opens a session that reuses its objects to reconstruct many phantoms in the same geometry.
+    """
+
+    def __init__(self, proj_geom, vol_geom):
+        """
+        It creates a new instance of the class AstraCudaBackend.
+        :param proj_geom: ASTRA projection geometry ('fanflat_vec' or 'cone_vec');
+        :param vol_geom: ASTRA volume geometry.
+        """
+        import astra
+        self.astra = astra
+        self.proj_geom = proj_geom
+        self.vol_geom = vol_geom
+        self.is_3d = proj_geom['type'].startswith('cone') or proj_geom['type'].startswith('parallel3d')
+        self.vol_shape, self.sino_shape = array_shapes(proj_geom, vol_geom)
+        self._operator = None
+
+    @property
+    def operator(self):
+        if self._operator is None:
+            self._operator = AstraOperator(self.proj_geom, self.vol_geom)
+        return self._operator
+
+    def upload(self, volume):
+        """
+        It links a volume to an ASTRA data object, without copying it, so that several forward projections can share
+        it; the volume must not be freed before release().
+        :param volume: C-contiguous float32 phantom in the ASTRA layout of vol_geom (see check_float32);
+        :return: the ASTRA id of the volume data.
+        """
+        data = self.astra.data3d if self.is_3d else self.astra.data2d
+        return data.link('-vol', self.vol_geom, check_float32(volume, self.vol_shape, 'volume'))
+
+    def release(self, handle):
+        """
+        It frees a volume returned by upload().
+        :param handle: the ASTRA id of the volume data.
+        """
+        data = self.astra.data3d if self.is_3d else self.astra.data2d
+        data.delete(handle)
+
+    def forward(self, volume, projections=None, out=None):
+        """
+        It simulates the acquisition of the projections of a volume. The volume and the sinogram are linked to the ASTRA
+        data objects, so the projector reads and writes the NumPy buffers without intermediate copies.
+        :param volume: C-contiguous float32 phantom in the ASTRA layout of vol_geom, or a handle returned by upload();
+        :param projections: slice (or index array) of the projections to simulate (default: all of them);
+        :param out: C-contiguous float32 array receiving the sinogram (default: a new array);
+        :return: the float32 sinogram in the ASTRA layout of proj_geom.
+        """
+        astra = self.astra
+        data = astra.data3d if self.is_3d else astra.data2d
+        proj_geom = select_projections(self.proj_geom, projections)
+        shape = array_shapes(proj_geom, self.vol_geom)[1]
+        if out is None:
+            out = np.zeros(shape, dtype=np.float32)
+        else:
+            check_float32(out, shape, 'out').fill(0)
+
+        linked = isinstance(volume, np.ndarray)
+        vol_id = self.upload(volume) if linked else volume
+        sino_id = data.link('-sino', proj_geom, out)
+        try:
+            cfg = astra.astra_dict('FP3D_CUDA' if self.is_3d else 'FP_CUDA')
+            cfg['VolumeDataId'] = vol_id
+            cfg['ProjectionDataId'] = sino_id
+            alg_id = astra.algorithm.create(cfg)
+            try:
+                astra.algorithm.run(alg_id)
+            finally:
+                astra.algorithm.delete(alg_id)
+        finally:
+            data.delete(sino_id)
+            if linked:
+                data.delete(vol_id)
+        return out
+
+    def reconstruct(self, sinogram, algorithm, n_iterations=100, tol=None, update_tol=None):
+        """
+        It reconstructs a volume from the given projections.
+        :param sinogram: projections in the ASTRA layout of proj_geom;
+        :param algorithm: name of the ASTRA algorithm (e.g. SIRT_CUDA, FBP_CUDA or SIRT3D_CUDA);
+        :param n_iterations: maximum number of iterations to be used in case of iterative reconstructions;
+        :param tol: relative residual tolerance of iterative reconstructions (see AstraSession);
+        :param update_tol: relative update tolerance of iterative reconstructions (see AstraSession);
+        :return: a dictionary containing the reconstructed volume into 'rec' index, the time spent by the algorithm
+        into 'time' index and the number of iterations run into 'iterations' index.
+        """
+        with self.session(algorithm, n_iterations, tol=tol, update_tol=update_tol) as session:
+            return session.reconstruct(sinogram)
+
+    def session(self, algorithm, n_iterations=100, simulate=None, tol=None, update_tol=None, trace=None):
+        """
+        It opens a reconstruction session that keeps the ASTRA data and algorithm objects alive between images. The
+        algorithms that ASTRA does not provide for the geometry (e.g. SART3D_CUDA, or the names of the CPU backend such
+        as SIRT, CGLS or SART) run the solvers of iterative_solvers.py on the CUDA projectors, through operator.
+        :param algorithm: name of the algorithm (e.g. SIRT_CUDA, FBP_CUDA, SIRT3D_CUDA or SART3D_CUDA);
+        :param n_iterations: maximum number of iterations to be used in case of iterative reconstructions;
+        :param simulate: function simulate(phantom, out) writing the sinogram of a phantom into out, replacing the
+        forward projection of the session;
+        :param tol: relative residual tolerance of iterative reconstructions (see AstraSession);
+        :param update_tol: relative update tolerance of iterative reconstructions (see AstraSession);
+        :param trace: instrumentation.Trace recording the stages and iterations of the session, or None;
+        :return: an AstraSession (a CPUSession on operator for the other algorithms), to be closed by close() or used
+        as a context manager.
+        """
+        if algorithm.upper() not in (ASTRA_3D_ALGORITHMS if self.is_3d else ASTRA_ALGORITHMS):
+            return CPUSession(self, algorithm, n_iterations, simulate, tol, update_tol, trace)
+        return AstraSession(self, algorithm, n_iterations, simulate, tol, update_tol, trace=trace)
+
+
+class AstraSession:
+    """
+    This class holds the ASTRA objects needed to simulate and reconstruct many phantoms in the same geometry: the
+    sinogram and reconstruction data objects are linked to two float32 NumPy buffers and the reconstruction algorithm
+    is created once, and every object is freed by close() (or on leaving a with block). The phantoms are linked to the
+    projector without copying, the projections are written straight into the sinogram buffer and the algorithm works
+    on the buffers themselves, so the host holds a single copy of each volume and sinogram; the arrays returned by the
+    session are these buffers, overwritten by the next phantom (copy them to keep them).
+    With a tolerance, iterative algorithms run check_every iterations at a time and stop as soon as the residual norm
+    reported by ASTRA, relative to the norm of the sinogram, falls below tol, or the mean relative update of the
+    reconstruction over the last check_every iterations falls below update_tol.
+    With a trace, the upload, forward, iterations and download stages are recorded; CUDA algorithms copy the volume
+    back into its buffer at the end of every run of ASTRA, so the download records the bytes of these copies while
+    their time stays within the iterations. When callbacks are registered on the trace, iterative algorithms also run
+    trace.every iterations at a time (at most check_every) and report the residual and the current reconstruction after
+    each run.
+    Attributes
+    ----------
+    sinogram    : ndarray
+        It holds the float32 sinogram linked to the algorithm; simulate functions write into it;
+    volume      : ndarray
+        It holds the float32 reconstruction linked to the algorithm;
+    Methods
+    -------
+    forward(phantom)
+        It simulates the acquisition of the projections of a phantom.
+    reconstruct(sinogram=None, x0=None)
+        It reconstructs the volume from the given projections (default: the last simulated ones).
+    iterate(sinogram=None, every=10, x0=None)
+        It reconstructs the volume progressively, yielding the current reconstruction every `every` iterations.
+    run(phantom)
+        It simulates and reconstructs a phantom, as the run() methods of the scanning objects.
+    run_progressive(phantom, every=10)
+        It simulates a phantom and reconstructs it progressively.
+    close()
+        It frees every ASTRA object of the session.
+    """
+
+    def __init__(self, backend, algorithm, n_iterations, simulate=None, tol=None, update_tol=None, check_every=10,
+                 trace=None):
+        """
+        It creates a new instance of the class AstraSession.
+        :param backend: AstraCudaBackend providing the geometries;
+        :param algorithm: name of the ASTRA reconstruction algorithm;
+        :param n_iterations: maximum number of iterations to be used in case of iterative reconstructions;
+        :param simulate: function simulate(phantom, out) writing the sinogram of a phantom into the float32 array out
+        (and returning it), replacing the forward projection of the session;
+        :param tol: stops once the relative residual ||b - A x|| / ||b|| falls below tol;
+        :param update_tol: stops once the mean relative update per iteration falls below update_tol;
+        :param check_every: number of iterations between two convergence checks;
+        :param trace: instrumentation.Trace recording the stages and iterations of the session, or None.
+        """
+        astra = backend.astra
+        self.astra = astra
+        self.backend = backend
+        self.data = astra.data3d if backend.is_3d else astra.data2d
+        self.iterative = algorithm.upper().startswith(ITERATIVE_ALGORITHMS)
+        self.on_device = algorithm.upper().endswith('_CUDA')
+        self.n_iterations = n_iterations if self.iterative else 1
+        self.simulate = simulate
+        self.tol = tol
+        self.update_tol = update_tol
+        self.check_every = check_every
+        self.trace = NULL_TRACE if trace is None else trace
+        self.data_ids, self.alg_ids = [], []
+
+        self.sinogram = np.zeros(backend.sino_shape, dtype=np.float32)
+        self.volume = np.zeros(backend.vol_shape, dtype=np.float32)
+        try:
+            self.sino_id = self._link_data('-sino', backend.proj_geom, self.sinogram)
+            self.rec_id = self._link_data('-vol', backend.vol_geom, self.volume)
+
+            cfg = astra.astra_dict(algorithm)
+            cfg['ReconstructionDataId'] = self.rec_id
+            cfg['ProjectionDataId'] = self.sino_id
+            self.alg_id = self._create_algorithm(cfg)
+        except Exception:
+            self.close()
+            raise
+
+    def _link_data(self, kind, geometry, array):
+        data_id = self.data.link(kind, geometry, array)
+        self.data_ids.append(data_id)
+        return data_id
+
+    def _create_algorithm(self, cfg):
+        alg_id = self.astra.algorithm.create(cfg)
+        self.alg_ids.append(alg_id)
+        return alg_id
+
+    def forward(self, phantom):
+        """
+        It simulates the acquisition of the projections of a phantom into the sinogram buffer of the session.
+        :param phantom: C-contiguous float32 volume in the ASTRA layout of vol_geom (see check_float32);
+        :return: the sinogram buffer, in the ASTRA layout of proj_geom.
+        """
+        if self.simulate is not None:
+            sinogram = self.simulate(phantom, out=self.sinogram)
+            if sinogram is not self.sinogram:
+                with self.trace.stage('upload', nbytes(sinogram)):
+                    np.copyto(self.sinogram, check_float32(sinogram, self.sinogram.shape, 'sinogram'))
+            return self.sinogram
+
+        with self.trace.stage('forward', self.sinogram.nbytes):
+            self.backend.forward(phantom, out=self.sinogram)
+        return self.sinogram
+
+    def reconstruct(self, sinogram=None, x0=None):
+        """
+        It reconstructs the volume from the given projections.
+        :param sinogram: projections in the ASTRA layout of proj_geom (default: the last ones simulated by forward());
+        :param x0: initial volume of iterative algorithms, e.g. a previous estimate to warm-start from (default: zeros);
+        :return: a dictionary containing the reconstructed volume into 'rec' index (the volume buffer of the session),
+        the time spent by the algorithm into 'time' index and the number of iterations run into 'iterations' index.
+        """
+        self._store(sinogram, x0)
+
+        start_time = time.time()
+        with self.trace.stage('iterations') as record:
+            chunked = self.tol is not None or self.update_tol is not None or self.trace.wants_iterations()
+            if self.iterative and chunked:
+                iterations, runs = self._run_to_tolerance()
+            else:
+                self.astra.algorithm.run(self.alg_id, self.n_iterations)
+                iterations, runs = self.n_iterations, 1
+            record['iterations'] = iterations
+        elapsed_time = time.time() - start_time
+
+        # the volume buffer is handed over as is: only the copies of the device made by ASTRA are counted
+        with self.trace.stage('download', self.volume.nbytes * runs if self.on_device else 0, runs=runs):
+            rec = self.volume
+        return {'rec': rec, 'time': elapsed_time, 'iterations': iterations}
+
+    def iterate(self, sinogram=None, every=10, x0=None):
+        """
+        It reconstructs the volume progressively, so that the caller can use intermediate results or stop early (e.g.
+        once the quality is good enough or a time budget runs out) by leaving the loop. The iterations stop after
+        n_iterations or once a tolerance is met; non-iterative algorithms yield once.
+        :param sinogram: projections in the ASTRA layout of proj_geom (default: the last ones simulated by forward());
+        :param every: number of iterations between two yielded states;
+        :param x0: initial volume of iterative algorithms (default: zeros);
+        :return: a generator yielding dictionaries containing the current reconstruction into 'rec' index (the volume
+        buffer of the session, overwritten by the next iterations: copy it to keep it), the number of
+        iterations run into 'iterations' index, the relative residual ||b - A x|| / ||b|| into 'residual' index and the
+        time spent since the start into 'time' index.
+        """
+        self._store(sinogram, x0)
+        start_time = time.time()
+        if not self.iterative:
+            self.astra.algorithm.run(self.alg_id, self.n_iterations)
+            yield {'rec': self.volume, 'iterations': self.n_iterations, 'residual': None,
+                   'time': time.time() - start_time}
+            return
+
+        for iterations, residual in self._run_chunks(every, True):
+            yield {'rec': self.volume, 'iterations': iterations, 'residual': residual,
+                   'time': time.time() - start_time}
+
+    def _store(self, sinogram, x0):
+        # the data objects are linked to the buffers of the session, so only the inputs held elsewhere are copied
+        if sinogram is self.sinogram:
+            sinogram = None
+        with self.trace.stage('upload', nbytes(sinogram) + (0 if x0 is self.volume else nbytes(x0))):
+            if sinogram is not None:
+                np.copyto(self.sinogram, check_float32(sinogram, self.sinogram.shape, 'sinogram'))
+            if x0 is None:
+                self.volume.fill(0)
+            elif x0 is not self.volume:
+                np.copyto(self.volume, check_float32(x0, self.volume.shape, 'x0'))
+
+    def _run_to_tolerance(self):
+        """
+        It runs the algorithm check_every iterations at a time (trace.every when callbacks are registered) until a
+        tolerance is met, and returns the number of iterations and of runs of the algorithm.
+        """
+        report = self.trace.wants_iterations()
+        chunk = min(self.check_every, self.trace.every) if report else self.check_every
+        iterations, runs = 0, 0
+        for iterations, residual in self._run_chunks(chunk, report):
+            runs += 1
+            if report:
+                self.trace.iteration(iterations, self.volume, residual)
+        return iterations, runs
+
+    def _run_chunks(self, chunk, residuals=False):
+        """
+        It runs the algorithm chunk iterations at a time, yielding the tuple (iterations, residual) after every run,
+        until n_iterations are run or a tolerance is met (the algorithm continues from the reconstruction it left in
+        rec_id). The relative residual is None unless tol is set or residuals is True.
+        """
+        sino_norm = np.linalg.norm(self.sinogram)
+        previous = np.zeros(1, dtype=np.float32)
+        iterations = 0
+        while iterations < self.n_iterations:
+            step = min(chunk, self.n_iterations - iterations)
+            self.astra.algorithm.run(self.alg_id, step)
+            iterations += step
+
+            residual = None
+            if self.tol is not None or residuals:
+                residual = self.astra.algorithm.get_res_norm(self.alg_id) / sino_norm if sino_norm > 0 else 0.0
+            yield iterations, residual
+
+            if self.tol is not None and residual <= self.tol:
+                return
+            if self.update_tol is not None:
+                if np.linalg.norm(self.volume - previous) <= self.update_tol * step * np.linalg.norm(self.volume):
+                    return
+                previous = self.volume.copy()
+
+    def run(self, phantom):
+        """
+        It simulates and reconstructs a phantom.
+        :param phantom: volume in the ASTRA layout of vol_geom;
+        :return: a dictionary containing the reconstructed volume into 'rec' index, the reconstruction time into 'time'
+        index, and the acquired sinogram into the 'sino' index.
+        """
+        sinogram = self.forward(phantom)
+        output = self.reconstruct()
+        output['sino'] = sinogram
+        return output
+
+    def run_progressive(self, phantom, every=10):
+        """
+        It simulates a phantom and reconstructs it progressively (see iterate()).
+        :param phantom: volume in the ASTRA layout of vol_geom;
+        :param every: number of iterations between two yielded states;
+        :return: a generator yielding the dictionaries of iterate() with the acquired sinogram into the 'sino' index.
+        """
+        return _run_progressive(self, phantom, every)
+
+    def close(self):
+        """
+        It frees every ASTRA object of the session; calling it more than once is harmless. The buffers of the session,
+        and so the arrays it returned, stay valid.
+        """
+        while self.alg_ids:
+            self.astra.algorithm.delete(self.alg_ids.pop())
+        while self.data_ids:
+            self.data.delete(self.data_ids.pop())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CPUBackend:
+    """
+    This class executes the projections and reconstructions of a scanning geometry on the CPU, with the vectorized
+    ray-driven projector of cpu_projector.py and the iterative solvers of iterative_solvers.py, so that the scanning
+    objects run on machines without CUDA.
+    Attributes
+    ----------
+    operator    : CPUOperator
+        It holds the matrix-free projection operator of the geometry;
+    projector   : RayDrivenProjector
+        It holds the forward and back projector of the geometry;
+    Methods
+    -------
+    upload(volume)
+        It converts a volume to the layout used by the projector so that several forward projections can share it.
+    release(handle)
+        It frees a volume returned by upload().
+    forward(volume, projections=None)
+        It simulates the acquisition of the projections of a volume.
+    reconstruct(sinogram, algorithm, n_iterations, tol=None, update_tol=None)
+        It reconstructs a volume from the given projections.
+    session(algorithm, n_iterations, simulate=None, tol=None, update_tol=None, trace=None)
+        It opens a session that reuses its objects to reconstruct many phantoms in the same geometry.
+    """
+
+    def __init__(self, proj_geom, vol_geom, **projector_options):
+        """
+        It creates a new instance of the class CPUBackend.
+        :param proj_geom: ASTRA projection geometry ('fanflat_vec' or 'cone_vec');
+        :param vol_geom: ASTRA volume geometry;
+        :param projector_options: keyword arguments forwarded to RayDrivenProjector (step, chunk_elements, n_workers,
+        use_numba).
+        """
+        self.proj_geom = proj_geom
+        self.vol_geom = vol_geom
+        self.projector_options = projector_options
+        self.operator = CPUOperator(proj_geom, vol_geom, **projector_options)
+        self.projector = self.operator.projector
+
+    def upload(self, volume):
+        """
+        It checks that a volume is in the layout used by the projector so that several forward projections can share it.
+        :param volume: C-contiguous float32 phantom in the ASTRA layout of vol_geom (see check_float32);
+        :return: the volume itself.
+        """
+        return check_float32(volume, name='volume')
+
+    def release(self, handle):
+        """
+        It frees a volume returned by upload(); host arrays are left to the garbage collector.
+        """
+        pass
+
+    def forward(self, volume, projections=None, out=None):
+        """
+        It simulates the acquisition of the projections of a volume.
+        :param volume: C-contiguous float32 phantom in the ASTRA layout of vol_geom, or a handle returned by upload();
+        :param projections: slice (or index array) of the projections to simulate (default: all of them);
+        :param out: float32 array receiving the sinogram (default: a new array);
+        :return: the float32 sinogram in the ASTRA layout of proj_geom.
+        """
+        operator = self.operator if projections is None else self.operator.subset(projections)
+        sinogram = operator.forward(check_float32(volume, name='volume'))
+        if out is None:
+            return sinogram
+        np.copyto(check_float32(out, sinogram.shape, 'out'), sinogram)
+        return out
+
+    def reconstruct(self, sinogram, algorithm='SIRT', n_iterations=100, tol=None, update_tol=None):
+        """
+        It reconstructs a volume from the given projections.
+        :param sinogram: projections in the ASTRA layout of proj_geom;
+        :param algorithm: name of the algorithm; the SIRT, CGLS and SART variants of ASTRA (e.g. SIRT_CUDA, CGLS3D_CUDA)
+        are mapped to the solvers of iterative_solvers.py, and FBP and FDK (e.g. FBP_CUDA) to the one-pass filtered
+        backprojection of fdk.py;
+        :param n_iterations: maximum number of iterations;
+        :param tol: relative residual tolerance (see iterative_solvers.sirt);
+        :param update_tol: relative update tolerance (see iterative_solvers.sirt);
+        :return: a dictionary containing the reconstructed volume into 'rec' index, the time spent by the algorithm
+        into 'time' index and the number of iterations run into 'iterations' index.
+        """
+        with self.session(algorithm, n_iterations, tol=tol, update_tol=update_tol) as session:
+            return session.reconstruct(sinogram)
+
+    def session(self, algorithm='SIRT', n_iterations=100, simulate=None, tol=None, update_tol=None, trace=None):
+        """
+        It opens a reconstruction session that reuses the operator and its cached weights between images.
+        :param algorithm: name of the algorithm (see reconstruct());
+        :param n_iterations: maximum number of iterations;
+        :param simulate: function simulate(phantom) returning the sinogram of a phantom, replacing the forward
+        projection of the session;
+        :param tol: relative residual tolerance (see iterative_solvers.sirt);
+        :param update_tol: relative update tolerance (see iterative_solvers.sirt);
+        :param trace: instrumentation.Trace recording the stages and iterations of the session, or None;
+        :return: a CPUSession, to be closed by close() or used as a context manager.
+        """
+        return CPUSession(self, algorithm, n_iterations, simulate, tol, update_tol, trace)
+
+
+class SparseBackend(CPUBackend):
+    """
+    This class executes the projections and reconstructions of a small scanning geometry with its system matrix,
+    stored as a scipy.sparse CSR matrix and cached on disk by system_matrix.py, so that it is built once across the
+    dataset and across process restarts. It provides the same methods as CPUBackend; stacks of phantoms are projected
+    by a single sparse matrix-matrix product.
+    Attributes
+    ----------
+    operator    : SparseOperator
+        It holds the system matrix of the geometry;
+    """
+
+    def __init__(self, proj_geom, vol_geom, cache_dir=CACHE_DIR, **projector_options):
+        """
+        It creates a new instance of the class SparseBackend.
+        :param proj_geom: ASTRA projection geometry ('fanflat_vec' or 'cone_vec');
+        :param vol_geom: ASTRA volume geometry;
+        :param cache_dir: folder caching the system matrices (None disables the cache);
+        :param projector_options: keyword arguments forwarded to RayDrivenProjector when the matrix is built.
+        """
+        self.proj_geom = proj_geom
+        self.vol_geom = vol_geom
+        self.projector_options = projector_options
+        self.operator = SparseOperator(proj_geom, vol_geom, cache_dir=cache_dir, **projector_options)
+
+
+class CPUSession:
+    """
+    This class reconstructs many phantoms in the same geometry with the solvers of iterative_solvers.py, on the
+    operator of the CPU backends or, for the algorithms that ASTRA does not provide, of the CUDA backend. It mirrors
+    AstraSession: the operator is created once and the SIRT row and column weights are cached per geometry by
+    iterative_solvers.py.
+    Methods
+    -------
+    forward(phantom)
+        It simulates the acquisition of the projections of a phantom.
+    reconstruct(sinogram=None, x0=None)
+        It reconstructs the volume from the given projections (default: the last simulated ones).
+    iterate(sinogram=None, every=10, x0=None)
+        It reconstructs the volume progressively, yielding the current reconstruction every `every` iterations.
+    run(phantom)
+        It simulates and reconstructs a phantom, as the run() methods of the scanning objects.
+    run_progressive(phantom, every=10)
+        It simulates a phantom and reconstructs it progressively.
+    close()
+        It releases the last sinogram.
+    """
+
+    def __init__(self, backend, algorithm, n_iterations, simulate=None, tol=None, update_tol=None, trace=None):
+        """
+        It creates a new instance of the class CPUSession.
+        :param backend: backend providing the operator (CPUBackend, SparseBackend or AstraCudaBackend);
+        :param algorithm: name of the algorithm (the SIRT, CGLS, SART, FBP and FDK variants are available);
+        :param n_iterations: maximum number of iterations;
+        :param simulate: function simulate(phantom) returning the sinogram of a phantom, replacing the forward
+        projection of the session;
+        :param tol: relative residual tolerance (see iterative_solvers.sirt);
+        :param update_tol: relative update tolerance (see iterative_solvers.sirt);
+        :param trace: instrumentation.Trace recording the forward, iterations and download stages and every iteration,
+        or None.
+        """
+        self.solver = get_solver(algorithm)
+        self.solver_steps = get_solver(algorithm, steps=True)
+        self.operator = backend.operator
+        self.n_iterations = n_iterations
+        self.simulate = simulate
+        self.tol = tol
+        self.update_tol = update_tol
+        self.trace = NULL_TRACE if trace is None else trace
+        self.sinogram = None
+
+    def forward(self, phantom):
+        """
+        It simulates the acquisition of the projections of a phantom.
+        :param phantom: C-contiguous float32 volume in the ASTRA layout of vol_geom (see check_float32);
+        :return: the float32 sinogram in the ASTRA layout of proj_geom.
+        """
+        if self.simulate is not None:
+            self.sinogram = self.simulate(phantom)
+        else:
+            with self.trace.stage('forward') as record:
+                self.sinogram = self.operator.forward(check_float32(phantom, name='phantom'))
+                record['bytes'] = self.sinogram.nbytes
+        return self.sinogram
+
+    def reconstruct(self, sinogram=None, x0=None):
+        """
+        It reconstructs the volume from the given projections.
+        :param sinogram: projections in the ASTRA layout of proj_geom (default: the last ones simulated by forward());
+        :param x0: initial volume, e.g. a previous estimate to warm-start from (default: zeros);
+        :return: a dictionary containing the reconstructed volume into 'rec' index, the time spent by the algorithm
+        into 'time' index and the number of iterations run into 'iterations' index.
+        """
+        sinogram, x0 = self._inputs(sinogram, x0)
+
+        start_time = time.time()
+        with self.trace.stage('iterations') as record:
+            result = self.solver(self.operator, sinogram, self.n_iterations, x0, tol=self.tol,
+                                 update_tol=self.update_tol, callback=self.trace.iteration if self.trace else None)
+            record['iterations'] = result['iterations']
+        elapsed_time = time.time() - start_time
+
+        # the solvers work in host memory, so the reconstruction is handed over without a copy
+        with self.trace.stage('download'):
+            rec = result['rec']
+        return {'rec': rec, 'time': elapsed_time, 'iterations': result['iterations']}
+
+    def iterate(self, sinogram=None, every=10, x0=None):
+        """
+        It reconstructs the volume progressively, so that the caller can use intermediate results or stop early by
+        leaving the loop (see AstraSession.iterate and iterative_solvers.progressive).
+        :param sinogram: projections in the ASTRA layout of proj_geom (default: the last ones simulated by forward());
+        :param every: number of iterations between two yielded states;
+        :param x0: initial volume (default: zeros);
+        :return: a generator yielding dictionaries with the 'rec' (a view updated in place by the next iterations),
+        'iterations', 'residual' and 'time' indexes.
+        """
+        sinogram, x0 = self._inputs(sinogram, x0)
+        steps = self.solver_steps(self.operator, sinogram, self.n_iterations, x0, tol=self.tol,
+                                  update_tol=self.update_tol)
+        return progressive(steps, every)
+
+    def _inputs(self, sinogram, x0):
+        if sinogram is None:
+            sinogram = self.sinogram
+        return check_float32(sinogram, name='sinogram'), None if x0 is None else check_float32(x0, name='x0')
+
+    def run(self, phantom):
+        """
+        It simulates and reconstructs a phantom.
+        :param phantom: volume in the ASTRA layout of vol_geom;
+        :return: a dictionary containing the reconstructed volume into 'rec' index, the reconstruction time into 'time'
+        index, and the acquired sinogram into the 'sino' index.
+        """
+        sinogram = self.forward(phantom)
+        output = self.reconstruct()
+        output['sino'] = sinogram
+        return output
+
+    def run_progressive(self, phantom, every=10):
+        """
+        It simulates a phantom and reconstructs it progressively (see iterate()).
+        :param phantom: volume in the ASTRA layout of vol_geom;
+        :param every: number of iterations between two yielded states;
+        :return: a generator yielding the dictionaries of iterate() with the acquired sinogram into the 'sino' index.
+        """
+        return _run_progressive(self, phantom, every)
+
+    def close(self):
+        """
+        It releases the last sinogram.
+        """
+        self.sinogram = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _run_progressive(session, phantom, every):
+    sinogram = session.forward(phantom)
+    output = None
+    try:
+        for output in session.iterate(every=every):
+            output['sino'] = sinogram
+            yield output
+    finally:
+        # the last reconstruction yielded stays valid once the caller stops and the session frees its buffers
+        if output is not None:
+            output['rec'] = np.array(output['rec'])
+
+
+def check_float32(array, shape=None, name='array'):
+    """
+    It checks that an array can be handed to the projectors as it is: a C-contiguous float32 NumPy array (memory maps
+    included). Other arrays are not converted silently, since every conversion copies the whole volume or sinogram;
+    convert them once where they are loaded or allocated, e.g. with np.ascontiguousarray(array, dtype=np.float32).
+    :param array: array to be checked;
+    :param shape: expected shape (default: any shape);
+    :param name: name of the array in the error message;
+    :return: the array itself.
+    """
+    if not isinstance(array, np.ndarray):
+        raise ValueError("Expected {} to be a float32 NumPy array, got {}".format(name, type(array).__name__))
+    contiguous = array.flags['C_CONTIGUOUS']
+    if array.dtype != np.float32 or not contiguous or (shape is not None and array.shape != tuple(shape)):
+        raise ValueError("Expected {} to be a C-contiguous float32 array{}, got a {}{} array of shape {}".format(
+            name, '' if shape is None else ' of shape {}'.format(tuple(shape)), '' if contiguous else 'non-contiguous ',
+            array.dtype, array.shape))
+    return array
+
+
+def create_vol_geom(rows, cols, slices=None):
+    """
+    It builds the volume geometry returned by astra.create_vol_geom(rows, cols[, slices]), without importing ASTRA, so
+    that the scanning objects run on the 'cpu' and 'sparse' backends where ASTRA is not installed.
+    :param rows: number of rows (y) of the grid;
+    :param cols: number of columns (x) of the grid;
+    :param slices: number of slices (z) of a 3D grid, or None in 2D;
+    :return: the ASTRA volume geometry, centred on the origin with unit voxels.
+    """
+    vol_geom = {'GridRowCount': rows, 'GridColCount': cols,
+                'option': {'WindowMinX': -cols / 2, 'WindowMaxX': cols / 2,
+                           'WindowMinY': -rows / 2, 'WindowMaxY': rows / 2}}
+    if slices is not None:
+        vol_geom['GridSliceCount'] = slices
+        vol_geom['option'].update(WindowMinZ=-slices / 2, WindowMaxZ=slices / 2)
+    return vol_geom
+
+
+def create_proj_geom(geom_type, *args):
+    """
+    It builds the vector projection geometries returned by astra.create_proj_geom, without importing ASTRA:
+    create_proj_geom('fanflat_vec', det_count, vectors) and create_proj_geom('cone_vec', det_rows, det_cols, vectors).
+    :param geom_type: 'fanflat_vec' or 'cone_vec';
+    :param args: detector size and geometry matrix, as in ASTRA;
+    :return: the ASTRA projection geometry.
+    """
+    if geom_type == 'fanflat_vec' and len(args) == 2:
+        return {'type': geom_type, 'DetectorCount': args[0], 'Vectors': args[1]}
+    if geom_type == 'cone_vec' and len(args) == 3:
+        return {'type': geom_type, 'DetectorRowCount': args[0], 'DetectorColCount': args[1], 'Vectors': args[2]}
+    raise ValueError("Unsupported projection geometry '{}' with {} arguments".format(geom_type, len(args)))
+
+
+def create_backend(name, proj_geom, vol_geom, **options):
+    """
+    It instantiates the projector backend used by the scanning objects.
+    :param name: 'cuda' (ASTRA Toolbox CUDA algorithms), 'cpu' (NumPy/Numba ray-driven projector) or 'sparse' (cached
+    system matrix of the ray-driven projector, for small geometries);
+    :param proj_geom: ASTRA projection geometry;
+    :param vol_geom: ASTRA volume geometry;
+    :param options: keyword arguments forwarded to the backend constructor;
+    :return: an object providing upload(volume), release(handle), forward(volume, projections),
+    reconstruct(sinogram, algorithm, n_iterations, tol, update_tol) and
+    session(algorithm, n_iterations, simulate, tol, update_tol, trace).
+    """
+    if name == 'cuda':
+        return AstraCudaBackend(proj_geom, vol_geom, **options)
+    elif name == 'cpu':
+        return CPUBackend(proj_geom, vol_geom, **options)
+    elif name == 'sparse':
+        return SparseBackend(proj_geom, vol_geom, **options)
+    raise ValueError("Unknown backend '{}', expected one of {}".format(name, BACKENDS))
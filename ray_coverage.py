@@ -0,0 +1,169 @@
+import numpy as np
+from cpu_projector import RayDrivenProjector
+
+
+def matrix_geometry(geometry_matrix, detector_cells):
+    """
+    It builds the ASTRA projection geometry of a geometry matrix (e.g. from InlineScanningSetup2D,
+    InlineScanningSetup3D, SemiCircularConveyorBelt or the stacked stages of a multi-view setup) without ASTRA.
+    :param geometry_matrix: (projections, 6) 'fanflat_vec' or (projections, 12) 'cone_vec' matrix;
+    :param detector_cells: number of detector cells, or the tuple (rows, cols) of a 3D detector;
+    :return: the ASTRA projection geometry.
+    """
+    vectors = np.asarray(geometry_matrix, dtype=np.float64)
+    if vectors.ndim != 2 or vectors.shape[1] not in (6, 12):
+        raise ValueError("Expected a geometry matrix with 6 or 12 columns, got shape {}".format(vectors.shape))
+    if vectors.shape[1] == 6:
+        return {'type': 'fanflat_vec', 'DetectorCount': int(np.max(detector_cells)), 'Vectors': vectors}
+    rows, cols = (detector_cells, detector_cells) if np.ndim(detector_cells) == 0 else detector_cells
+    return {'type': 'cone_vec', 'DetectorRowCount': int(rows), 'DetectorColCount': int(cols), 'Vectors': vectors}
+
+
+def coverage_maps(proj_geom, vol_geom, n_bins=18, axis=None, histograms=False, chunk_elements=2 ** 22,
+                  n_workers=None):
+    """
+    It estimates how well a geometry samples a volume, without any projection: the centre of every voxel is projected
+    onto the detector of every projection (as in the back projection of cpu_projector.py), which tells whether a ray
+    of the projection crosses the voxel and at which angle. The angle is measured in the plane orthogonal to `axis`,
+    modulo 180 degrees, and binned into n_bins sectors; a voxel seen from few sectors can only be reconstructed with
+    limited-angle artefacts, whatever the number of iterations. The voxels are processed in chunks by several threads.
+    :param proj_geom: ASTRA projection geometry ('fanflat_vec' or 'cone_vec', see matrix_geometry);
+    :param vol_geom: ASTRA volume geometry;
+    :param n_bins: number of angular sectors covering 180 degrees;
+    :param axis: world (x, y, z) direction orthogonal to the plane of the angles (default: the mean direction of the
+    detector columns, that is the z axis in 2D);
+    :param histograms: also returns the angular histogram of every voxel (n_bins times the size of the volume);
+    :param chunk_elements: upper bound on the number of voxel-projection pairs held in memory per chunk;
+    :param n_workers: number of threads (default: all cores);
+    :return: a dictionary containing, in the ASTRA volume layout, the number of projections whose rays cross every voxel
+    into 'hits' index, the fraction of angular sectors from which it is seen into 'coverage' index, the largest run of
+    consecutive sectors from which it is not seen (in degrees) into 'gap' index and, when requested, the histograms of
+    shape vol_shape + (n_bins,) into 'angles' index.
+    """
+    projector = RayDrivenProjector(proj_geom, vol_geom, n_workers=n_workers)
+    n_voxels = int(np.prod(projector.grid))
+    e1, e2 = _plane_basis(np.mean(projector.v, axis=0) if axis is None else np.asarray(axis, dtype=np.float64))
+
+    hits = np.zeros(n_voxels, dtype=np.int32)
+    coverage = np.zeros(n_voxels, dtype=np.float32)
+    gap = np.zeros(n_voxels, dtype=np.float32)
+    angles = np.zeros((n_voxels, n_bins), dtype=np.int32) if histograms else None
+    chunk = max(1, chunk_elements // projector.n_proj)
+
+    def work(start, stop):
+        seen, x, y = _voxel_rays(projector, start, stop, (e1, e2))
+        theta = np.mod(np.arctan2(y, x), np.pi)
+        sector = np.minimum((theta * (n_bins / np.pi)).astype(np.int64), n_bins - 1)
+        sector += np.arange(stop - start)[:, None] * n_bins
+        histogram = np.bincount(sector[seen], minlength=(stop - start) * n_bins).reshape(stop - start, n_bins)
+        hits[start:stop] = seen.sum(axis=1)
+        coverage[start:stop] = np.count_nonzero(histogram, axis=1) / n_bins
+        gap[start:stop] = _largest_gap(histogram == 0) * (180.0 / n_bins)
+        if angles is not None:
+            angles[start:stop] = histogram
+
+    projector._map_chunks(work, n_voxels, chunk)
+
+    shape = projector.vol_shape
+    maps = {'hits': hits.reshape(shape), 'coverage': coverage.reshape(shape), 'gap': gap.reshape(shape)}
+    if angles is not None:
+        maps['angles'] = angles.reshape(shape + (n_bins,))
+    return maps
+
+
+def _voxel_rays(projector, start, stop, basis):
+    """
+    It projects the centres of voxels start..stop onto the detector of every projection. Every quantity is affine in
+    the centre of the voxel, so they are all computed by one product of a (voxels, 3) and a (3, 5 * projections)
+    matrix.
+    :return: the (voxels, projections) mask of the rays reaching the detector and the components of their directions
+    along the two vectors of basis.
+    """
+    index = np.stack(np.unravel_index(np.arange(start, stop), projector.grid), axis=1).astype(np.float64)
+    centre = projector._to_world(index)
+    src, inv = projector.src, projector._inv_gram
+    # the detector coordinates of a point are (r . axis) / (r . normal) * det_dist - offset . axis with r = point - src
+    axis_u = inv[:, 0, 0, None] * projector.u + inv[:, 0, 1, None] * projector.v
+    axis_v = inv[:, 1, 0, None] * projector.u + inv[:, 1, 1, None] * projector.v
+    vectors = [projector._normal, axis_u, axis_v] + [np.broadcast_to(e, src.shape) for e in basis]
+    n_proj = len(src)
+    # single precision is plenty to tell whether a ray lands on the detector, and halves the memory traffic
+    dots = (centre @ np.concatenate(vectors).T).astype(np.float32)
+    dots -= np.concatenate([np.sum(src * w, axis=1) for w in vectors]).astype(np.float32)
+    denominator, along_u, along_v, x, y = (dots[:, k * n_proj:(k + 1) * n_proj] for k in range(len(vectors)))
+
+    offset = projector.det - src
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = projector._det_dist.astype(np.float32) / denominator
+        # pixel k spans [k - count / 2, k + 1 - count / 2] around the detector centre
+        seen = np.isfinite(t) & (t > 0)
+        seen &= np.abs(t * along_u - np.sum(offset * axis_u, axis=1, dtype=np.float32)) <= projector.det_cols / 2
+        if projector.ndim == 3:
+            seen &= np.abs(t * along_v - np.sum(offset * axis_v, axis=1, dtype=np.float32)) <= projector.det_rows / 2
+    return seen, x, y
+
+
+def _plane_basis(axis):
+    # two orthonormal vectors spanning the plane orthogonal to axis
+    axis = axis / np.linalg.norm(axis)
+    reference = np.eye(3)[int(np.argmin(np.abs(axis)))]
+    e1 = reference - (reference @ axis) * axis
+    e1 /= np.linalg.norm(e1)
+    return e1, np.cross(axis, e1)
+
+
+def _largest_gap(empty):
+    # longest circular run of empty sectors of every row
+    n_bins = empty.shape[1]
+    doubled = np.concatenate((empty, empty), axis=1).astype(np.int32)
+    run = np.zeros(len(empty), dtype=np.int32)
+    longest = np.zeros(len(empty), dtype=np.int32)
+    for k in range(2 * n_bins):
+        run = (run + 1) * doubled[:, k]
+        np.maximum(longest, run, out=longest)
+    return np.minimum(longest, n_bins)
+
+
+def coverage_summary(maps, min_hits=1, mask=None):
+    """
+    It reduces the maps of coverage_maps() to a few scores, to compare or prune geometries.
+    :param maps: dictionary returned by coverage_maps();
+    :param min_hits: number of projections a voxel must be seen by to be counted as covered;
+    :param mask: boolean array selecting the voxels of interest (default: the whole volume);
+    :return: a dictionary containing the fraction of covered voxels into 'hit_fraction' index, the mean number of hits
+    into 'mean_hits' index, the mean and the 5th percentile of the angular coverage of the covered voxels into
+    'angular_coverage' and 'angular_coverage_p5' indexes, and their largest angular gap (in degrees) into 'max_gap'
+    index.
+    """
+    hits, coverage, gap = maps['hits'], maps['coverage'], maps['gap']
+    if mask is not None:
+        hits, coverage, gap = hits[mask], coverage[mask], gap[mask]
+    covered = hits >= min_hits
+    if not np.any(covered):
+        return {'hit_fraction': 0.0, 'mean_hits': float(np.mean(hits)), 'angular_coverage': 0.0,
+                'angular_coverage_p5': 0.0, 'max_gap': 180.0}
+    return {'hit_fraction': float(np.mean(covered)), 'mean_hits': float(np.mean(hits)),
+            'angular_coverage': float(np.mean(coverage[covered])),
+            'angular_coverage_p5': float(np.percentile(coverage[covered], 5)), 'max_gap': float(np.max(gap[covered]))}
+
+
+def screen_setup(setup, min_hit_fraction=0.0, min_angular_coverage=0.0, min_hits=1, n_bins=18):
+    """
+    It scores the reconstruction geometry of a scanning object (e.g. InlineScanningObject or
+    InlineContinuousScanningObject3D) with coverage_summary(), over its whole reconstruction grid. It can be given to
+    SweepScheduler (see sweep.py), with functools.partial for the thresholds, to prune the geometries that sample the
+    object too poorly before any simulation or reconstruction.
+    :param setup: scanning object;
+    :param min_hit_fraction: smallest fraction of covered voxels of a kept geometry;
+    :param min_angular_coverage: smallest mean angular coverage of a kept geometry;
+    :param min_hits: number of projections a voxel must be seen by to be counted as covered;
+    :param n_bins: number of angular sectors covering 180 degrees;
+    :return: the dictionary of coverage_summary(), with whether the geometry passes the thresholds into 'keep' index.
+    """
+    # the continuous setups reconstruct in the rebinned geometry, and may crop their volume to the rays
+    proj_geom = getattr(setup, 'new_geom', setup.proj_geom)
+    vol_geom = getattr(setup, 'full_vol_geom', setup.vol_geom)
+    summary = coverage_summary(coverage_maps(proj_geom, vol_geom, n_bins=n_bins), min_hits)
+    summary['keep'] = summary['hit_fraction'] >= min_hit_fraction and \
+        summary['angular_coverage'] >= min_angular_coverage
+    return summary
@@ -0,0 +1,216 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from iterative_solvers import geometry_key
+from system_matrix import CACHE_ROOT
+
+# default folder of the disk level, under the cache root of system_matrix.py (INLINE_CT_CACHE or ~/.cache/inline-ct)
+CACHE_DIR = os.path.join(CACHE_ROOT, 'results')
+
+
+class ResultCache:
+    """
+    This class caches the outputs of the run() methods of the scanning objects (reconstruction, sinogram, time, ...) in
+    two levels: an in-memory LRU and a size-capped folder on disk whose least recently used files are evicted first.
+    Entries are addressed by the content hash of the phantom and a canonical hash of everything that determines the
+    output (geometries, backend, algorithm, number of iterations, tolerances), so identical work is never recomputed,
+    across save modes nor across runs. The cache may be shared by threads, and copies sent to worker processes share
+    the disk level.
+    Methods
+    -------
+    key(phantom, *context)
+        It computes the address of a phantom processed under a given context.
+    get(key)
+        It returns the cached output of a key, or None.
+    put(key, output)
+        It stores the output of a key.
+    wrap(session, *context)
+        It returns a session whose run() method consults the cache.
+    """
+
+    def __init__(self, directory=CACHE_DIR, memory_bytes=512 * 2 ** 20, disk_bytes=8 * 2 ** 30):
+        """
+        It creates a new instance of the class ResultCache.
+        :param directory: folder of the disk level (None keeps the cache in memory only);
+        :param memory_bytes: size cap of the in-memory level;
+        :param disk_bytes: size cap of the disk level.
+        """
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_usage = 0
+        self._disk_usage = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.update(_memory=OrderedDict(), _memory_usage=0, _disk_usage=None, _lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def key(self, phantom, *context):
+        """
+        It computes the address of a phantom processed under a given context.
+        :param phantom: array with the phantom;
+        :param context: values determining the output (geometries, backend, algorithm, ...); dicts and arrays are
+        hashed canonically (see iterative_solvers.geometry_key);
+        :return: the hexadecimal key.
+        """
+        phantom = np.ascontiguousarray(phantom)
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update('{}{}'.format(phantom.dtype.str, phantom.shape).encode())
+        digest.update(phantom.data)
+        return digest.hexdigest() + geometry_key(*context) if context else digest.hexdigest()
+
+    def get(self, key):
+        """
+        It returns the cached output of a key, looking at the memory level first.
+        :param key: address returned by key();
+        :return: a dictionary with read-only arrays, or None when the key is not cached.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return dict(self._memory[key])
+
+        path = self._path(key)
+        if path is None:
+            return None
+        try:
+            with np.load(path) as stored:
+                output = {name: stored[name] for name in stored.files}
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+
+        output = {name: value.item() if value.ndim == 0 else _read_only(value) for name, value in output.items()}
+        self._remember(key, output)
+        return dict(output)
+
+    def put(self, key, output):
+        """
+        It stores the output of a key in both levels, evicting the least recently used entries above the size caps.
+        :param key: address returned by key();
+        :param output: dictionary of arrays and scalars (e.g. the output of a run() method).
+        """
+        output = {name: _read_only(value) for name, value in output.items()}
+        self._remember(key, output)
+
+        path = self._path(key)
+        if path is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = '{}.{}.{}.tmp.npz'.format(path[:-4], os.getpid(), threading.get_ident())
+        np.savez(temporary, **output)
+        os.replace(temporary, path)
+
+        with self._lock:
+            if self._disk_usage is not None:
+                self._disk_usage += os.path.getsize(path)
+            if self._disk_usage is None or self._disk_usage > self.disk_bytes:
+                self._disk_usage = self._evict_disk()
+
+    def wrap(self, session, *context):
+        """
+        It returns a session whose run() method consults the cache before simulating and reconstructing a phantom.
+        :param session: session returned by a backend or a scanning object;
+        :param context: values determining the output of the session (see key());
+        :return: a CachedSession.
+        """
+        return CachedSession(self, session, context)
+
+    def _remember(self, key, output):
+        size = sum(value.nbytes for value in output.values() if isinstance(value, np.ndarray))
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = output
+            self._memory_usage += size
+            while self._memory and self._memory_usage > self.memory_bytes:
+                _, dropped = self._memory.popitem(last=False)
+                self._memory_usage -= sum(v.nbytes for v in dropped.values() if isinstance(v, np.ndarray))
+
+    def _path(self, key):
+        return None if self.directory is None else os.path.join(self.directory, key + '.npz')
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz') and not name.endswith('.tmp.npz'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        usage = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if usage <= self.disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            usage -= size
+        return usage
+
+
+class CachedSession:
+    """
+    This class wraps a reconstruction session so that run() returns the cached output of phantoms that were already
+    processed under the same context; the other methods are those of the wrapped session. Only run() consults the
+    cache: forward(), reconstruct() (and so the warm starts from an x0), iterate() and run_progressive() always compute
+    their output, as it depends on a sinogram or a starting volume held by the caller rather than on the phantom alone.
+    Attributes
+    ----------
+    cache : ResultCache
+        cache consulted by run()
+    session : object
+        wrapped session
+    context : tuple
+        values hashed with the phantom into the key of its output
+    Methods
+    -------
+    run(phantom)
+        It returns the cached output of a phantom, or simulates, reconstructs and caches it.
+    """
+
+    def __init__(self, cache, session, context):
+        self.cache = cache
+        self.session = session
+        self.context = context
+
+    def run(self, phantom):
+        """
+        It returns the cached output of a phantom, or simulates and reconstructs it and caches the output.
+        :param phantom: volume in the ASTRA layout of vol_geom;
+        :return: the output of the run() method of the wrapped session; cached arrays are read-only.
+        """
+        key = self.cache.key(phantom, *self.context)
+        output = self.cache.get(key)
+        if output is None:
+            output = self.session.run(phantom)
+            self.cache.put(key, output)
+        return output
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.session.close()
+
+
+def _read_only(value):
+    if isinstance(value, np.ndarray):
+        value = np.array(value)
+        value.flags.writeable = False
+    return value
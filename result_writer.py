@@ -0,0 +1,261 @@
+import os
+import json
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from imageio import imwrite
+from instrumentation import NULL_TRACE
+
+_MAGIC = b'CHUNKVOL'
+_ALIGNMENT = 64
+
+
+def save_chunked(path, array, chunks=64):
+    """
+    It writes an array into a single chunked float32 file: the array is split into blocks of shape chunks that are
+    stored contiguously, so reading a slice along any axis only touches the blocks it crosses.
+    :param path: name of the file to be written;
+    :param array: array to be stored;
+    :param chunks: block shape, or a single int used for every axis (blocks are clipped to the array shape);
+    :return: path.
+    """
+    array = np.asarray(array)
+    shape = array.shape
+    chunks = tuple(int(min(c, s)) for c, s in zip(np.broadcast_to(chunks, (array.ndim,)), shape))
+    grid = tuple(-(-s // c) for s, c in zip(shape, chunks))
+
+    header = json.dumps({'shape': shape, 'chunks': chunks}).encode()
+    offset = -(-(len(_MAGIC) + 4 + len(header)) // _ALIGNMENT) * _ALIGNMENT
+    with open(path + '.tmp', 'wb') as file:
+        file.write(_MAGIC + np.uint32(len(header)).tobytes() + header.ljust(offset - len(_MAGIC) - 4))
+
+    blocks = np.memmap(path + '.tmp', dtype='<f4', mode='r+', offset=offset, shape=grid + chunks)
+    try:
+        for index in np.ndindex(*grid):
+            piece = array[tuple(slice(i * c, (i + 1) * c) for i, c in zip(index, chunks))]
+            blocks[index][tuple(slice(0, n) for n in piece.shape)] = piece
+        blocks.flush()
+    finally:
+        del blocks
+    os.replace(path + '.tmp', path)
+    return path
+
+
+class ChunkedVolume:
+    """
+    This class gives read-only, memory-mapped access to a file written by save_chunked. Indexing with ints and slices
+    returns a numpy array and only reads the blocks that the selection crosses.
+    Attributes
+    ----------
+    shape       : tuple
+        Shape of the stored array;
+    chunks      : tuple
+        Block shape of the file;
+    """
+
+    def __init__(self, path):
+        """
+        It opens a chunked file.
+        :param path: name of the file written by save_chunked.
+        """
+        with open(path, 'rb') as file:
+            if file.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError("'{}' is not a chunked volume file".format(path))
+            length = int(np.frombuffer(file.read(4), dtype=np.uint32)[0])
+            header = json.loads(file.read(length).decode())
+        offset = -(-(len(_MAGIC) + 4 + length) // _ALIGNMENT) * _ALIGNMENT
+
+        self.shape = tuple(header['shape'])
+        self.chunks = tuple(header['chunks'])
+        self.dtype = np.dtype(np.float32)
+        grid = tuple(-(-s // c) for s, c in zip(self.shape, self.chunks))
+        self._blocks = np.memmap(path, dtype='<f4', mode='r', offset=offset, shape=grid + self.chunks)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __array__(self, dtype=None):
+        return np.asarray(self[...], dtype=dtype)
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        if any(k is Ellipsis for k in key):
+            position = [k is Ellipsis for k in key].index(True)
+            key = key[:position] + (slice(None),) * (self.ndim - len(key) + 1) + key[position + 1:]
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        ranges, steps, squeeze = [], [], []
+        for axis, (k, size) in enumerate(zip(key, self.shape)):
+            if isinstance(k, slice):
+                start, stop, step = k.indices(size)
+                if step < 0:
+                    start, stop = stop + 1, start + 1
+                ranges.append((start, max(start, stop)))
+                steps.append(slice(None, None, step))
+            else:
+                k = int(k) + size if int(k) < 0 else int(k)
+                if not 0 <= k < size:
+                    raise IndexError("index {} is out of bounds for axis {} with size {}".format(k, axis, size))
+                ranges.append((k, k + 1))
+                steps.append(slice(None))
+                squeeze.append(axis)
+
+        out = np.empty([stop - start for start, stop in ranges], dtype=np.float32)
+        first = [start // c for (start, _), c in zip(ranges, self.chunks)]
+        last = [-(-stop // c) for (_, stop), c in zip(ranges, self.chunks)]
+        for index in np.ndindex(*[max(0, b - a) for a, b in zip(first, last)]):
+            block, src, dst = [], [], []
+            for i, f, (start, stop), c in zip(index, first, ranges, self.chunks):
+                lo, hi = max(start, (f + i) * c), min(stop, (f + i + 1) * c)
+                block.append(f + i)
+                src.append(slice(lo - (f + i) * c, hi - (f + i) * c))
+                dst.append(slice(lo - start, hi - start))
+            out[tuple(dst)] = self._blocks[tuple(block)][tuple(src)]
+
+        return np.squeeze(out[tuple(steps)], axis=tuple(squeeze)) if squeeze else out[tuple(steps)]
+
+
+class ResultWriter:
+    """
+    This class writes reconstructions and sinograms on background threads, so that the next reconstruction can start
+    while the previous results are still being written. At most max_pending writing tasks are queued at once; further
+    writes block until one of them is finished. With a trace, every task is recorded as a 'write' stage.
+    Methods
+    -------
+    write_volume(path, volume, chunks=64, copy=True)
+        It writes a whole volume (or sinogram) into a single chunked float32 file.
+    write_slices(directory, volume, axis=0, pattern='slice{:05d}.png', transpose=False, copy=True)
+        It writes every slice of a volume along an axis as an image.
+    write_views(directory, volume, copy=True)
+        It writes the three central orthogonal views of a volume as images.
+    flush()
+        It waits for every queued write and raises the first error.
+    close()
+        It flushes and stops the background threads.
+    """
+
+    def __init__(self, threads=4, max_pending=8, trace=None):
+        """
+        It creates a new instance of the class ResultWriter.
+        :param threads: number of writing threads;
+        :param max_pending: maximum number of writing tasks queued at once;
+        :param trace: instrumentation.Trace recording the writing tasks, or None.
+        """
+        self.threads = threads
+        self.trace = NULL_TRACE if trace is None else trace
+        self._pool = ThreadPoolExecutor(threads)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures = []
+
+    def _submit(self, nbytes, function, *args):
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._traced, nbytes, function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+        return future
+
+    def _traced(self, nbytes, function, *args):
+        with self.trace.stage('write', nbytes):
+            return function(*args)
+
+    def _snapshot(self, volume, copy, dtype=np.float32):
+        return np.array(volume, dtype=dtype, copy=True) if copy else np.asarray(volume, dtype=dtype)
+
+    def write_volume(self, path, volume, chunks=64, copy=True):
+        """
+        It writes a whole volume (or sinogram) into a single chunked float32 file (see save_chunked and ChunkedVolume).
+        :param path: name of the file to be written;
+        :param volume: array to be written;
+        :param chunks: block shape of the file;
+        :param copy: copies volume before returning, so the caller may reuse its buffer right away;
+        :return: a future that completes when the file is written.
+        """
+        volume = self._snapshot(volume, copy)
+        return self._submit(volume.nbytes, save_chunked, path, volume, chunks)
+
+    def write_slices(self, directory, volume, axis=0, pattern='slice{:05d}.png', transpose=False, copy=True):
+        """
+        It writes every slice of a volume along an axis as an image, spreading the slices over the writing threads.
+        Floating point volumes are scaled to 8 bits with the minimum and maximum of the whole volume.
+        :param directory: folder receiving the images; it is created if needed;
+        :param volume: 3D array to be written;
+        :param axis: axis along which the volume is sliced;
+        :param pattern: file name of each slice, formatted with the slice index;
+        :param transpose: transposes every slice before writing it;
+        :param copy: copies volume before returning, so the caller may reuse its buffer right away;
+        :return: the list of futures of the writing tasks.
+        """
+        os.makedirs(directory, exist_ok=True)
+        slices = np.moveaxis(self._snapshot(volume, copy, dtype=None), axis, 0)
+        window = _window(slices)
+        groups = np.array_split(np.arange(slices.shape[0]), min(self.threads, slices.shape[0]))
+        return [self._submit(slices[0].nbytes * len(group), _write_group, directory, slices, group, pattern, transpose,
+                             window) for group in groups]
+
+    def write_views(self, directory, volume, copy=True):
+        """
+        It writes the three central orthogonal views of a volume as view_axis0.png, view_axis1.png and view_axis2.png,
+        scaled as in write_slices.
+        :param directory: folder receiving the images; it is created if needed;
+        :param volume: 3D array;
+        :param copy: copies the views before returning;
+        :return: a future that completes when the views are written.
+        """
+        os.makedirs(directory, exist_ok=True)
+        volume = np.asarray(volume)
+        views = [self._snapshot(np.take(volume, volume.shape[axis] // 2, axis=axis), copy, dtype=None)
+                 for axis in range(3)]
+        return self._submit(sum(view.nbytes for view in views), _write_views, directory, views, _window(volume))
+
+    def flush(self):
+        """
+        It waits for every queued write and raises the first error.
+        """
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+    def close(self):
+        """
+        It flushes the queued writes and stops the background threads.
+        """
+        try:
+            self.flush()
+        finally:
+            self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _window(volume):
+    if np.issubdtype(volume.dtype, np.integer) or volume.dtype == bool:
+        return None
+    return float(np.min(volume)), float(np.max(volume))
+
+
+def _as_image(data, window):
+    if window is None:
+        return data
+    low, high = window
+    scaled = (data - low) * (255.0 / (high - low) if high > low else 0.0)
+    return np.clip(np.rint(scaled), 0, 255).astype(np.uint8)
+
+
+def _write_group(directory, slices, group, pattern, transpose, window):
+    for k in group:
+        image = _as_image(slices[k], window)
+        imwrite(os.path.join(directory, pattern.format(k)), np.transpose(image) if transpose else image)
+
+
+def _write_views(directory, views, window):
+    for axis, view in enumerate(views):
+        imwrite(os.path.join(directory, 'view_axis{}.png'.format(axis)), _as_image(view, window))
@@ -0,0 +1,112 @@
+import os
+import csv
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from imageio import imread
+
+
+def index_path(path):
+    """
+    It returns the name of the index (a .csv file) of the packed store path.
+    """
+    return os.path.splitext(path)[0] + '.csv'
+
+
+def write_index(path, rows):
+    """
+    It writes the index of a packed store: one line per stored array, in store order, with its position into the 'row'
+    column followed by the fields of rows (e.g. 'name' and 'label').
+    :param path: name of the .npy file of the store;
+    :param rows: list of dictionaries, one per stored array;
+    """
+    fields = ['row']
+    for row in rows:
+        fields += [name for name in row if name not in fields]
+    with open(index_path(path) + '.tmp', 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        for k, row in enumerate(rows):
+            writer.writerow(dict(row, row=k))
+    os.replace(index_path(path) + '.tmp', index_path(path))
+
+
+def read_index(path):
+    """
+    It reads the index of a packed store (see write_index).
+    :param path: name of the .npy file of the store;
+    :return: the list of rows, as dictionaries of strings, in store order.
+    """
+    with open(index_path(path), newline='') as file:
+        return list(csv.DictReader(file))
+
+
+def open_store(path, mode='r'):
+    """
+    It opens a packed store: an (N, ...) .npy array memory-mapped from disk, so that any slice of samples (e.g. a batch
+    store[i:j]) is a view read on demand, and its index.
+    :param path: name of the .npy file of the store;
+    :param mode: mmap_mode of np.load ('r' read-only, 'r+' read-write, 'c' copy-on-write);
+    :return: the tuple (memory-mapped array, rows of read_index()).
+    """
+    store = np.load(path, mmap_mode=mode)
+    index = read_index(path)
+    if len(index) != len(store):
+        raise ValueError("The index of '{}' has {} rows for {} samples".format(path, len(index), len(store)))
+    return store, index
+
+
+def batches(path, batch_size, mode='r'):
+    """
+    It iterates over a packed store by batches of consecutive samples, each a view of the memory-mapped file (no copy).
+    :param path: name of the .npy file of the store;
+    :param batch_size: number of samples per batch (the last batch may be smaller);
+    :param mode: mmap_mode of np.load;
+    :return: a generator yielding the tuple (array of batch_size samples, their rows of the index).
+    """
+    store, index = open_store(path, mode)
+    for start in range(0, len(store), batch_size):
+        yield store[start:start + batch_size], index[start:start + batch_size]
+
+
+def pack_images(files, path, shape, rows=None, transform=None, workers=None, chunk=32, dtype=np.float32):
+    """
+    It packs image files into a single store: the images are decoded, transformed (e.g. resized) and written by a pool
+    of worker processes straight into their own rows of a memory-mapped .npy file, a chunk of consecutive rows per task.
+    The rows are assigned before the workers start, so the store does not depend on the number of workers or on the
+    order in which they finish. The store and its index appear atomically once every image is written.
+    :param files: list of image file names, in store order;
+    :param path: name of the .npy file to be written;
+    :param shape: shape of every stored image (after transform);
+    :param rows: list of dictionaries describing the images (e.g. name and label), written into the index (default:
+    the file names);
+    :param transform: picklable function transform(image) applied to every decoded image (e.g. a functools.partial of
+    a resizing function), or None;
+    :param workers: number of worker processes (default: all cores);
+    :param chunk: number of images per task;
+    :param dtype: data type stored in the file;
+    :return: path.
+    """
+    rows = [{'name': os.path.basename(f)} for f in files] if rows is None else rows
+    if len(rows) != len(files):
+        raise ValueError("Expected one index row per file, got {} rows for {} files".format(len(rows), len(files)))
+
+    store = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=dtype, shape=(len(files),) + tuple(shape))
+    del store
+    tasks = [(path + '.tmp', start, files[start:start + chunk], transform) for start in range(0, len(files), chunk)]
+    # fresh worker processes, as the sweeps do (see sweep.py)
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        for _ in pool.map(_pack_chunk, *zip(*tasks)):
+            pass
+
+    write_index(path, rows)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def _pack_chunk(path, start, files, transform):
+    store = np.load(path, mmap_mode='r+')
+    for k, name in enumerate(files):
+        image = imread(name)
+        store[start + k] = image if transform is None else transform(image)
+    store.flush()
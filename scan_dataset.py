@@ -1,47 +1,49 @@
 
 import os
+from functools import partial
 from object_scan_inline_setup_2D import InlineScanningObject
 from object_scan_semi_circ_2D import CircularScanningObject
-from imageio import imread, imwrite
-from scipy.io import savemat
+from dataset_runner import DatasetRunner
+from result_cache import ResultCache
 
 
 save = "sino"
 type = "inline"
 projs = 7
 fanbeam = 60
+backend = "cuda"
+workers = 1 if backend == "cuda" else os.cpu_count()
+# set a folder to cache the outputs on disk, so that the "sino" and "image" passes over the same inputs simulate each
+# phantom once; the least recently used outputs are evicted beyond cache_bytes
+cache_dir = None
+cache_bytes = 8 * 2 ** 30
+cache = None if cache_dir is None else ResultCache(cache_dir, disk_bytes=cache_bytes)
 
 src = "D:\\Datasets\\kuLeuven\\sample-128\\"
+# packed dataset written by process_data_leuven.py
+src_store = "D:\\Datasets\\kuLeuven\\sample-128.npy"
 dest = "D:\\Datasets\\kuLeuven\\scan_{}_projs_{}_fanbeam_{}\\".format(type, projs, fanbeam)
 
-if not os.path.exists(dest):
-    os.mkdir(dest)
 
+if __name__ == '__main__':
 
+    if not os.path.exists(dest):
+        os.mkdir(dest)
 
+    if type == "curve":
+        setup = partial(CircularScanningObject, n_projs_param=projs, src_dist_param=200, det_dist_param=100, fan_beam_param=fanbeam,
+                        radius_param=250, rec_size_param=128, backend=backend, cache=cache)
+    else:
+        setup = partial(InlineScanningObject, alpha_param=fanbeam, n_cells_param=519, n_proj_param=projs, rec_size_param=128, omega_rotation=0, backend=backend, cache=cache)
 
-if type == "curve":
-    setup = CircularScanningObject(n_projs_param=projs, src_dist_param=200, det_dist_param=100, fan_beam_param=fanbeam,
-                                   radius_param=250, rec_size_param=128)
-else:
-    setup = InlineScanningObject(alpha_param=fanbeam, n_cells_param=519, n_proj_param=projs, rec_size_param=128, omega_rotation=0)
+    runner = DatasetRunner(setup, rec_algorithm_param="SIRT_CUDA", workers=workers, use_processes=(backend != "cuda"))
 
-if save == "image":
-    if not os.path.exists(dest + "input\\"):
-        os.mkdir(dest + "input\\")
-
-    for im_name in os.listdir(src):
-        plane = imread(src+im_name)
-        out = setup.run(plane, rec_algorithm_param="SIRT_CUDA")
-        imwrite(dest+"input\\"+im_name, out['rec'])
-elif save == "setup":
-    savemat("{}_setup_{}_projs_{}_fanbeam.mat".format(type, projs, fanbeam), {"matrix": setup.setup.geometry_matrix, "det_size": setup.setup.det_size, "rec_size": 128})
-
-elif save == "sino":
-    if not os.path.exists(dest + "sino\\"):
-        os.mkdir(dest + "sino\\")
-
-    for im_name in os.listdir(src):
-        plane = imread(src+im_name)
-        out = setup.run(plane, rec_algorithm_param="SIRT_CUDA")
-        imwrite(dest+"sino\\"+im_name, out['sino'])
+    if save == "image":
+        runner.run(src, dest + "input\\", save)
+    elif save == "setup":
+        runner.save_setup("{}_setup_{}_projs_{}_fanbeam.mat".format(type, projs, fanbeam), 128)
+    elif save == "sino":
+        runner.run(src, dest + "sino\\", save)
+    elif save == "packed":
+        # sino.npy and rec.npy, with the names and labels of the input store
+        runner.run_packed(src_store, dest + "packed\\")
@@ -1,6 +1,6 @@
 import numpy as np
 from matplotlib import pyplot as plt
-from math import radians, tan
+from geometry_builder import semi_circular_geometry, semi_circular_det_size
 
 class SemiCircularConveyorBelt:
 
@@ -8,21 +8,8 @@ class SemiCircularConveyorBelt:
 
     def __init__(self, radius, n_projs, src_dist, det_dist, fan_beam_angle):
 
-        alpha = np.linspace(radians(60),radians(120), n_projs)
-
-        srcX = (src_dist+radius)-(np.sin(alpha)*radius)
-        srcY = - np.cos(alpha)*radius
-
-        dx = (radius-det_dist) - np.sin(alpha)*radius
-        dy = - np.cos(alpha)*radius
-
-        ux = np.cos(-alpha)
-        uy = np.sin(-alpha)
-
-        self.geometry_matrix = np.column_stack((srcX, srcY, dx, dy, ux, uy))
-
-        rad = radians(fan_beam_angle/2)
-        self.det_size =  int(2*(tan(rad)*(radius+src_dist+det_dist)))
+        self.geometry_matrix = semi_circular_geometry(radius, n_projs, src_dist, det_dist)
+        self.det_size = semi_circular_det_size(radius, src_dist, det_dist, fan_beam_angle)
 
 
     def get_geometry_matrix(self):
@@ -53,9 +40,10 @@ if __name__ == "__main__":
     rgba_colors_green[:, 3] = alphas
 
     plt.figure()
-    plt.scatter(g.srcX, g.srcY, color=rgba_colors_red)
-    plt.scatter(g.dx, g.dy, color=rgba_colors_green)
-    plt.scatter(g.ux, g.uy, color=rgba_colors_blue)
+    m = g.get_geometry_matrix()
+    plt.scatter(m[:, 0], m[:, 1], color=rgba_colors_red)
+    plt.scatter(m[:, 2], m[:, 3], color=rgba_colors_green)
+    plt.scatter(m[:, 4], m[:, 5], color=rgba_colors_blue)
     plt.show()
 
 
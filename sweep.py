@@ -0,0 +1,225 @@
+import os
+import csv
+import json
+import inspect
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from iterative_solvers import geometry_key
+
+INDEX = 'index.csv'
+
+
+class SweepScheduler:
+    """
+    This class runs parameter sweeps of a scanning setup class (e.g. over alpha_param, n_proj_param, views_param,
+    vert_shift or the number of iterations). The grid is split into the parameters of the constructor, which define a
+    geometry, and those of the session() method; the jobs sharing a geometry are run together, so every geometry is
+    built once and every phantom is simulated once per geometry, whatever the number of reconstructions using it. The
+    geometries run in a pool of processes, limited by a memory budget; every finished job is written into its own
+    folder of dest and skipped when the sweep is run again, so an interrupted sweep resumes where it stopped. The
+    geometries can be screened before anything is simulated (e.g. by their ray coverage, see ray_coverage.py), pruning
+    the poor ones.
+    Attributes
+    ----------
+    jobs        : list
+        One dictionary per job, in grid order: 'job' (its id), 'phantom', 'setup' and 'session' (the keyword arguments
+        of the constructor and of session());
+    Methods
+    -------
+    run(phantoms, dest)
+        It runs the jobs that are not finished yet and writes the index of the results.
+    """
+
+    def __init__(self, setup_class, grid, fixed=None, workers=1, memory_budget=None, job_memory=None, save_sino=False,
+                 metrics=None, screen=None):
+        """
+        It creates a new instance of the class SweepScheduler.
+        :param setup_class: scanning setup class (e.g. InlineContinuousScanningObject3D); it must be importable by the
+        worker processes;
+        :param grid: dictionary parameter -> list of values; every combination is a job. The parameters are keyword
+        arguments of the constructor or of the session() method of setup_class;
+        :param fixed: dictionary of keyword arguments shared by every job (e.g. backend or rec_size_param);
+        :param workers: number of processes running geometries at the same time;
+        :param memory_budget: upper bound (in bytes) on the memory estimated for the geometries running at the same
+        time; at least one geometry always runs (default: no bound);
+        :param job_memory: function job_memory(setup_params, phantom_bytes) estimating the memory used by a geometry
+        (default: 4 times the size of the phantom);
+        :param save_sino: also writes the sinogram of every job;
+        :param metrics: picklable function metrics(phantom, output) returning a dictionary of scalars (e.g. the RMSE of
+        output['rec']), stored with every job and in the index;
+        :param screen: picklable function screen(setup) returning a dictionary of scalars about a geometry, stored with
+        its jobs and in the index (e.g. ray_coverage.screen_setup); when its 'keep' entry is false, the jobs of the
+        geometry are recorded as pruned without any simulation or reconstruction.
+        """
+        self.setup_class = setup_class
+        self.workers = workers
+        self.memory_budget = memory_budget
+        self.job_memory = job_memory or _default_job_memory
+        self.save_sino = save_sino
+        self.metrics = metrics
+        self.screen = screen
+
+        setup_names = set(inspect.signature(setup_class.__init__).parameters) - {'self'}
+        session_names = set(inspect.signature(setup_class.session).parameters) - {'self'}
+        fixed = dict(fixed or {})
+        unknown = (set(grid) | set(fixed)) - setup_names - session_names
+        if unknown:
+            raise ValueError("Unknown parameters {} for {}".format(sorted(unknown), setup_class.__name__))
+        self.names = list(grid)
+        self.combinations = []
+        for values in itertools.product(*(grid[name] for name in self.names)):
+            params = dict(fixed, **dict(zip(self.names, values)))
+            self.combinations.append(({name: value for name, value in params.items() if name in setup_names},
+                                      {name: value for name, value in params.items() if name not in setup_names}))
+        self.jobs = []
+
+    def _plan(self, phantoms):
+        self.jobs = []
+        for phantom in phantoms:
+            for setup_params, session_params in self.combinations:
+                job = geometry_key(self.setup_class.__name__, setup_params, session_params, phantom)[:16]
+                self.jobs.append({'job': job, 'phantom': phantom, 'setup': setup_params, 'session': session_params})
+
+    def run(self, phantoms, dest):
+        """
+        It runs the jobs that are not finished yet and writes the index of the results into dest/index.csv.
+        :param phantoms: dictionary name -> phantom, given as an array or, better for large volumes, as the name of a
+        .npy file that the workers memory-map (see volume_store.py); the phantoms must be C-contiguous float32;
+        :param dest: folder of the results; job j is written into dest/j (rec.npy, sino.npy and result.json, which marks
+        the job as finished);
+        :return: the rows of the index, in grid order.
+        """
+        os.makedirs(dest, exist_ok=True)
+        self._plan(phantoms)
+
+        # one task per geometry, holding the unfinished jobs of every phantom
+        tasks = {}
+        for job in self.jobs:
+            if os.path.isfile(os.path.join(dest, job['job'], 'result.json')):
+                continue
+            key = geometry_key(job['setup'])
+            task = tasks.setdefault(key, {'setup': job['setup'], 'phantoms': {}})
+            task['phantoms'].setdefault(job['phantom'], []).append((job['job'], job['session']))
+
+        pending = deque(tasks.values())
+        running = {}
+        # fresh worker processes: CUDA contexts and the thread pools of the parent do not survive a fork
+        with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            while pending or running:
+                while pending and len(running) < self.workers:
+                    memory = self._memory(pending[0], phantoms)
+                    if running and self.memory_budget is not None and \
+                            sum(running.values()) + memory > self.memory_budget:
+                        break
+                    task = pending.popleft()
+                    future = pool.submit(_run_geometry, self.setup_class, task['setup'],
+                                         {name: phantoms[name] for name in task['phantoms']}, task['phantoms'], dest,
+                                         self.save_sino, self.metrics, self.screen)
+                    running[future] = memory
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    future.result()
+
+        return self._write_index(dest)
+
+    def _memory(self, task, phantoms):
+        return max(self.job_memory(task['setup'], _phantom_bytes(phantoms[name])) for name in task['phantoms'])
+
+    def _write_index(self, dest):
+        rows = []
+        for job in self.jobs:
+            with open(os.path.join(dest, job['job'], 'result.json')) as file:
+                result = json.load(file)
+            row = {'job': job['job'], 'phantom': job['phantom']}
+            row.update({name: result['params'][name] for name in self.names})
+            row.update(pruned=result.get('pruned', False), time=result['time'], iterations=result['iterations'])
+            row.update(result.get('screen', {}))
+            row.update(result['metrics'])
+            rows.append(row)
+
+        fields = []
+        for row in rows:
+            fields += [name for name in row if name not in fields]
+        with open(os.path.join(dest, INDEX + '.tmp'), 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(os.path.join(dest, INDEX + '.tmp'), os.path.join(dest, INDEX))
+        return rows
+
+
+def read_index(dest):
+    """
+    It reads the index written by SweepScheduler.run().
+    :param dest: folder of the results;
+    :return: the list of rows, as dictionaries of strings.
+    """
+    with open(os.path.join(dest, INDEX), newline='') as file:
+        return list(csv.DictReader(file))
+
+
+def _default_job_memory(setup_params, phantom_bytes):
+    return 4 * phantom_bytes
+
+
+def _phantom_bytes(phantom):
+    if isinstance(phantom, str):
+        return np.load(phantom, mmap_mode='r').nbytes
+    return np.asarray(phantom).nbytes
+
+
+def _run_geometry(setup_class, setup_params, phantoms, jobs, dest, save_sino, metrics, screen):
+    """
+    It builds a geometry once and runs its jobs: every phantom is simulated once and reconstructed with the session
+    parameters of each of its jobs, unless the screen rejects the geometry.
+    """
+    setup = setup_class(**setup_params)
+    scores = {} if screen is None else screen(setup)
+    if not scores.get('keep', True):
+        for phantom_jobs in jobs.values():
+            for job, session_params in phantom_jobs:
+                _save_job(os.path.join(dest, job), dict(setup_params, **session_params), None, False, {}, scores)
+        return
+    for name, phantom_jobs in jobs.items():
+        phantom = phantoms[name]
+        if isinstance(phantom, str):
+            phantom = np.load(phantom, mmap_mode='r')
+        sinogram = None
+        for job, session_params in phantom_jobs:
+            with setup.session(**session_params) as session:
+                if sinogram is None:
+                    # the sessions may return their own buffers, which are freed with them
+                    sinogram = np.array(session.forward(phantom))
+                output = session.reconstruct(sinogram)
+            output['sino'] = sinogram
+            _save_job(os.path.join(dest, job), dict(setup_params, **session_params), output, save_sino,
+                      {} if metrics is None else metrics(phantom, output), scores)
+
+
+def _save_job(folder, params, output, save_sino, metrics, scores):
+    # a pruned job (output None) only has its result.json
+    os.makedirs(folder, exist_ok=True)
+    if output is not None:
+        np.save(os.path.join(folder, 'rec.npy'), output['rec'])
+    if save_sino and output is not None:
+        np.save(os.path.join(folder, 'sino.npy'), output['sino'])
+    result = {'params': params, 'pruned': output is None,
+              'time': None if output is None else output['time'],
+              'iterations': None if output is None else output.get('iterations'),
+              'metrics': {name: float(value) for name, value in metrics.items()}, 'screen': scores}
+    # result.json is written last and atomically: its presence marks the job as finished
+    with open(os.path.join(folder, 'result.json.tmp'), 'w') as file:
+        json.dump(result, file, indent=1, default=_json_value)
+    os.replace(os.path.join(folder, 'result.json.tmp'), os.path.join(folder, 'result.json'))
+
+
+def _json_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return repr(value)
@@ -0,0 +1,150 @@
+import os
+import numpy as np
+from scipy import sparse
+from cpu_projector import RayDrivenProjector
+from iterative_solvers import geometry_key, select_projections
+
+# root of the caches on disk (here and in result_cache.py), independent of the working directory: the folder named by
+# the INLINE_CT_CACHE environment variable, or ~/.cache/inline-ct
+CACHE_ROOT = os.environ.get('INLINE_CT_CACHE') or os.path.join(os.path.expanduser('~'), '.cache', 'inline-ct')
+CACHE_DIR = os.path.join(CACHE_ROOT, 'system_matrices')
+
+
+class SparseOperator:
+    """
+    This class is the projection operator A of a geometry stored as a scipy.sparse CSR matrix, with one row per
+    detector pixel (in the ASTRA sinogram order) and one column per voxel. It suits small geometries such as the
+    128 x 128 inline and semi-circular setups: the matrix is built once from the ray weights of the CPU projector,
+    cached on disk, and a whole stack of images is projected by a single sparse matrix-matrix product. It provides the
+    same methods as iterative_solvers.CPUOperator.
+    Attributes
+    ----------
+    matrix      : csr_matrix
+        It holds the system matrix;
+    vol_shape   : tuple
+        Shape of the volume arrays, as in ASTRA;
+    sino_shape  : tuple
+        Shape of the sinogram arrays, as in ASTRA;
+    """
+
+    def __init__(self, proj_geom, vol_geom, matrix=None, cache_dir=CACHE_DIR, **projector_options):
+        """
+        It creates a new instance of the class SparseOperator.
+        :param proj_geom: ASTRA projection geometry ('fanflat_vec' or 'cone_vec');
+        :param vol_geom: ASTRA volume geometry;
+        :param matrix: system matrix of the geometries (default: loaded with load_system_matrix());
+        :param cache_dir: folder caching the system matrices (None disables the cache);
+        :param projector_options: keyword arguments forwarded to RayDrivenProjector.
+        """
+        self.proj_geom = proj_geom
+        self.vol_geom = vol_geom
+        self.cache_dir = cache_dir
+        self.projector_options = projector_options
+        self.vol_shape, self.sino_shape = array_shapes(proj_geom, vol_geom)
+        self.proj_axis = 0 if len(self.sino_shape) == 2 else 1
+        self.key = system_matrix_key(proj_geom, vol_geom, **projector_options)
+        self.matrix = load_system_matrix(proj_geom, vol_geom, cache_dir, **projector_options) if matrix is None \
+            else matrix
+
+    def forward(self, volume):
+        """
+        It computes A x for a volume, or for a stack of volumes along the leading axes in a single product.
+        """
+        volume = np.asarray(volume, dtype=np.float32)
+        batch = volume.shape[:volume.ndim - len(self.vol_shape)]
+        flat = volume.reshape((-1, self.matrix.shape[1]))
+        return np.ascontiguousarray((self.matrix @ flat.T).T).reshape(batch + self.sino_shape)
+
+    def backward(self, sinogram):
+        """
+        It computes A^T y for a sinogram, or for a stack of sinograms along the leading axes in a single product.
+        """
+        sinogram = np.asarray(sinogram, dtype=np.float32)
+        batch = sinogram.shape[:sinogram.ndim - len(self.sino_shape)]
+        flat = sinogram.reshape((-1, self.matrix.shape[0]))
+        return np.ascontiguousarray((self.matrix.T @ flat.T).T).reshape(batch + self.vol_shape)
+
+    def subset(self, projections):
+        """
+        It returns the operator restricted to a subset of the projections, sharing the rows of the system matrix.
+        """
+        proj_geom = select_projections(self.proj_geom, projections)
+        rows = np.arange(int(np.prod(self.sino_shape))).reshape(self.sino_shape)
+        rows = np.take(rows, np.arange(self.sino_shape[self.proj_axis])[projections], axis=self.proj_axis)
+        return SparseOperator(proj_geom, self.vol_geom, self.matrix[rows.ravel()], self.cache_dir,
+                              **self.projector_options)
+
+    def close(self):
+        pass
+
+
+def system_matrix_key(proj_geom, vol_geom, **projector_options):
+    """
+    It computes the hash under which the system matrix of a pair of geometries is cached: it covers the geometry matrix
+    and detector size of proj_geom, vol_geom and the sampling step of the projector.
+    """
+    return geometry_key(proj_geom, vol_geom, 'sparse', projector_options.get('step', 0.5))
+
+
+def build_system_matrix(proj_geom, vol_geom, **projector_options):
+    """
+    It builds the system matrix of a pair of geometries from the interpolation weights of the CPU ray-driven projector.
+    :param proj_geom: ASTRA projection geometry ('fanflat_vec' or 'cone_vec');
+    :param vol_geom: ASTRA volume geometry;
+    :param projector_options: keyword arguments forwarded to RayDrivenProjector;
+    :return: the float32 csr_matrix of shape (detector pixels, voxels).
+    """
+    projector = RayDrivenProjector(proj_geom, vol_geom, **projector_options)
+    n_rays = projector.det_rows * projector.n_proj * projector.det_cols
+    n_voxels = int(np.prod(projector.grid))
+    chunk = max(1, projector.chunk_elements // (projector._n_samples * 2 ** len(projector._interp_axes)))
+
+    blocks = []
+    for start in range(0, n_rays, chunk):
+        stop = min(start + chunk, n_rays)
+        index, weight = projector._ray_weights(start, stop)
+        rows = np.broadcast_to(np.arange(stop - start)[:, None], index.shape)
+        block = sparse.coo_matrix((weight.ravel(), (rows.ravel(), index.ravel())), shape=(stop - start, n_voxels))
+        block = block.tocsr()
+        block.eliminate_zeros()
+        blocks.append(block)
+
+    return sparse.vstack(blocks, format='csr', dtype=np.float32)
+
+
+def load_system_matrix(proj_geom, vol_geom, cache_dir=CACHE_DIR, **projector_options):
+    """
+    It loads the system matrix of a pair of geometries from cache_dir, building and saving it on the first call.
+    :param proj_geom: ASTRA projection geometry;
+    :param vol_geom: ASTRA volume geometry;
+    :param cache_dir: folder caching the system matrices (None disables the cache);
+    :param projector_options: keyword arguments forwarded to RayDrivenProjector;
+    :return: the float32 csr_matrix of shape (detector pixels, voxels).
+    """
+    if cache_dir is None:
+        return build_system_matrix(proj_geom, vol_geom, **projector_options)
+
+    path = os.path.join(cache_dir, 'A_{}.npz'.format(system_matrix_key(proj_geom, vol_geom, **projector_options)))
+    if os.path.isfile(path):
+        return sparse.load_npz(path).tocsr()
+
+    matrix = build_system_matrix(proj_geom, vol_geom, **projector_options)
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary = '{}.{}.tmp.npz'.format(path[:-4], os.getpid())
+    sparse.save_npz(temporary, matrix)
+    os.replace(temporary, path)
+    return matrix
+
+
+def array_shapes(proj_geom, vol_geom):
+    """
+    It returns the shapes of the volume and sinogram arrays of a pair of geometries, as in ASTRA.
+    :param proj_geom: ASTRA projection geometry ('fanflat_vec' or 'cone_vec');
+    :param vol_geom: ASTRA volume geometry;
+    :return: the tuple (volume shape, sinogram shape).
+    """
+    n_proj = np.asarray(proj_geom['Vectors']).shape[0]
+    if proj_geom['type'] == 'fanflat_vec':
+        return (vol_geom['GridRowCount'], vol_geom['GridColCount']), (n_proj, proj_geom['DetectorCount'])
+    return ((vol_geom['GridSliceCount'], vol_geom['GridRowCount'], vol_geom['GridColCount']),
+            (proj_geom['DetectorRowCount'], n_proj, proj_geom['DetectorColCount']))
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from batched_2d import BatchedScanning2D, stacked_proj_geom, stacked_vol_geom
+from cpu_projector import RayDrivenProjector
+from projector_backend import create_backend, create_vol_geom, create_proj_geom
+from inline_setup_2D import InlineScanningSetup2D
+
+
+def geometry():
+    setup = InlineScanningSetup2D(alpha=60, detector_cells=80, number_of_projections=7, object_size=48, omega_total=0)
+    return create_proj_geom('fanflat_vec', 80, setup.get_geometry_matrix()), create_vol_geom(48, 48)
+
+
+def phantoms(n):
+    return np.random.default_rng(0).random((n, 48, 48), dtype=np.float32)
+
+
+def test_stacked_geometry_projects_every_slice_with_the_2d_geometry():
+    proj_geom, vol_geom = geometry()
+    two = RayDrivenProjector(proj_geom, vol_geom, use_numba=False).forward(phantoms(3))
+    three = RayDrivenProjector(stacked_proj_geom(proj_geom, 3), stacked_vol_geom(vol_geom, 3),
+                               use_numba=False).forward(phantoms(3))
+    assert three.shape == (1, 21, 80)
+    np.testing.assert_allclose(three.reshape(3, 7, 80), two, rtol=1e-5, atol=1e-5 * two.max())
+
+
+def test_batches_match_single_reconstructions():
+    proj_geom, vol_geom = geometry()
+    # the last batch holds a single phantom
+    batched = BatchedScanning2D('cpu', proj_geom, vol_geom, batch_size=2)
+    out = batched.run(phantoms(5), 'SIRT', 10)
+    assert out['rec'].shape == (5, 48, 48) and out['sino'].shape == (5, 7, 80)
+    with create_backend('cpu', proj_geom, vol_geom).session('SIRT', 10) as session:
+        for phantom, rec, sino in zip(phantoms(5), out['rec'], out['sino']):
+            single = session.run(phantom)
+            np.testing.assert_allclose(sino, single['sino'], rtol=1e-4, atol=1e-4)
+            np.testing.assert_allclose(rec, single['rec'], rtol=1e-3, atol=1e-3)
+
+
+def test_only_sirt_is_batched():
+    with pytest.raises(ValueError):
+        BatchedScanning2D('cpu', *geometry()).run(phantoms(2), 'CGLS')
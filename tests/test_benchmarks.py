@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+import benchmarks
+
+
+@pytest.mark.parametrize('case', list(benchmarks.CASES))
+def test_smallest_cases_build_on_the_cpu(case):
+    scan, backend = benchmarks.build(case, benchmarks.CASES[case][0])
+    shape = backend.operator.vol_shape
+    assert len(shape) == (2 if case.endswith('2d') else 3)
+    if 'size' in benchmarks.CASES[case][0]:
+        size = benchmarks.CASES[case][0]['size']
+        assert sorted(shape) == sorted((size, size) if np.ndim(size) == 0 else size)
+
+
+def test_unknown_cases_are_rejected():
+    with pytest.raises(ValueError):
+        benchmarks.build('helical_3d', {})
+
+
+def test_history_records_every_run(tmp_path, capsys):
+    history = str(tmp_path / 'history.jsonl')
+    arguments = ['--cases', 'inline_2d', '--sizes', '1', '--iterations', '2', '--repeat', '1', '--history', history]
+    benchmarks.main(arguments)
+    benchmarks.main(arguments)
+    records = benchmarks.read_history(history)
+    assert [record['case'] for record in records] == ['inline_2d'] * 2
+    assert records[0]['params'] == benchmarks.CASES['inline_2d'][0]
+    assert set(records[0]['times']) == {'geometry', 'forward', 'reconstruct', 'io'}
+    assert records[0]['iterations'] == 2 and records[0]['images_per_s'] > 0
+    # the second run is compared with the first one
+    assert '% time vs' in capsys.readouterr().out.splitlines()[-1]
+    assert benchmarks.read_history(str(tmp_path / 'missing.jsonl')) == []
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+from cpu_projector import RayDrivenProjector, NUMBA_AVAILABLE
+from projector_backend import create_vol_geom, create_proj_geom
+from inline_setup_2D import InlineScanningSetup2D
+from inline_setup_3D import InlineScanningSetup3D
+
+KERNELS = [False, pytest.param(True, marks=pytest.mark.skipif(not NUMBA_AVAILABLE, reason="Numba is not installed"))]
+
+
+def geometry_2d():
+    setup = InlineScanningSetup2D(alpha=60, detector_cells=80, number_of_projections=7, object_size=48, omega_total=0)
+    return create_proj_geom('fanflat_vec', 80, setup.get_geometry_matrix()), create_vol_geom(48, 48)
+
+
+def geometry_3d():
+    setup = InlineScanningSetup3D(alpha=30, detector_cells=128, number_of_projections=4, object_size=(64, 64, 10))
+    return create_proj_geom('cone_vec', 128, 128, setup.get_geometry_matrix()), create_vol_geom(64, 64, 10)
+
+
+@pytest.mark.parametrize('geometry', [geometry_2d, geometry_3d])
+@pytest.mark.parametrize('use_numba', KERNELS)
+def test_backward_is_the_transpose_of_forward(geometry, use_numba):
+    projector = RayDrivenProjector(*geometry(), use_numba=use_numba)
+    rng = np.random.default_rng(0)
+    x = rng.random(projector.vol_shape, dtype=np.float32)
+    y = rng.random(projector.sino_shape, dtype=np.float32)
+    forward = np.vdot(projector.forward(x), y)
+    assert forward > 0
+    assert np.vdot(x, projector.backward(y)) == pytest.approx(forward, rel=1e-4)
+
+
+@pytest.mark.parametrize('use_numba', KERNELS)
+def test_backward_does_not_depend_on_the_number_of_threads(use_numba):
+    geometry = geometry_3d()
+    y = np.random.default_rng(1).random((2, 128, 4, 128), dtype=np.float32)
+    one = RayDrivenProjector(*geometry, use_numba=use_numba, n_workers=1).backward(y)
+    many = RayDrivenProjector(*geometry, use_numba=use_numba, n_workers=4, chunk_elements=2 ** 16).backward(y)
+    assert one.shape == (2, 10, 64, 64)
+    np.testing.assert_allclose(many, one, rtol=1e-4, atol=1e-6 * np.abs(one).max())
+
+
+@pytest.mark.skipif(not NUMBA_AVAILABLE, reason="Numba is not installed")
+@pytest.mark.parametrize('geometry', [geometry_2d, geometry_3d])
+def test_numba_and_numpy_kernels_agree(geometry):
+    # the kernels sample the rays slightly differently (per ray and per chunk of rays)
+    numpy_projector = RayDrivenProjector(*geometry(), use_numba=False)
+    numba_projector = RayDrivenProjector(*geometry(), use_numba=True)
+    rng = np.random.default_rng(2)
+    x = rng.random(numpy_projector.vol_shape, dtype=np.float32)
+    y = rng.random(numpy_projector.sino_shape, dtype=np.float32)
+    for a, b in ((numpy_projector.forward(x), numba_projector.forward(x)),
+                 (numpy_projector.backward(y), numba_projector.backward(y))):
+        assert np.abs(a - b).max() <= 0.03 * np.abs(a).max()
+        assert b.sum() == pytest.approx(a.sum(), rel=1e-3)
+
+
+def test_stacks_are_projected_one_by_one():
+    projector = RayDrivenProjector(*geometry_2d(), use_numba=False)
+    x = np.random.default_rng(3).random((3,) + projector.vol_shape, dtype=np.float32)
+    sinograms = projector.forward(x)
+    assert sinograms.shape == (3,) + projector.sino_shape
+    np.testing.assert_allclose(sinograms[1], projector.forward(x[1]), rtol=1e-5)
+
+
+def test_geometry_dicts_match_astra():
+    assert create_vol_geom(4, 6) == {'GridRowCount': 4, 'GridColCount': 6, 'option': {
+        'WindowMinX': -3.0, 'WindowMaxX': 3.0, 'WindowMinY': -2.0, 'WindowMaxY': 2.0}}
+    vol_geom = create_vol_geom(4, 6, 2)
+    assert vol_geom['GridSliceCount'] == 2
+    assert (vol_geom['option']['WindowMinZ'], vol_geom['option']['WindowMaxZ']) == (-1.0, 1.0)
+    vectors = np.zeros((3, 12))
+    proj_geom = create_proj_geom('cone_vec', 5, 7, vectors)
+    assert (proj_geom['DetectorRowCount'], proj_geom['DetectorColCount']) == (5, 7)
+    with pytest.raises(ValueError):
+        create_proj_geom('parallel', 5, vectors)
+
+
+def test_scanning_objects_run_on_the_cpu_without_astra():
+    from object_scan_inline_setup_2D import InlineScanningObject
+    from object_scan import ScanningObject
+    scan = InlineScanningObject(alpha_param=60, n_cells_param=80, n_proj_param=5, rec_size_param=32,
+                                omega_rotation=0, backend='cpu')
+    output = scan.run(np.ones((32, 32), dtype=np.float32), 'SIRT_CUDA', 5)
+    assert output['rec'].shape == (32, 32)
+    assert ScanningObject(alpha_param=30, n_cells_param=64, n_proj_param=2, rec_size_param=48,
+                          backend='cpu').backend.operator.vol_shape == (10, 48, 48)
+    assert ScanningObject(alpha_param=30, n_cells_param=64, n_proj_param=2, rec_size_param=(32, 48, 6),
+                          backend='cpu').backend.operator.vol_shape == (6, 32, 48)
+
+
+@pytest.mark.parametrize('use_numba', KERNELS)
+def test_forward_from_worker_threads_matches_the_main_thread(use_numba):
+    from concurrent.futures import ThreadPoolExecutor
+    projector = RayDrivenProjector(*geometry_3d(), use_numba=use_numba, n_workers=2)
+    x = np.random.default_rng(4).random((3,) + projector.vol_shape, dtype=np.float32)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        sinograms = list(pool.map(projector.forward, x))
+    for volume, sinogram in zip(x, sinograms):
+        np.testing.assert_allclose(sinogram, projector.forward(volume), rtol=1e-6)
+
+
+@pytest.mark.parametrize('use_numba', KERNELS)
+def test_small_partial_volumes_keep_the_back_projection(use_numba):
+    geometry = geometry_2d()
+    y = np.random.default_rng(5).random((7, 80), dtype=np.float32)
+    one = RayDrivenProjector(*geometry, use_numba=use_numba, n_workers=1).backward(y)
+    bounded = RayDrivenProjector(*geometry, use_numba=use_numba, n_workers=4, partial_bytes=0).backward(y)
+    np.testing.assert_allclose(bounded, one, rtol=1e-4, atol=1e-6 * np.abs(one).max())
+
+
+def test_the_thread_pool_is_kept_until_closed():
+    projector = RayDrivenProjector(*geometry_3d(), n_workers=2, chunk_elements=2 ** 12)
+    x = np.random.default_rng(6).random(projector.vol_shape, dtype=np.float32)
+    first = projector.forward(x)
+    pool = projector._pool
+    assert pool is not None
+    projector.backward(first)
+    assert projector._pool is pool
+    projector.close()
+    assert projector._pool is None
+    np.testing.assert_allclose(projector.forward(x), first, rtol=1e-6)
+    projector.close()
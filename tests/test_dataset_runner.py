@@ -0,0 +1,38 @@
+import os
+from functools import partial
+import numpy as np
+import pytest
+from imageio import imread, imwrite
+from dataset_runner import DatasetRunner
+from object_scan_inline_setup_2D import InlineScanningObject
+
+FACTORY = partial(InlineScanningObject, 60, 64, 5, rec_size_param=32, backend='cpu')
+
+
+def write_images(folder, n=5):
+    os.makedirs(folder)
+    images = np.random.default_rng(0).random((n, 32, 32), dtype=np.float32)
+    for k, image in enumerate(images):
+        imwrite(os.path.join(folder, "img_{:02d}.tif".format(k)), image)
+    return images
+
+
+def reference(images, key):
+    with FACTORY().session('SIRT', 5) as session:
+        return [np.array(session.run(image)[key]) for image in images]
+
+
+@pytest.mark.parametrize('save, key', [('image', 'rec'), ('sino', 'sino')])
+def test_outputs_follow_the_input_order(tmp_path, save, key):
+    images = write_images(str(tmp_path / 'src'))
+    runner = DatasetRunner(FACTORY, 'SIRT', 5, workers=2, io_threads=2, max_in_flight=2)
+    files = runner.run(str(tmp_path / 'src'), str(tmp_path / 'dest'), save)
+    assert [os.path.basename(f) for f in files] == sorted(os.listdir(str(tmp_path / 'src')))
+    assert len(runner.times) == len(images)
+    for name, expected in zip(files, reference(images, key)):
+        np.testing.assert_allclose(imread(name), expected, rtol=1e-5, atol=1e-6)
+
+
+def test_unknown_save_mode(tmp_path):
+    with pytest.raises(ValueError):
+        DatasetRunner(FACTORY).run(str(tmp_path), str(tmp_path / 'dest'), 'mat')
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from imageio import imread, imwrite
+from downsample import block_mean, reduce_array, reduce_slabs, downsample_volume, downsample_folder, downsample_images
+
+
+def volume(shape=(23, 20, 18)):
+    return np.random.default_rng(0).random(shape) * 200
+
+
+def slab_reduction(array, factors, anti_aliasing, slab_bytes):
+    reads = []
+
+    def read(start, stop):
+        reads.append(stop - start)
+        return array[start:stop]
+
+    blocks = list(reduce_slabs(read, len(array), factors, anti_aliasing, slab_bytes))
+    return blocks, reads
+
+
+def test_block_mean_averages_whole_and_partial_blocks():
+    array = volume((7, 6, 5))
+    reduced = block_mean(array, (2, 3, 5))
+    assert reduced.shape == (4, 2, 1)
+    np.testing.assert_allclose(reduced[0, 1, 0], array[0:2, 3:6].mean())
+    np.testing.assert_allclose(reduced[3, 0, 0], array[6:7, 0:3].mean())
+    np.testing.assert_allclose(block_mean(array, (1, 1, 1)), array)
+
+
+@pytest.mark.parametrize('anti_aliasing', [False, True])
+@pytest.mark.parametrize('factors', [(2, 2, 2), (3, 2, 4), (1, 3, 3)])
+@pytest.mark.parametrize('slices_per_slab', [1, 4, 100])
+def test_slabs_match_the_reduction_in_memory(anti_aliasing, factors, slices_per_slab):
+    array = volume()
+    slab_bytes = slices_per_slab * 8 * array[0].size
+    blocks, reads = slab_reduction(array, factors, anti_aliasing, slab_bytes)
+    assert [k for k, _ in blocks] == list(np.cumsum([0] + [len(b) for _, b in blocks[:-1]]))
+    slabs = np.concatenate([block for _, block in blocks])
+    # the halo makes the Gaussian pre-filter of every slab see the same neighbours as on the whole volume
+    np.testing.assert_allclose(slabs, reduce_array(array, factors, anti_aliasing), rtol=1e-12, atol=1e-12)
+    if slices_per_slab < len(array):
+        assert len(blocks) > 1
+        halo = int(4.0 * (factors[0] - 1) / 2 + 0.5) if anti_aliasing else 0
+        assert max(reads) <= max(factors[0], slices_per_slab - 2 * halo) + 2 * halo
+
+
+def test_invalid_factors_are_rejected():
+    with pytest.raises(ValueError):
+        next(reduce_slabs(lambda start, stop: volume()[start:stop], 23, (0, 2, 2)))
+
+
+@pytest.mark.parametrize('anti_aliasing', [False, True])
+def test_volume_files_are_reduced_slab_by_slab(tmp_path, anti_aliasing):
+    array = volume().astype(np.float32)
+    np.save(str(tmp_path / 'volume.npy'), array)
+    dest = downsample_volume(str(tmp_path / 'volume.npy'), str(tmp_path / 'small.npy'), 2, anti_aliasing,
+                             slab_bytes=3 * array[0].nbytes)
+    reduced = np.load(dest)
+    assert reduced.dtype == np.float32 and reduced.shape == (12, 10, 9)
+    np.testing.assert_allclose(reduced, reduce_array(array, (2, 2, 2), anti_aliasing), rtol=1e-6)
+    assert not (tmp_path / 'small.npy.tmp').exists()
+
+
+def test_slice_folders_are_rounded_to_their_type(tmp_path):
+    array = volume((9, 16, 12)).astype(np.uint8)
+    (tmp_path / 'src').mkdir()
+    for z, image in enumerate(array):
+        imwrite(str(tmp_path / 'src' / 'slice_{:02d}.png'.format(z)), image)
+    assert downsample_folder(str(tmp_path / 'src'), str(tmp_path / 'dest'), 2, slab_bytes=array[0].size * 8) == 5
+    reduced = np.stack([imread(str(tmp_path / 'dest' / 'slice{:04d}.png'.format(z))) for z in range(5)])
+    assert reduced.dtype == np.uint8
+    np.testing.assert_array_equal(reduced, np.rint(reduce_array(array, (2, 2, 2))).astype(np.uint8))
+
+
+def test_images_are_reduced_by_the_workers(tmp_path):
+    images = [volume((16, 20)).astype(np.uint8) + k for k in range(3)]
+    (tmp_path / 'src').mkdir()
+    for k, image in enumerate(images):
+        imwrite(str(tmp_path / 'src' / 'image{}.png'.format(k)), image)
+    files = downsample_images(str(tmp_path / 'src'), str(tmp_path / 'dest'), 4, anti_aliasing=True, workers=2,
+                              chunk=2)
+    assert [f.split('image')[-1] for f in files] == ['0.png', '1.png', '2.png']
+    for image, name in zip(images, files):
+        expected = np.rint(reduce_array(image, (4, 4), anti_aliasing=True)).astype(np.uint8)
+        np.testing.assert_array_equal(imread(name), expected)
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from projector_backend import create_backend, create_vol_geom, create_proj_geom
+from fdk import FILTERS, ramp_filter, fdk, fit_scale, warm_start
+
+SIZE = 48
+
+
+def circular_vectors(n_proj, cone, radius=150.0, distance=100.0):
+    # a full turn of the source around the centre of the volume, the detector facing it across the volume
+    angle = np.linspace(0, 2 * np.pi, n_proj, endpoint=False)
+    sin, cos, zero = np.sin(angle), np.cos(angle), np.zeros(n_proj)
+    if not cone:
+        return np.stack((-radius * sin, radius * cos, distance * sin, -distance * cos, cos, sin), axis=1)
+    return np.stack((-radius * sin, radius * cos, zero, distance * sin, -distance * cos, zero, cos, sin, zero,
+                     zero, zero, zero + 1), axis=1)
+
+
+def disks():
+    y, x = np.mgrid[:SIZE, :SIZE] - SIZE / 2 + 0.5
+    image = (y ** 2 + x ** 2 < 18 ** 2).astype(np.float32)
+    image[(y - 5) ** 2 + (x + 4) ** 2 < 6 ** 2] = 2
+    return image, y ** 2 + x ** 2 < 15 ** 2
+
+
+def circular_scan(cone):
+    image, inner = disks()
+    if cone:
+        volume = np.repeat(image[None], 8, axis=0)
+        volume[[0, -1]] = 0
+        proj_geom = create_proj_geom('cone_vec', 16, 96, circular_vectors(180, cone))
+        return proj_geom, create_vol_geom(SIZE, SIZE, 8), volume, (4, inner)
+    return create_proj_geom('fanflat_vec', 96, circular_vectors(180, cone)), create_vol_geom(SIZE, SIZE), image, inner
+
+
+@pytest.mark.parametrize('cone, filter_name', [(False, name) for name in FILTERS] + [(True, 'ram-lak')])
+def test_full_circular_scan_recovers_the_attenuation(cone, filter_name):
+    proj_geom, vol_geom, volume, inner = circular_scan(cone)
+    sinogram = create_backend('cpu', proj_geom, vol_geom).forward(volume)
+    rec = fdk(proj_geom, vol_geom, sinogram, filter_name)
+    assert rec.shape == volume.shape and rec.dtype == np.float32
+    # no global rescaling: the absolute values are recovered inside the object, away from its edges
+    assert np.abs(rec - volume)[inner].mean() < 0.04
+    centre = rec[4] if cone else rec
+    assert centre[SIZE // 2 + 5, SIZE // 2 - 4] == pytest.approx(2, abs=0.02)
+    assert centre[SIZE // 2, SIZE // 2 + 10] == pytest.approx(1, abs=0.02)
+
+
+def test_reconstruction_does_not_depend_on_the_chunks():
+    proj_geom, vol_geom, volume, _ = circular_scan(False)
+    sinogram = create_backend('cpu', proj_geom, vol_geom).forward(volume)
+    whole = fdk(proj_geom, vol_geom, sinogram)
+    chunked = fdk(proj_geom, vol_geom, sinogram, chunk_elements=2 ** 12, n_workers=3)
+    np.testing.assert_allclose(chunked, whole, rtol=1e-5, atol=1e-5)
+
+
+def test_ramp_filter_is_a_non_negative_band_limited_ramp():
+    for name in FILTERS:
+        response, n = ramp_filter(96, name)
+        assert n >= 2 * 96 and len(response) == n // 2 + 1
+        # the DC term of the spatial kernel only comes from its truncation to n samples
+        assert 0 <= response[0] < 0.01 * response.max() and np.all(response[1:-1] > 0)
+        assert 0 <= response[-1] <= response.max() <= 0.5 + 1e-6
+    with pytest.raises(ValueError):
+        ramp_filter(96, 'ramp')
+
+
+def test_warm_start_is_a_scaled_non_negative_fit():
+    proj_geom, vol_geom, volume, _ = circular_scan(False)
+    # half a turn: the preview is approximate and fit_scale() corrects its scale
+    proj_geom['Vectors'] = proj_geom['Vectors'][:90]
+    backend = create_backend('cpu', proj_geom, vol_geom)
+    sinogram = backend.forward(volume)
+    preview = fdk(proj_geom, vol_geom, sinogram)
+    scaled = fit_scale(backend, preview.copy(), sinogram)
+    residual = lambda rec: np.linalg.norm(backend.forward(rec) - sinogram)
+    assert residual(scaled) <= residual(preview)
+    start = warm_start(backend, sinogram)
+    assert start.min() >= 0 and start.flags['C_CONTIGUOUS']
+    assert residual(start) < np.linalg.norm(sinogram)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from projector_backend import create_backend, create_vol_geom, create_proj_geom, check_float32
+from inline_setup_3D import InlineScanningSetup3D
+from motion_blur import motion_blurred_sinogram
+
+
+def backend():
+    setup = InlineScanningSetup3D(alpha=40, detector_cells=96, number_of_projections=16, object_size=(48, 48, 8))
+    return create_backend('cpu', create_proj_geom('cone_vec', 96, 96, setup.get_geometry_matrix()),
+                          create_vol_geom(48, 48, 8))
+
+
+def phantom():
+    volume = np.zeros((8, 48, 48), dtype=np.float32)
+    volume[2:6, 8:40, 4:44] = 1
+    return volume
+
+
+def test_float32_arrays_are_passed_as_they_are(tmp_path):
+    volume = phantom()
+    assert check_float32(volume, (8, 48, 48)) is volume
+    np.save(str(tmp_path / 'volume.npy'), volume)
+    mapped = np.load(str(tmp_path / 'volume.npy'), mmap_mode='r')
+    assert check_float32(mapped) is mapped
+
+
+@pytest.mark.parametrize('array', [phantom().astype(np.float64), phantom()[:, :, ::2], phantom().tolist(),
+                                   np.asfortranarray(phantom())])
+def test_other_arrays_are_not_converted_silently(array):
+    with pytest.raises(ValueError):
+        check_float32(array)
+    with pytest.raises(ValueError):
+        backend().forward(array)
+
+
+def test_shapes_are_checked():
+    with pytest.raises(ValueError, match=r'of shape \(8, 48, 48\)'):
+        check_float32(np.zeros((8, 48, 47), dtype=np.float32), (8, 48, 48), 'phantom')
+
+
+def test_sinograms_are_written_into_the_given_buffer():
+    projector = backend()
+    out = np.full((96, 8, 96), np.nan, dtype=np.float32)
+    sinogram = motion_blurred_sinogram(projector, phantom(), 8, 2, block_projs=3, out=out)
+    assert sinogram is out and sinogram.max() > 0
+    np.testing.assert_array_equal(sinogram, motion_blurred_sinogram(projector, phantom(), 8, 2, block_projs=3))
+    with pytest.raises(ValueError):
+        motion_blurred_sinogram(projector, phantom(), 8, 2, out=np.zeros((96, 8, 96)))
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from object_continuous_inline_scan_setup_3D import InlineContinuousScanningObject3D
+from object_scan import ScanningObject
+from footprint import footprint_box, vol_shape
+
+
+def scanning_object(**options):
+    # the rays of this setup only cross the lower half of the slices and reach half of the detector rows
+    return InlineContinuousScanningObject3D(alpha_param=30, n_cells_param=128, n_proj_param=4,
+                                            rec_size_param=(64, 64, 10), backend='cpu', **options)
+
+
+def phantom():
+    return np.random.default_rng(0).random((10, 64, 64), dtype=np.float32)
+
+
+def test_whole_grid_and_detector_by_default():
+    full = scanning_object()
+    assert full.roi is None and full.detector_window is None
+    assert full.simulate(phantom()).shape == (128, 4, 128)
+    assert ScanningObject(40, 96, 4, rec_size_param=(64, 64, 10), backend='cpu').detector_window is None
+
+
+def test_cropped_volume_holds_every_voxel_crossed():
+    full, cropped = scanning_object(), scanning_object(crop_roi=True)
+    assert vol_shape(cropped.vol_geom) != vol_shape(full.vol_geom)
+    # the voxels left out are not crossed by any ray
+    outside = phantom()
+    outside[cropped.roi] = 0
+    assert np.abs(full.simulate(outside)).max() == 0 and np.abs(full.simulate(phantom())).max() > 0
+    np.testing.assert_allclose(cropped.simulate(phantom()), full.simulate(phantom()), rtol=1e-5, atol=1e-5)
+    assert footprint_box(cropped.proj_geom, cropped.vol_geom) is not None
+
+
+def test_trimmed_detector_holds_every_ray_through_the_volume():
+    full, trimmed = scanning_object(), scanning_object(trim_detector=True)
+    rows, cols = trimmed.detector_window
+    assert trimmed.detector_trim['kept'] < 1
+    sinogram = full.simulate(phantom())
+    mask = np.ones(sinogram.shape, dtype=bool)
+    mask[rows, :, cols] = False
+    assert np.abs(sinogram[mask]).max() == 0
+    np.testing.assert_allclose(trimmed.simulate(phantom()), sinogram[rows, :, cols], rtol=1e-5, atol=1e-5)
+
+
+@pytest.mark.parametrize('options', [{'crop_roi': True}, {'trim_detector': True},
+                                     {'crop_roi': True, 'trim_detector': True}])
+def test_reconstructions_are_unchanged(options):
+    with scanning_object().session(n_iterations_param=5) as session:
+        full = np.array(session.run(phantom())['rec'])
+    with scanning_object(**options).session(n_iterations_param=5) as session:
+        reduced = session.run(phantom())['rec']
+    assert reduced.shape == full.shape
+    np.testing.assert_allclose(reduced, full, rtol=1e-4, atol=1e-4 * np.abs(full).max())
@@ -0,0 +1,86 @@
+from math import radians, tan, atan2, sin, cos
+import numpy as np
+import pytest
+from geometry_builder import inline_geometry_2d, inline_geometry_3d, semi_circular_geometry, semi_circular_det_size
+
+
+def baseline_inline_2d(alpha, detector_cells, number_of_projections, object_size, omega_total=0):
+    # the loop of the original InlineScanningSetup2D
+    h = (detector_cells / 2) / tan(radians(alpha / 2))
+    src_x = np.linspace(-detector_cells / 2, detector_cells / 2, num=number_of_projections)
+    src_y = np.full(number_of_projections, h - object_size / 2)
+    d_x = np.linspace(-detector_cells / 2, detector_cells / 2, num=number_of_projections)
+    d_y = np.full(number_of_projections, -100.0)
+    u_x, u_y = np.ones(number_of_projections), np.zeros(number_of_projections)
+    if omega_total > 0:
+        omega = radians(omega_total / number_of_projections)
+        for p in range(number_of_projections):
+            retro = number_of_projections - p - 1
+            angle = p * omega + atan2(src_y[retro], src_x[retro])
+            d = (src_y[retro] ** 2 + src_x[retro] ** 2) ** 0.5
+            src_y[retro], src_x[retro] = d * sin(angle), d * cos(angle)
+            u_y[p], u_x[p] = sin(p * omega), cos(p * omega)
+    return np.column_stack((src_x, src_y, d_x, d_y, u_x, u_y))
+
+
+def baseline_inline_3d(alpha, detector_cells, number_of_projections, depth, vert_shift=0, tg_dir="esq", rotation=0):
+    # the original InlineScanningSetup3D
+    h = (detector_cells / 2) / tan(radians(alpha / 2))
+    offset = -350
+    n = number_of_projections
+    if tg_dir == "left":
+        src_x = np.linspace(-offset - detector_cells / 2, offset + detector_cells / 2, num=n)
+    else:
+        src_x = np.linspace(offset + detector_cells / 2, -offset - detector_cells / 2, num=n)
+    c, s = np.cos(np.deg2rad(rotation)), np.sin(np.deg2rad(rotation))
+    z = h - depth / 2
+    src_z, src_y = np.full(n, z * c), np.full(n, vert_shift + z * s)
+    z = -depth / 2
+    d_z, d_y = np.full(n, z * c), np.full(n, vert_shift + z * s)
+    zeros = np.zeros(n)
+    return np.column_stack((src_x, src_y, src_z, src_x, d_y, d_z, np.ones(n), zeros, zeros, zeros, np.full(n, c),
+                            np.full(n, s)))
+
+
+def baseline_semi_circular(radius, n_projs, src_dist, det_dist):
+    # the original SemiCircularConveyorBelt
+    alpha = np.linspace(radians(60), radians(120), n_projs)
+    return np.column_stack(((src_dist + radius) - np.sin(alpha) * radius, -np.cos(alpha) * radius,
+                            (radius - det_dist) - np.sin(alpha) * radius, -np.cos(alpha) * radius,
+                            np.cos(-alpha), np.sin(-alpha)))
+
+
+def assert_matrix(actual, expected):
+    assert actual.shape == expected.shape
+    assert actual.flags['C_CONTIGUOUS']
+    np.testing.assert_allclose(actual, expected, rtol=1e-6, atol=1e-4)
+
+
+@pytest.mark.parametrize('omega', [0, 45, 90])
+@pytest.mark.parametrize('n_proj', [1, 2, 7])
+def test_inline_2d_matches_the_baseline(omega, n_proj):
+    assert_matrix(inline_geometry_2d(60, 519, n_proj, 128, omega), baseline_inline_2d(60, 519, n_proj, 128, omega))
+
+
+@pytest.mark.parametrize('tg_dir', ['left', 'right'])
+@pytest.mark.parametrize('rotation', [0, 15])
+def test_inline_3d_matches_the_baseline(tg_dir, rotation):
+    assert_matrix(inline_geometry_3d(30, 256, 10, 10, 5, tg_dir, rotation),
+                  baseline_inline_3d(30, 256, 10, 10, 5, tg_dir, rotation))
+
+
+def test_semi_circular_matches_the_baseline():
+    assert_matrix(semi_circular_geometry(250, 45, 200, 100), baseline_semi_circular(250, 45, 200, 100))
+    assert semi_circular_det_size(250, 200, 100, 60) == int(2 * tan(radians(30)) * 550)
+
+
+def test_batches_match_one_configuration_at_a_time():
+    alphas, projections, omegas = [30, 60, 90], [4, 7, 4], [0, 30, 60]
+    matrices = inline_geometry_2d(alphas, 519, projections, 128, omegas)
+    assert len(matrices) == 3
+    for matrix, alpha, n_proj, omega in zip(matrices, alphas, projections, omegas):
+        assert_matrix(matrix, baseline_inline_2d(alpha, 519, n_proj, 128, omega))
+
+    matrices = inline_geometry_3d(50, 256, [5, 9], 32, vert_shift=[0, 20], tg_dir=['left', 'right'])
+    for matrix, n_proj, shift, tg_dir in zip(matrices, [5, 9], [0, 20], ['left', 'right']):
+        assert_matrix(matrix, baseline_inline_3d(50, 256, n_proj, 32, shift, tg_dir))
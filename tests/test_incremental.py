@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from projector_backend import create_backend
+from iterative_solvers import select_projections
+from object_continuous_multiple_inline_scan_setup_3D import MultipleInlineContinuousScanningObject3D
+
+
+def scan(**options):
+    return MultipleInlineContinuousScanningObject3D(views_param=3, rec_size_param=(48, 48, 8), n_proj_param=6,
+                                                    cells=96, backend='cpu', **options)
+
+
+def phantom():
+    volume = np.zeros((8, 48, 48), dtype=np.float32)
+    volume[2:6, 8:40, 4:44] = 1
+    return volume
+
+
+def test_every_stage_refines_the_previous_estimate():
+    setup = scan()
+    outputs = list(setup.run_incremental(phantom(), n_iterations_param=5))
+    assert all(output['rec'].max() > 0 for output in outputs)
+    assert [output['stage'] for output in outputs] == [1, 2, 3]
+    assert [output['sino'].shape for output in outputs] == [(96, 6, 96), (96, 12, 96), (96, 18, 96)]
+    np.testing.assert_allclose(outputs[-1]['sino'], setup.simulate(phantom()), rtol=1e-5, atol=1e-6)
+
+    previous = None
+    for output in outputs:
+        end = output['sino'].shape[1]
+        backend = create_backend('cpu', select_projections(setup.new_geom, slice(0, end)), setup.vol_geom)
+        with backend.session('SIRT3D_CUDA', 5) as session:
+            expected = session.reconstruct(np.ascontiguousarray(output['sino']), x0=previous)['rec']
+        np.testing.assert_allclose(output['rec'], expected, rtol=1e-5, atol=1e-6)
+        assert output['iterations'] == 5
+        previous = expected
+
+
+@pytest.mark.parametrize('options', [dict(trim_detector=True), dict(crop_roi=True, trim_detector=True)])
+def test_trimmed_setups_accept_whole_detector_stages(options):
+    setup, whole = scan(**options), scan()
+    stages = [whole.simulate_stage(phantom(), stage) for stage in range(3)]
+    trimmed = list(setup.reconstruct_incremental(iter(stages), n_iterations_param=3))
+    window = setup.detector_window
+    direct = list(setup.reconstruct_incremental((stage[window[0], :, window[1]] for stage in stages), 3))
+    for a, b in zip(trimmed, direct):
+        assert a['rec'].shape == (8, 48, 48)
+        np.testing.assert_array_equal(a['rec'], b['rec'])
+    np.testing.assert_allclose(trimmed[-1]['rec'], list(whole.reconstruct_incremental(stages, 3))[-1]['rec'],
+                               rtol=1e-4, atol=1e-4 * np.abs(trimmed[-1]['rec']).max())
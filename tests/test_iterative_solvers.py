@@ -0,0 +1,81 @@
+import threading
+import numpy as np
+import pytest
+import iterative_solvers
+from iterative_solvers import CPUOperator, sirt, cgls, operator_weights
+from projector_backend import create_backend, create_vol_geom, create_proj_geom, CPUSession
+from inline_setup_2D import InlineScanningSetup2D
+
+
+def geometry(n_proj=12):
+    setup = InlineScanningSetup2D(alpha=60, detector_cells=80, number_of_projections=n_proj, object_size=48,
+                                  omega_total=0)
+    return create_proj_geom('fanflat_vec', 80, setup.get_geometry_matrix()), create_vol_geom(48, 48)
+
+
+def sinogram(operator):
+    phantom = np.zeros((48, 48), dtype=np.float32)
+    phantom[12:36, 8:40] = 1
+    return operator.forward(phantom)
+
+
+def relative_residual(operator, b, x):
+    return np.linalg.norm(b - operator.forward(x)) / np.linalg.norm(b)
+
+
+@pytest.mark.parametrize('solver', [sirt, cgls])
+def test_residuals_are_those_of_the_iterates(solver):
+    operator = CPUOperator(*geometry())
+    b = sinogram(operator)
+    states = []
+    result = solver(operator, b, 5, callback=lambda k, x, residual: states.append((k, x.copy(), residual)))
+    assert result['iterations'] == 5 and len(result['residuals']) == 6
+    assert result['residuals'][0] == pytest.approx(1.0)
+    for k, x, residual in states:
+        assert residual == result['residuals'][k]
+        assert residual == pytest.approx(relative_residual(operator, b, x), rel=1e-4)
+
+
+def test_sirt_stops_at_the_first_iterate_within_tolerance():
+    operator = CPUOperator(*geometry())
+    b = sinogram(operator)
+    residuals = sirt(operator, b, 30)['residuals']
+    tol = (residuals[10] + residuals[11]) / 2
+    result = sirt(operator, b, 30, tol=tol)
+    assert result['iterations'] == 11
+    assert result['residuals'][-1] <= tol < result['residuals'][-2]
+    assert relative_residual(operator, b, result['rec']) <= tol * (1 + 1e-4)
+
+
+def test_weight_cache_is_shared_by_threads(monkeypatch):
+    monkeypatch.setattr(iterative_solvers, '_weight_cache', type(iterative_solvers._weight_cache)())
+    operators = [CPUOperator(*geometry(n_proj)) for n_proj in (6, 7, 8)]
+    expected = [operator_weights(operator) for operator in operators]
+    iterative_solvers._weight_cache.clear()
+    errors, results = [], {}
+
+    def work(k):
+        try:
+            for _ in range(5):
+                for index in (k % 3, (k + 1) % 3):
+                    results.setdefault(index, []).append(operator_weights(operators[index]))
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=work, args=(k,)) for k in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors and len(iterative_solvers._weight_cache) == 3
+    for index, weights in results.items():
+        for row_weight, col_weight in weights:
+            np.testing.assert_array_equal(row_weight, expected[index][0])
+            np.testing.assert_array_equal(col_weight, expected[index][1])
+
+
+def test_cuda_backend_runs_other_algorithms_on_its_operator():
+    pytest.importorskip('astra')
+    backend = create_backend('cuda', *geometry())
+    with backend.session('SART', 2) as session:
+        assert isinstance(session, CPUSession) and session.operator is backend.operator
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from projector_backend import create_backend, create_vol_geom, create_proj_geom
+from inline_setup_3D import InlineScanningSetup3D
+from motion_blur import motion_blurred_sinogram, rebinned_geometry
+
+VOL_GEOM = create_vol_geom(48, 48, 8)
+
+
+def phantom():
+    volume = np.zeros((8, 48, 48), dtype=np.float32)
+    volume[2:6, 8:40, 4:44] = 1
+    return volume
+
+
+def sub_positions(n_proj, supersampling):
+    return InlineScanningSetup3D(alpha=40, detector_cells=96, number_of_projections=n_proj * supersampling,
+                                 object_size=(48, 48, 8)).get_geometry_matrix()
+
+
+def cpu_backend(matrix):
+    return create_backend('cpu', create_proj_geom('cone_vec', 96, 96, matrix), VOL_GEOM)
+
+
+@pytest.mark.parametrize('supersampling', [1, 2, 3, 8])
+def test_rebinned_geometry_is_centred_on_its_sub_positions(supersampling):
+    matrix = sub_positions(10, supersampling)
+    rebinned = rebinned_geometry(matrix, supersampling)
+    assert rebinned.shape == (10, 12)
+    groups = matrix.reshape(10, supersampling, 12)
+    # the belt moves linearly, so the centre of a group is the middle of its first and last sub-positions
+    np.testing.assert_allclose(rebinned[:, 0], (groups[:, 0, 0] + groups[:, -1, 0]) / 2, rtol=1e-5, atol=1e-3)
+    np.testing.assert_allclose(rebinned, groups.mean(axis=1), rtol=1e-6, atol=1e-4)
+
+
+def test_rebinned_geometry_rejects_partial_groups():
+    with pytest.raises(ValueError):
+        rebinned_geometry(sub_positions(5, 2)[:-1], 2)
+
+
+@pytest.mark.parametrize('supersampling', [2, 8])
+def test_rebinned_projections_fit_the_blurred_sinogram(supersampling):
+    matrix = sub_positions(40, supersampling)
+    blurred = motion_blurred_sinogram(cpu_backend(matrix), phantom(), 40, supersampling)
+    centred = cpu_backend(rebinned_geometry(matrix, supersampling)).forward(phantom())
+    # the former choice of rebinned_geometry: the (S / 2)-th sub-position of every group
+    shifted = cpu_backend(np.ascontiguousarray(matrix[supersampling // 2::supersampling])).forward(phantom())
+    assert np.linalg.norm(centred - blurred) < np.linalg.norm(shifted - blurred)
+
+
+def test_blurred_sinogram_does_not_depend_on_the_blocks():
+    matrix = sub_positions(12, 4)
+    backend = cpu_backend(matrix)
+    whole = motion_blurred_sinogram(backend, phantom(), 12, 4)
+    blocks = motion_blurred_sinogram(backend, phantom(), 12, 4, block_projs=5)
+    np.testing.assert_allclose(blocks, whole, rtol=1e-6)
+    assert whole.shape == (96, 12, 96)
+    sub = backend.forward(phantom())
+    np.testing.assert_allclose(whole, sub.reshape(96, 12, 4, 96).mean(axis=2), rtol=1e-5, atol=1e-5)
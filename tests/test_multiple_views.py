@@ -0,0 +1,20 @@
+import numpy as np
+from object_continuous_multiple_inline_scan_setup_3D import MultipleInlineContinuousScanningObject3D
+
+
+def test_public_methods_are_documented():
+    for name in ('__init__', 'simulate', 'session', 'run'):
+        doc = getattr(MultipleInlineContinuousScanningObject3D, name).__doc__
+        assert doc and doc.strip().startswith('It ')
+
+
+def test_simulation_stacks_the_views():
+    scan = MultipleInlineContinuousScanningObject3D(views_param=2, rec_size_param=(48, 48, 8), n_proj_param=6,
+                                                    cells=96, backend='cpu', crop_roi=False, trim_detector=False)
+    phantom = np.zeros((8, 48, 48), dtype=np.float32)
+    phantom[2:6, 8:40, 4:44] = 1
+    sinogram = scan.simulate(phantom)
+    assert sinogram.shape == (96, 12, 96) and sinogram.max() > 0
+    for stage in range(2):
+        np.testing.assert_allclose(scan.simulate_stage(phantom, stage), sinogram[:, 6 * stage:6 * (stage + 1)],
+                                   rtol=1e-5, atol=1e-6)
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter
+from projector_backend import create_backend, create_vol_geom, create_proj_geom
+from inline_setup_2D import InlineScanningSetup2D
+from inline_setup_3D import InlineScanningSetup3D
+from multiresolution import coarse_geometry, coarse_vol_geom, bin_sinogram, upsample_volume, coarse_to_fine
+
+
+def scene_2d(cells=80):
+    setup = InlineScanningSetup2D(alpha=60, detector_cells=cells, number_of_projections=7, object_size=48,
+                                  omega_total=0)
+    volume = np.zeros((48, 48), dtype=np.float32)
+    volume[8:40, 12:36] = 1
+    return create_proj_geom('fanflat_vec', cells, setup.get_geometry_matrix()), create_vol_geom(48, 48), volume
+
+
+def scene_3d(cells=96):
+    setup = InlineScanningSetup3D(alpha=40, detector_cells=cells, number_of_projections=10, object_size=(48, 48, 8))
+    volume = np.zeros((8, 48, 48), dtype=np.float32)
+    volume[2:6, 8:40, 4:44] = 1
+    return create_proj_geom('cone_vec', cells, cells, setup.get_geometry_matrix()), create_vol_geom(48, 48, 8), volume
+
+
+def block_mean(volume, factor):
+    blocks = volume.reshape([n for size in volume.shape for n in (size // factor, factor)])
+    return blocks.mean(axis=tuple(range(1, blocks.ndim, 2)))
+
+
+@pytest.mark.parametrize('scene, factor, tolerance', [
+    (scene_2d, 2, 0.03), (lambda: scene_2d(81), 2, 0.03), (scene_2d, 4, 0.08),
+    (scene_3d, 2, 0.05), (lambda: scene_3d(97), 2, 0.05)])
+def test_binned_sinogram_matches_the_coarse_geometry(scene, factor, tolerance):
+    proj_geom, vol_geom, volume = scene()
+    # a smooth object, so that block means of the volume are a fair coarse version of it
+    volume = gaussian_filter(volume, 2).astype(np.float32)
+    binned = bin_sinogram(create_backend('cpu', proj_geom, vol_geom).forward(volume), proj_geom, factor)
+    coarse_geom, coarse_vol = coarse_geometry(proj_geom, vol_geom, factor)
+    coarse = create_backend('cpu', coarse_geom, coarse_vol).forward(block_mean(volume, factor))
+    assert binned.shape == coarse.shape
+    assert binned.flags['C_CONTIGUOUS'] and binned.dtype == np.float32
+    assert np.linalg.norm(coarse - binned) < tolerance * np.linalg.norm(binned)
+
+
+def test_coarse_volume_keeps_the_voxel_size_and_centre():
+    vol_geom = create_vol_geom(48, 50, 7)
+    vol_geom['option'].update(WindowMinX=-20.0, WindowMaxX=30.0)
+    coarse = coarse_vol_geom(vol_geom, 2)
+    assert (coarse['GridRowCount'], coarse['GridColCount'], coarse['GridSliceCount']) == (24, 25, 4)
+    option = coarse['option']
+    assert (option['WindowMinX'], option['WindowMaxX']) == (-10.0, 15.0)
+    assert (option['WindowMinY'], option['WindowMaxY']) == (-12.0, 12.0)
+    assert (option['WindowMinZ'], option['WindowMaxZ']) == (-2.0, 2.0)
+    assert vol_geom['option']['WindowMinX'] == -20.0
+
+
+def test_binning_divides_the_constant_line_integrals():
+    proj_geom, _, _ = scene_3d(97)
+    binned = bin_sinogram(np.full((97, 10, 97), 6, dtype=np.float32), proj_geom, 4)
+    assert binned.shape == (24, 10, 24)
+    np.testing.assert_allclose(binned, 1.5)
+    with pytest.raises(ValueError):
+        coarse_geometry(proj_geom, create_vol_geom(48, 48, 8), 128)
+
+
+def test_upsampled_volume_keeps_constants_and_shape():
+    fine = upsample_volume(np.full((4, 12, 12), 3, dtype=np.float32), 2, (7, 24, 23))
+    assert fine.shape == (7, 24, 23) and fine.flags['C_CONTIGUOUS']
+    np.testing.assert_allclose(fine, 3)
+
+
+def test_levels_start_from_the_previous_one():
+    proj_geom, vol_geom, volume = scene_2d()
+    backend = create_backend('cpu', proj_geom, vol_geom)
+    sinogram = backend.forward(volume)
+    levels = list(coarse_to_fine('cpu', proj_geom, vol_geom, sinogram, factors=(4, 2, 1), n_iterations=(20, 20, 5),
+                                 algorithm='SIRT_CUDA', backend=backend))
+    assert [level['factor'] for level in levels] == [4, 2, 1]
+    assert [level['rec'].shape for level in levels] == [(12, 12), (24, 24), (48, 48)]
+    with backend.session('SIRT_CUDA', 5) as session:
+        cold = session.reconstruct(sinogram)['rec']
+    residual = lambda rec: np.linalg.norm(backend.forward(rec) - sinogram)
+    assert residual(levels[-1]['rec']) < residual(cold)
+
+
+@pytest.mark.parametrize('factors', [(2, 4, 1), (4, 3, 1), (4, 2)])
+def test_invalid_factors_are_rejected(factors):
+    proj_geom, vol_geom, _ = scene_2d()
+    with pytest.raises(ValueError):
+        next(coarse_to_fine('cpu', proj_geom, vol_geom, np.zeros((7, 80), dtype=np.float32), factors=factors))
@@ -0,0 +1,41 @@
+import os
+from functools import partial
+import numpy as np
+import pytest
+from dataset_runner import DatasetRunner
+from sample_store import open_store, write_index
+from object_scan_inline_setup_2D import InlineScanningObject
+
+FACTORY = partial(InlineScanningObject, 60, 64, 5, rec_size_param=32, backend='cpu')
+
+
+def packed_store(path, n):
+    images = np.random.default_rng(0).random((n, 32, 32), dtype=np.float32)
+    np.save(path, images)
+    write_index(path, [{'name': 'img_{}'.format(k), 'label': 'defect' if k % 2 else 'health'} for k in range(n)])
+    return images
+
+
+@pytest.mark.parametrize('batch', [2, 32])
+def test_packed_outputs_follow_the_store_order(tmp_path, batch):
+    images = packed_store(str(tmp_path / 'samples.npy'), 5)
+    runner = DatasetRunner(FACTORY, 'SIRT', 5, workers=2, max_in_flight=2)
+    sino_path, rec_path = runner.run_packed(str(tmp_path / 'samples.npy'), str(tmp_path / 'packed'), batch=batch)
+    (sinos, sino_index), (recs, rec_index) = open_store(sino_path), open_store(rec_path)
+    assert sinos.shape == (5, 5, 64) and recs.shape == (5, 32, 32)
+    with FACTORY().session('SIRT', 5) as session:
+        for k, image in enumerate(images):
+            expected = session.run(image)
+            np.testing.assert_allclose(recs[k], expected['rec'], rtol=1e-5, atol=1e-6)
+            np.testing.assert_allclose(sinos[k], expected['sino'], rtol=1e-5, atol=1e-6)
+    for index in (sino_index, rec_index):
+        assert [row['name'] for row in index] == ['img_{}'.format(k) for k in range(5)]
+        assert index[1]['label'] == 'defect' and float(index[1]['time']) >= 0
+    assert len(runner.times) == 5
+    assert sorted(os.listdir(str(tmp_path / 'packed'))) == ['rec.csv', 'rec.npy', 'sino.csv', 'sino.npy']
+
+
+def test_empty_stores_are_rejected(tmp_path):
+    packed_store(str(tmp_path / 'samples.npy'), 0)
+    with pytest.raises(ValueError):
+        DatasetRunner(FACTORY).run_packed(str(tmp_path / 'samples.npy'), str(tmp_path / 'packed'))
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from iterative_solvers import CPUOperator, sirt, sirt_steps, cgls, cgls_steps, sart, sart_steps, progressive
+from projector_backend import create_vol_geom, create_proj_geom
+from inline_setup_2D import InlineScanningSetup2D
+from object_scan_inline_setup_2D import InlineScanningObject
+
+SOLVERS = [(sirt, sirt_steps), (cgls, cgls_steps), (sart, sart_steps)]
+
+
+def problem():
+    setup = InlineScanningSetup2D(alpha=60, detector_cells=80, number_of_projections=12, object_size=48,
+                                  omega_total=0)
+    operator = CPUOperator(create_proj_geom('fanflat_vec', 80, setup.get_geometry_matrix()), create_vol_geom(48, 48))
+    phantom = np.zeros((48, 48), dtype=np.float32)
+    phantom[12:36, 8:40] = 1
+    return operator, operator.forward(phantom), phantom
+
+
+@pytest.mark.parametrize('solver, steps', SOLVERS)
+def test_states_are_those_of_the_solver(solver, steps):
+    operator, b, _ = problem()
+    states = [dict(state, rec=state['rec'].copy()) for state in progressive(steps(operator, b, 10), every=3)]
+    assert [state['iterations'] for state in states] == [3, 6, 9, 10]
+    for state in states:
+        np.testing.assert_allclose(state['rec'], solver(operator, b, state['iterations'])['rec'], rtol=1e-5,
+                                   atol=1e-6)
+    assert all(later['time'] >= earlier['time'] for earlier, later in zip(states, states[1:]))
+
+
+def test_the_last_state_reports_the_stopping_iteration():
+    operator, b, _ = problem()
+    residuals = sirt(operator, b, 30)['residuals']
+    tol = (residuals[7] + residuals[8]) / 2
+    states = list(progressive(sirt_steps(operator, b, 30, tol=tol), every=5))
+    assert [state['iterations'] for state in states] == [5, 8]
+    assert states[-1]['residual'] <= tol < states[0]['residual']
+
+
+def test_leaving_the_loop_keeps_the_last_reconstruction():
+    scan = InlineScanningObject(alpha_param=60, n_cells_param=80, n_proj_param=7, rec_size_param=48,
+                                omega_rotation=0, backend='cpu')
+    _, _, phantom = problem()
+    generator = scan.run_progressive(phantom, 'SIRT_CUDA', n_iterations_param=50, every_param=4)
+    first = next(generator)
+    rec = first['rec']
+    generator.close()
+    # the generator copies the view it yielded last once the session is closed
+    assert first['rec'] is not rec and first['iterations'] == 4
+    with scan.session('SIRT_CUDA', 4) as session:
+        expected = session.run(phantom)
+    np.testing.assert_allclose(first['rec'], expected['rec'], rtol=1e-5, atol=1e-6)
+    np.testing.assert_array_equal(first['sino'], expected['sino'])
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from scipy.ndimage import binary_dilation
+from cpu_projector import RayDrivenProjector
+from projector_backend import create_vol_geom
+from inline_setup_2D import InlineScanningSetup2D
+from inline_setup_3D import InlineScanningSetup3D
+from ray_coverage import matrix_geometry, coverage_maps, coverage_summary, screen_setup
+from object_scan_inline_setup_2D import InlineScanningObject
+
+
+def circular_vectors(n_proj, radius=150.0, distance=100.0):
+    angle = np.linspace(0, 2 * np.pi, n_proj, endpoint=False)
+    sin, cos = np.sin(angle), np.cos(angle)
+    return np.stack((-radius * sin, radius * cos, distance * sin, -distance * cos, cos, sin), axis=1)
+
+
+def test_full_circular_scan_sees_every_voxel_from_every_angle():
+    maps = coverage_maps(matrix_geometry(circular_vectors(36), 96), create_vol_geom(32, 32), n_bins=18,
+                         histograms=True)
+    assert maps['hits'].shape == (32, 32)
+    assert np.all(maps['hits'] == 36)
+    np.testing.assert_array_equal(maps['coverage'], 1)
+    np.testing.assert_array_equal(maps['gap'], 0)
+    np.testing.assert_array_equal(maps['angles'].sum(axis=-1), maps['hits'])
+    summary = coverage_summary(maps)
+    assert summary == {'hit_fraction': 1.0, 'mean_hits': 36.0, 'angular_coverage': 1.0, 'angular_coverage_p5': 1.0,
+                       'max_gap': 0.0}
+
+
+def test_one_projection_covers_one_sector():
+    maps = coverage_maps(matrix_geometry(circular_vectors(1), 96), create_vol_geom(32, 32), n_bins=18)
+    seen = maps['hits'] == 1
+    assert seen.all()
+    np.testing.assert_allclose(maps['coverage'], 1 / 18)
+    np.testing.assert_allclose(maps['gap'], 170)
+
+
+@pytest.mark.parametrize('three_d', [False, True])
+def test_hits_match_the_voxels_reached_by_the_projector(three_d):
+    if three_d:
+        setup = InlineScanningSetup3D(alpha=40, detector_cells=96, number_of_projections=10, object_size=(48, 48, 8))
+        vectors, cells, vol_geom = setup.get_geometry_matrix(), 96, create_vol_geom(48, 48, 8)
+    else:
+        setup = InlineScanningSetup2D(alpha=60, detector_cells=80, number_of_projections=7, object_size=48,
+                                      omega_total=0)
+        vectors, cells, vol_geom = setup.get_geometry_matrix(), 80, create_vol_geom(48, 48)
+    hits = coverage_maps(matrix_geometry(vectors, cells), vol_geom)['hits']
+    assert hits.max() > 0
+    total = np.zeros_like(hits)
+    for p in range(len(vectors)):
+        proj_geom = matrix_geometry(vectors[p:p + 1], cells)
+        seen = coverage_maps(proj_geom, vol_geom)['hits'] > 0
+        projector = RayDrivenProjector(proj_geom, vol_geom, use_numba=False)
+        reached = projector.backward(np.ones(projector.sino_shape, dtype=np.float32)) > 0
+        # the centre of a voxel may fall outside the detector while the rays sampling it by interpolation still cross
+        # its neighbourhood, at the borders of the beam
+        assert np.all(reached[seen])
+        assert not np.any(reached & ~binary_dilation(seen, np.ones((3,) * seen.ndim), iterations=2))
+        total += seen
+    np.testing.assert_array_equal(hits, total)
+
+
+def test_maps_do_not_depend_on_the_chunks():
+    setup = InlineScanningSetup2D(alpha=60, detector_cells=80, number_of_projections=7, object_size=48, omega_total=0)
+    proj_geom = matrix_geometry(setup.get_geometry_matrix(), 80)
+    whole = coverage_maps(proj_geom, create_vol_geom(48, 48), n_workers=1)
+    chunked = coverage_maps(proj_geom, create_vol_geom(48, 48), chunk_elements=50, n_workers=3)
+    for name in whole:
+        np.testing.assert_array_equal(chunked[name], whole[name])
+
+
+def test_geometry_matrices_are_checked():
+    assert matrix_geometry(np.zeros((3, 12)), (5, 7))['DetectorRowCount'] == 5
+    with pytest.raises(ValueError):
+        matrix_geometry(np.zeros((3, 9)), 5)
+
+
+def test_screening_applies_the_thresholds():
+    scan = InlineScanningObject(alpha_param=60, n_cells_param=80, n_proj_param=7, rec_size_param=48, backend='cpu')
+    summary = screen_setup(scan)
+    assert summary['keep'] and 0 < summary['hit_fraction'] <= 1
+    assert not screen_setup(scan, min_angular_coverage=summary['angular_coverage'] + 0.01)['keep']
+    assert not screen_setup(scan, min_hit_fraction=1.01)['keep']
@@ -0,0 +1,58 @@
+import os
+import numpy as np
+from result_cache import ResultCache, CACHE_DIR
+from system_matrix import CACHE_ROOT
+
+
+class CountingSession:
+    def __init__(self):
+        self.runs = 0
+
+    def run(self, phantom):
+        self.runs += 1
+        return {'rec': phantom * 2, 'time': 1.0, 'iterations': 3}
+
+    def close(self):
+        pass
+
+
+def phantom(value=1.0):
+    return np.full((8, 8), value, dtype=np.float32)
+
+
+def test_default_folder_is_under_the_cache_root():
+    assert os.path.isabs(CACHE_DIR) and CACHE_DIR.startswith(CACHE_ROOT)
+
+
+def test_identical_work_is_not_recomputed(tmp_path):
+    session = CountingSession()
+    cached = ResultCache(str(tmp_path)).wrap(session, {'geometry': 1}, 'SIRT', 100)
+    first = cached.run(phantom())
+    second = cached.run(phantom())
+    assert session.runs == 1 and second['iterations'] == 3 and not second['rec'].flags.writeable
+    np.testing.assert_array_equal(first['rec'], second['rec'])
+    # a new cache on the same folder, e.g. in another process, reads the disk level
+    ResultCache(str(tmp_path)).wrap(session, {'geometry': 1}, 'SIRT', 100).run(phantom())
+    assert session.runs == 1
+
+
+def test_changes_of_phantom_or_context_are_misses(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    session = CountingSession()
+    cache.wrap(session, {'geometry': 1}, 'SIRT', 100).run(phantom())
+    cache.wrap(session, {'geometry': 1}, 'SIRT', 100).run(phantom(2.0))
+    cache.wrap(session, {'geometry': 2}, 'SIRT', 100).run(phantom())
+    cache.wrap(session, {'geometry': 1}, 'SIRT', 200).run(phantom())
+    assert session.runs == 4
+    # equal contexts hash equally, whatever the types of their numbers
+    cache.wrap(session, {'geometry': 1.0}, 'SIRT', 100.0).run(phantom())
+    assert session.runs == 4
+
+
+def test_disk_level_is_capped(tmp_path):
+    cache = ResultCache(str(tmp_path), memory_bytes=0, disk_bytes=3000)
+    for value in range(10):
+        cache.put(cache.key(phantom(value)), {'rec': phantom(value)})
+    files = os.listdir(str(tmp_path))
+    assert 0 < len(files) < 10 and sum(os.path.getsize(os.path.join(str(tmp_path), f)) for f in files) <= 3000
+    assert cache.get(cache.key(phantom(9))) is not None and cache.get(cache.key(phantom(0))) is None
@@ -0,0 +1,78 @@
+import threading
+import numpy as np
+import pytest
+from imageio import imread
+from instrumentation import Trace
+from result_writer import save_chunked, ChunkedVolume, ResultWriter
+
+
+@pytest.fixture
+def stored(tmp_path):
+    array = np.random.default_rng(0).random((13, 20, 7)).astype(np.float32)
+    return array, ChunkedVolume(save_chunked(str(tmp_path / 'volume.bin'), array, chunks=(4, 8, 5)))
+
+
+@pytest.mark.parametrize('key', [
+    np.s_[...], np.s_[3], np.s_[-1], np.s_[2:11, 5], np.s_[:, 7:19:3, 1:], np.s_[::-2, ::-1, 6], np.s_[12, 19, 6],
+    np.s_[5:5], np.s_[..., 4], np.s_[1, ..., 2:4]])
+def test_chunked_reads_match_numpy_indexing(stored, key):
+    array, volume = stored
+    np.testing.assert_array_equal(volume[key], array[key])
+
+
+def test_chunked_file_keeps_shape_and_chunks(stored, tmp_path):
+    array, volume = stored
+    assert (volume.shape, volume.chunks, volume.ndim) == ((13, 20, 7), (4, 8, 5), 3)
+    np.testing.assert_array_equal(np.asarray(volume), array)
+    with pytest.raises(IndexError):
+        volume[13]
+    (tmp_path / 'other.bin').write_bytes(b'not a volume')
+    with pytest.raises(ValueError):
+        ChunkedVolume(str(tmp_path / 'other.bin'))
+    assert not (tmp_path / 'volume.bin.tmp').exists()
+
+
+def test_writes_are_copied_before_returning(tmp_path):
+    volume = np.arange(4 * 6 * 5, dtype=np.float64).reshape(4, 6, 5)
+    expected = volume.astype(np.float32)
+    trace = Trace()
+    with ResultWriter(threads=2, max_pending=2, trace=trace) as writer:
+        futures = [writer.write_volume(str(tmp_path / 'v{}.bin'.format(k)), volume, chunks=3) for k in range(4)]
+        volume[:] = -1
+    assert all(future.done() for future in futures)
+    for k in range(4):
+        np.testing.assert_array_equal(np.asarray(ChunkedVolume(str(tmp_path / 'v{}.bin'.format(k)))), expected)
+    assert [record['stage'] for record in trace.records] == ['write'] * 4
+
+
+def test_slices_and_views_share_the_window_of_the_volume(tmp_path):
+    volume = np.linspace(-1, 3, 3 * 4 * 5, dtype=np.float32).reshape(3, 4, 5)
+    with ResultWriter(threads=2) as writer:
+        writer.write_slices(str(tmp_path / 'slices'), volume, axis=2, pattern='s{}.png', transpose=True)
+        writer.write_views(str(tmp_path / 'views'), volume)
+    scaled = np.rint((volume + 1) * 255 / 4).astype(np.uint8)
+    for k in range(5):
+        np.testing.assert_array_equal(imread(str(tmp_path / 'slices' / 's{}.png'.format(k))), scaled[:, :, k].T)
+    for axis in range(3):
+        view = imread(str(tmp_path / 'views' / 'view_axis{}.png'.format(axis)))
+        np.testing.assert_array_equal(view, np.take(scaled, volume.shape[axis] // 2, axis=axis))
+
+
+def test_pending_writes_are_bounded_and_errors_raised(tmp_path):
+    release, running = threading.Event(), []
+    writer = ResultWriter(threads=1, max_pending=2)
+    blocked = lambda: running.append(1) or release.wait()
+    writer._submit(0, blocked)
+    writer._submit(0, blocked)
+    third = threading.Thread(target=writer._submit, args=(0, blocked))
+    third.start()
+    third.join(0.2)
+    # the third task waits for a free slot
+    assert third.is_alive()
+    release.set()
+    third.join(5)
+    writer.flush()
+    assert len(running) == 3
+    writer.write_volume(str(tmp_path / 'missing' / 'volume.bin'), np.zeros((2, 2)))
+    with pytest.raises(OSError):
+        writer.close()
@@ -0,0 +1,79 @@
+import os
+from functools import partial
+import numpy as np
+import pytest
+from imageio import imwrite
+from sample_store import pack_images, open_store, batches, read_index, write_index
+from process_data_leuven import select_slices, resize_slice, preprocess
+
+
+def images(folder, count, shape=(12, 10)):
+    folder.mkdir(parents=True, exist_ok=True)
+    files = []
+    for k in range(count):
+        files.append(str(folder / 'image{:02d}.tif'.format(k)))
+        imwrite(files[-1], np.random.default_rng(k).random(shape).astype(np.float32))
+    return files
+
+
+def flip(image):
+    return image[::-1].copy()
+
+
+@pytest.mark.parametrize('workers, chunk', [(1, 32), (2, 3)])
+def test_rows_do_not_depend_on_the_workers(tmp_path, workers, chunk):
+    files = images(tmp_path / 'src', 7)
+    path = pack_images(files, str(tmp_path / 'store.npy'), (12, 10), transform=flip, workers=workers, chunk=chunk)
+    store, index = open_store(path)
+    assert store.shape == (7, 12, 10) and store.dtype == np.float32
+    for k, row in enumerate(index):
+        assert row == {'row': str(k), 'name': 'image{:02d}.tif'.format(k)}
+        np.testing.assert_array_equal(store[k], flip(np.random.default_rng(k).random((12, 10)).astype(np.float32)))
+    assert not os.path.exists(path + '.tmp')
+    assert [len(batch) for batch, _ in batches(path, 3)] == [3, 3, 1]
+    batch, rows = list(batches(path, 3))[1]
+    assert isinstance(batch, np.memmap) and [row['row'] for row in rows] == ['3', '4', '5']
+
+
+def test_index_and_store_must_match(tmp_path):
+    files = images(tmp_path / 'src', 3)
+    with pytest.raises(ValueError):
+        pack_images(files, str(tmp_path / 'store.npy'), (12, 10), rows=[{'name': 'a'}], workers=1)
+    path = pack_images(files, str(tmp_path / 'store.npy'), (12, 10), workers=1)
+    write_index(path, [{'name': 'a', 'label': 'defect'}, {'name': 'b', 'extra': 1}])
+    assert read_index(path)[1] == {'row': '1', 'name': 'b', 'label': '', 'extra': '1'}
+    with pytest.raises(ValueError):
+        open_store(path)
+
+
+def samples(root, names, n_slices=12):
+    for name in names:
+        merge = root / name / 'stacked0' / 'merge'
+        images(merge, n_slices, shape=(20, 16))
+    return str(root)
+
+
+def test_slice_draws_depend_on_the_seed_and_the_sample_only(tmp_path):
+    samples(tmp_path / 'a', ['sample1', 'sample2'])
+    samples(tmp_path / 'b', ['sample1'])
+    draw = partial(select_slices, sampling=4, first=2, last=10)
+    first = draw(str(tmp_path / 'a' / 'sample1'), seed=0)
+    assert len(first) == len(set(first)) == 4
+    assert all(2 <= int(os.path.basename(name)[5:7]) < 10 for name in first)
+    same = draw(str(tmp_path / 'b' / 'sample1'), seed=0)
+    assert [os.path.basename(name) for name in same] == [os.path.basename(name) for name in first]
+    assert draw(str(tmp_path / 'a' / 'sample1'), seed=1) != first
+    assert draw(str(tmp_path / 'a' / 'sample2'), seed=0) != [name.replace('sample1', 'sample2') for name in first]
+
+
+def test_preprocessing_is_reproducible(tmp_path):
+    sources = {'defect': samples(tmp_path / 'defect', ['s1', 's2']), 'health': samples(tmp_path / 'health', ['s3'])}
+    one = preprocess(sources, str(tmp_path / 'one.npy'), sampling=3, size=(8, 8), first=0, last=12, workers=1)
+    two = preprocess(sources, str(tmp_path / 'two.npy'), sampling=3, size=(8, 8), first=0, last=12, workers=2)
+    (store, index), (other, other_index) = open_store(one), open_store(two)
+    np.testing.assert_array_equal(store, other)
+    assert index == other_index and len(index) == 9
+    assert [row['label'] for row in index] == ['defect'] * 6 + ['health'] * 3
+    assert index[4]['name'] == 'defect_sample_1_slice_1' and index[4]['sample'] == 's2'
+    image = np.random.default_rng(int(index[4]['slice'][5:7])).random((20, 16)).astype(np.float32)
+    np.testing.assert_allclose(store[4], resize_slice(image, (8, 8)), rtol=1e-5)
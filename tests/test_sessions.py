@@ -0,0 +1,33 @@
+import inspect
+import numpy as np
+from object_continuous_inline_scan_setup_3D import InlineContinuousScanningObject3D
+
+
+def scanning_object():
+    return InlineContinuousScanningObject3D(alpha_param=40, n_cells_param=96, n_proj_param=40,
+                                            rec_size_param=(48, 48, 8), backend='cpu')
+
+
+def phantoms():
+    first = np.zeros((8, 48, 48), dtype=np.float32)
+    first[2:6, 8:40, 4:44] = 1
+    second = np.zeros_like(first)
+    second[3:5, 16:32, 10:30] = 2
+    return first, second
+
+
+def test_session_reuse_matches_fresh_sessions():
+    scan = scanning_object()
+    with scan.session(n_iterations_param=5) as session:
+        reused = [session.run(phantom)['rec'] for phantom in phantoms()]
+    for phantom, rec in zip(phantoms(), reused):
+        with scan.session(n_iterations_param=5) as session:
+            np.testing.assert_allclose(rec, session.run(phantom)['rec'], rtol=1e-5, atol=1e-6)
+
+
+def test_run_signature_is_documented():
+    signature = inspect.signature(InlineContinuousScanningObject3D.run)
+    parameters = list(signature.parameters.values())[1:]
+    assert "run({})".format(", ".join(str(p) for p in parameters)) in InlineContinuousScanningObject3D.__doc__
+    for parameter in parameters:
+        assert ":param {}:".format(parameter.name) in InlineContinuousScanningObject3D.run.__doc__
@@ -0,0 +1,68 @@
+import os
+import numpy as np
+import pytest
+from sweep import SweepScheduler, read_index
+from object_scan_inline_setup_2D import InlineScanningObject
+
+FIXED = dict(alpha_param=60, n_cells_param=80, rec_size_param=48, omega_rotation=0, backend='cpu')
+GRID = {'n_proj_param': [5, 7], 'n_iterations_param': [2, 4]}
+
+
+def phantom():
+    image = np.zeros((48, 48), dtype=np.float32)
+    image[12:36, 8:40] = 1
+    return image
+
+
+def rmse(reference, output):
+    return {'rmse': np.sqrt(np.mean((output['rec'] - reference) ** 2))}
+
+
+def keep_seven(setup):
+    n_proj = len(setup.proj_geom['Vectors'])
+    return {'n_proj': n_proj, 'keep': n_proj == 7}
+
+
+def test_unknown_parameters_are_rejected():
+    with pytest.raises(ValueError):
+        SweepScheduler(InlineScanningObject, {'n_proj_param': [5], 'views_param': [2]}, FIXED)
+
+
+def test_jobs_match_single_runs_and_resume(tmp_path):
+    np.save(str(tmp_path / 'square.npy'), phantom())
+    phantoms = {'square': str(tmp_path / 'square.npy'), 'shifted': np.roll(phantom(), 4, axis=1)}
+    scheduler = SweepScheduler(InlineScanningObject, GRID, FIXED, workers=2, save_sino=True, metrics=rmse)
+    rows = scheduler.run(phantoms, str(tmp_path / 'sweep'))
+    assert len(rows) == 8 and len({row['job'] for row in rows}) == 8
+    assert [(row['phantom'], row['n_proj_param'], row['n_iterations_param']) for row in rows[:4]] == [
+        ('square', 5, 2), ('square', 5, 4), ('square', 7, 2), ('square', 7, 4)]
+
+    for row in rows:
+        folder = tmp_path / 'sweep' / row['job']
+        image = np.load(phantoms[row['phantom']]) if isinstance(phantoms[row['phantom']], str) else \
+            phantoms[row['phantom']]
+        scan = InlineScanningObject(n_proj_param=row['n_proj_param'], **FIXED)
+        with scan.session(n_iterations_param=row['n_iterations_param']) as session:
+            expected = session.run(image)
+        np.testing.assert_allclose(np.load(str(folder / 'rec.npy')), expected['rec'], rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(np.load(str(folder / 'sino.npy')), expected['sino'], rtol=1e-6)
+        assert row['rmse'] == pytest.approx(rmse(image, expected)['rmse'], rel=1e-4)
+        assert row['iterations'] == row['n_iterations_param'] and not row['pruned']
+
+    # the finished jobs are not run again
+    marks = {row['job']: os.path.getmtime(str(tmp_path / 'sweep' / row['job'] / 'result.json')) for row in rows}
+    again = SweepScheduler(InlineScanningObject, GRID, FIXED, metrics=rmse).run(phantoms, str(tmp_path / 'sweep'))
+    assert [row['job'] for row in again] == list(marks)
+    assert all(os.path.getmtime(str(tmp_path / 'sweep' / job / 'result.json')) == mark for job, mark in marks.items())
+    assert len(read_index(str(tmp_path / 'sweep'))) == 8
+
+
+def test_screened_geometries_are_pruned(tmp_path):
+    rows = SweepScheduler(InlineScanningObject, GRID, FIXED, screen=keep_seven).run({'square': phantom()},
+                                                                                  str(tmp_path / 'sweep'))
+    assert [row['pruned'] for row in rows] == [True, True, False, False]
+    assert [row['n_proj'] for row in rows] == [5, 5, 7, 7]
+    assert not os.path.exists(str(tmp_path / 'sweep' / rows[0]['job'] / 'rec.npy'))
+    assert rows[0]['time'] is None and rows[2]['time'] > 0
+    index = read_index(str(tmp_path / 'sweep'))
+    assert [row['pruned'] for row in index] == ['True', 'True', 'False', 'False']
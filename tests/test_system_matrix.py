@@ -0,0 +1,40 @@
+import os
+import numpy as np
+from system_matrix import SparseOperator, load_system_matrix, CACHE_DIR, CACHE_ROOT
+from iterative_solvers import CPUOperator
+from projector_backend import create_vol_geom, create_proj_geom
+from inline_setup_2D import InlineScanningSetup2D
+
+
+def geometry(n_proj=5, cells=64):
+    setup = InlineScanningSetup2D(alpha=60, detector_cells=cells, number_of_projections=n_proj, object_size=32,
+                                  omega_total=0)
+    return create_proj_geom('fanflat_vec', cells, setup.get_geometry_matrix()), create_vol_geom(32, 32)
+
+
+def test_cache_is_not_relative_to_the_working_directory():
+    assert os.path.isabs(CACHE_ROOT) and CACHE_DIR.startswith(CACHE_ROOT)
+
+
+def test_matrix_is_built_once_per_geometry(tmp_path):
+    cache_dir = str(tmp_path)
+    first = load_system_matrix(*geometry(), cache_dir=cache_dir)
+    (name,) = os.listdir(cache_dir)
+    os.utime(os.path.join(cache_dir, name), (1e9, 1e9))
+    again = load_system_matrix(*geometry(), cache_dir=cache_dir)
+    assert os.path.getmtime(os.path.join(cache_dir, name)) == 1e9
+    assert (first != again).nnz == 0
+    # any change of the geometry or of the sampling step gets its own matrix
+    load_system_matrix(*geometry(n_proj=6), cache_dir=cache_dir)
+    load_system_matrix(*geometry(cells=48), cache_dir=cache_dir)
+    load_system_matrix(*geometry(), cache_dir=cache_dir, step=0.25)
+    assert len(os.listdir(cache_dir)) == 4
+
+
+def test_cached_matrix_matches_the_projector(tmp_path):
+    proj_geom, vol_geom = geometry()
+    SparseOperator(proj_geom, vol_geom, cache_dir=str(tmp_path))
+    operator = SparseOperator(proj_geom, vol_geom, cache_dir=str(tmp_path))
+    x = np.random.default_rng(0).random((32, 32), dtype=np.float32)
+    np.testing.assert_allclose(operator.forward(x), CPUOperator(proj_geom, vol_geom, use_numba=False).forward(x),
+                               rtol=1e-5, atol=1e-5)
@@ -0,0 +1,103 @@
+import csv
+import json
+import threading
+import numpy as np
+from instrumentation import Trace, NULL_TRACE, STAGES, nbytes
+from projector_backend import create_backend, create_vol_geom, create_proj_geom
+from inline_setup_2D import InlineScanningSetup2D
+from object_continuous_inline_scan_setup_3D import InlineContinuousScanningObject3D
+
+
+def test_stages_are_totalled_in_pipeline_order():
+    trace = Trace()
+    with trace.stage('iterations', algorithm='SIRT'):
+        pass
+    mark = trace.mark()
+    for name in ('write', 'forward', 'forward'):
+        with trace.stage(name, 10) as record:
+            record['bytes'] += 1
+    assert list(trace.summary()) == ['forward', 'iterations', 'write']
+    summary = trace.summary(mark)
+    assert list(summary) == ['forward', 'write']
+    assert summary['forward']['count'] == 2 and summary['forward']['bytes'] == 22
+    assert trace.records[0]['algorithm'] == 'SIRT'
+    assert all(record['wall'] >= 0 and record['cpu'] >= 0 for record in trace.records)
+    assert set(STAGES) >= {record['stage'] for record in trace.records}
+
+
+def test_callbacks_run_every_few_iterations():
+    trace = Trace(every=3)
+    calls = []
+    trace.add_callback(lambda iteration, x, residual: calls.append((iteration, residual)))
+    setup = InlineScanningSetup2D(alpha=60, detector_cells=80, number_of_projections=7, object_size=48, omega_total=0)
+    backend = create_backend('cpu', create_proj_geom('fanflat_vec', 80, setup.get_geometry_matrix()),
+                             create_vol_geom(48, 48))
+    with backend.session('SIRT_CUDA', 7, trace=trace) as session:
+        output = session.run(np.ones((48, 48), dtype=np.float32))
+    assert trace.wants_iterations() and output['iterations'] == 7
+    assert [entry['iteration'] for entry in trace.iterations] == list(range(1, 8))
+    assert [iteration for iteration, _ in calls] == [3, 6]
+    assert calls[1][1] == trace.iterations[5]['residual'] < trace.iterations[0]['residual']
+
+
+def test_records_of_threads_are_kept(tmp_path):
+    trace = Trace(log_iterations=False)
+
+    def work(k):
+        for _ in range(50):
+            with trace.stage('forward', k):
+                pass
+            trace.iteration(1)
+
+    threads = [threading.Thread(target=work, args=(k,)) for k in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert trace.summary()['forward'] == dict(trace.summary()['forward'], count=200, bytes=50 * 6)
+    assert trace.iterations == []
+    trace.to_csv(str(tmp_path / 'trace.csv'))
+    with open(str(tmp_path / 'trace.csv'), newline='') as file:
+        rows = list(csv.DictReader(file))
+    assert len(rows) == 200 and list(rows[0])[:5] == ['stage', 'start', 'wall', 'cpu', 'bytes']
+
+
+def test_null_trace_records_nothing():
+    assert not NULL_TRACE and not NULL_TRACE.wants_iterations() and NULL_TRACE.mark() == 0
+    with NULL_TRACE.stage('forward', 10) as record:
+        record['bytes'] = 1
+    assert nbytes(np.zeros(4, dtype=np.float32)) == 16 and nbytes(7) == 0
+
+
+def traced_run(trace):
+    scan = InlineContinuousScanningObject3D(alpha_param=30, n_cells_param=128, n_proj_param=4,
+                                            rec_size_param=(64, 64, 10), backend='cpu', supersampling=2, trace=trace)
+    phantom = np.zeros((10, 64, 64), dtype=np.float32)
+    phantom[1:4, 16:48, 16:48] = 1
+    with scan.session(n_iterations_param=4) as session:
+        output = session.run(phantom)
+    return scan, output
+
+
+def test_stages_of_a_scan_are_listed():
+    trace = Trace()
+    traced_run(trace)
+    recorded = [record['stage'] for record in trace.records]
+    assert {'geometry', 'forward', 'iterations', 'download'} <= set(recorded) <= set(STAGES)
+    assert list(trace.summary()) == [name for name in STAGES if name in recorded]
+    assert len(trace.iterations) == 4
+    # the CPU solvers hand their reconstruction over without copying it
+    assert trace.summary()['download']['bytes'] == 0
+
+
+def test_summary_since_a_mark_covers_one_session_run(tmp_path):
+    trace = Trace()
+    scan, _ = traced_run(trace)
+    mark = trace.mark()
+    with scan.session(n_iterations_param=2) as session:
+        session.run(np.ones((10, 64, 64), dtype=np.float32))
+    summary = trace.summary(mark)
+    assert summary['iterations']['count'] == 1 and 'geometry' not in summary
+    trace.to_json(str(tmp_path / 'trace.json'))
+    with open(str(tmp_path / 'trace.json')) as file:
+        assert len(json.load(file)['records']) == len(trace.records) > mark
@@ -0,0 +1,34 @@
+import os
+import numpy as np
+from imageio import imwrite
+from volume_store import load_slices, layout_path
+
+
+def write_stack(folder, n=4, size=4):
+    stack = np.arange(n * size * size, dtype=np.uint8).reshape(n, size, size) * 3
+    os.makedirs(folder)
+    for k, image in enumerate(stack):
+        imwrite(os.path.join(folder, "slice{:04d}.png".format(k)), image)
+    return stack.astype(np.float32)
+
+
+def test_layouts_with_the_same_shape_are_not_confused(tmp_path):
+    stack = write_stack(str(tmp_path / 'slices'))
+    path = str(tmp_path / 'volume.npy')
+    # both layouts of a 4 x 4 x 4 stack have the same shape and number of slices
+    np.testing.assert_array_equal(load_slices(str(tmp_path / 'slices'), path, axes=(2, 1, 0)), stack.transpose(2, 1, 0))
+    np.testing.assert_array_equal(load_slices(str(tmp_path / 'slices'), path, axes=(1, 2, 0)), stack.transpose(1, 2, 0))
+    np.testing.assert_array_equal(load_slices(str(tmp_path / 'slices'), path), stack)
+
+
+def test_matching_volume_is_reused(tmp_path):
+    write_stack(str(tmp_path / 'slices'))
+    path = str(tmp_path / 'volume.npy')
+    load_slices(str(tmp_path / 'slices'), path, axes=(2, 1, 0))
+    os.utime(path, (1e10, 1e10))
+    load_slices(str(tmp_path / 'slices'), path, axes=(2, 1, 0))
+    assert os.path.getmtime(path) == 1e10
+    # a volume whose layout is unknown is converted again
+    os.remove(layout_path(path))
+    load_slices(str(tmp_path / 'slices'), path, axes=(2, 1, 0))
+    assert os.path.getmtime(path) != 1e10 and os.path.isfile(layout_path(path))
@@ -0,0 +1,97 @@
+import os
+import json
+import numpy as np
+from imageio import imread
+
+
+def convert_slices(src, path, dtype=np.float32, axes=None):
+    """
+    It converts a directory of 2D slice images into a single .npy volume of shape (n_slices, height, width), writing one
+    slice at a time into a memory-mapped file so that the whole volume is never held in memory.
+    :param src: directory with the slice images; they are stacked in the sorted order of their file names;
+    :param path: name of the .npy file to be written;
+    :param dtype: data type stored in the file;
+    :param axes: optional permutation of the axes (as in np.transpose) applied to the stack before it is stored, so
+    that the file holds the volume in the layout it is used in; it is recorded next to path (see layout_path);
+    :return: path.
+    """
+    names = sorted(os.listdir(src))
+    if not names:
+        raise ValueError("No slices found in '{}'".format(src))
+    first = imread(os.path.join(src, names[0]))
+    shape = (len(names),) + first.shape
+    axes = tuple(range(len(shape))) if axes is None else tuple(axes)
+
+    volume = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=dtype, shape=tuple(shape[a] for a in axes))
+    try:
+        # view of the stored volume in the order of the slices
+        stack = volume.transpose(np.argsort(axes))
+        stack[0] = first
+        for k, name in enumerate(names[1:], 1):
+            stack[k] = imread(os.path.join(src, name))
+        del stack
+        volume.flush()
+    finally:
+        del volume
+    os.replace(path + '.tmp', path)
+    # written after the volume: a volume without its layout is converted again
+    with open(layout_path(path) + '.tmp', 'w') as file:
+        json.dump({'axes': list(axes), 'slices': len(names)}, file)
+    os.replace(layout_path(path) + '.tmp', layout_path(path))
+    return path
+
+
+def layout_path(path):
+    """
+    It returns the name of the file (a .json file) recording the layout of the volume path: the permutation of the axes
+    of the stack that convert_slices() applied and the number of slices.
+    """
+    return os.path.splitext(path)[0] + '.json'
+
+
+def open_volume(path, axes=None, mode='r'):
+    """
+    It opens a .npy volume as a memory map, so only the parts that are touched are read from disk.
+    :param path: name of the .npy file;
+    :param axes: optional permutation of the stored axes (as in np.transpose); the result is a view and nothing is
+    copied, but it is not C-contiguous, as the projectors require (see load_slices);
+    :param mode: mmap_mode of np.load ('r' read-only, 'r+' read-write, 'c' copy-on-write);
+    :return: the memory-mapped volume.
+    """
+    volume = np.load(path, mmap_mode=mode)
+    return volume if axes is None else volume.transpose(axes)
+
+
+def load_slices(src, path, axes=None, dtype=np.float32):
+    """
+    It opens the volume stored in a directory of slice images, converting it into path the first time (or whenever a
+    slice is newer than path) and memory-mapping path on later runs.
+    The volume has shape (n_slices, height, width): slice k is volume[k]. Use axes to obtain other layouts, e.g.
+    axes=(2, 1, 0) gives the volume v[:, :, k] = transpose(slice k) and axes=(1, 2, 0) gives v[:, :, k] = slice k.
+    The file holds the volume in the requested layout and dtype, so the memory map is C-contiguous and can be linked
+    to the projectors without any copy; the volume is converted again when it was stored with other axes, so use a
+    different path for every layout to keep them all.
+    :param src: directory with the slice images;
+    :param path: name of the .npy file caching the volume;
+    :param axes: optional permutation of the axes of the stack;
+    :param dtype: data type stored in the file;
+    :return: the memory-mapped volume.
+    """
+    if not os.path.isfile(path) or _newest(src) > os.path.getmtime(path) or not _matches(path, src, axes, dtype):
+        convert_slices(src, path, dtype, axes)
+    return open_volume(path)
+
+
+def _matches(path, src, axes, dtype):
+    if not os.path.isfile(layout_path(path)):
+        return False
+    with open(layout_path(path)) as file:
+        layout = json.load(file)
+    stored = np.load(path, mmap_mode='r')
+    axes = list(range(stored.ndim)) if axes is None else list(axes)
+    return (stored.dtype == dtype and layout['axes'] == axes and layout['slices'] == len(os.listdir(src))
+            and stored.shape[axes.index(0)] == layout['slices'])
+
+
+def _newest(src):
+    return max([os.path.getmtime(src)] + [os.path.getmtime(os.path.join(src, name)) for name in os.listdir(src)])